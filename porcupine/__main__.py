@@ -150,9 +150,9 @@ def main() -> None:
             #   ^D
             #   bla bla
             #   ^D
-            tab = tabs.FileTab(tabmanager, content=sys.stdin.read())
+            tab: tabs.Tab = tabs.FileTab(tabmanager, content=sys.stdin.read())
         else:
-            tab = tabs.FileTab.open_file(tabmanager, pathlib.Path(path_string))
+            tab = tabs.open_path(tabmanager, pathlib.Path(path_string))
         tabmanager.add_tab(tab)
 
     get_main_window().deiconify()
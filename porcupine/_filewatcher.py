@@ -0,0 +1,206 @@
+"""Find out when other programs change files, without checking them on the main thread.
+
+On Linux, this uses inotify through ctypes. Elsewhere (or if inotify doesn't
+work), the files are checked with stat() every second in a separate thread.
+"""
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import pathlib
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, Optional, Set, Tuple, Union
+
+log = logging.getLogger(__name__)
+
+# Callback runs when no changes have happened for this long, so that e.g.
+# 'git checkout' causes only one callback even if it changes many files.
+DEBOUNCE_SECONDS = 0.2
+# Callback runs at least this often when files keep changing all the time
+MAX_DELAY_SECONDS = 2
+POLL_INTERVAL_SECONDS = 1
+
+# From <sys/inotify.h>
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _InotifyBackend:
+    def __init__(self) -> None:
+        libc_name = ctypes.util.find_library("c")
+        if sys.platform != "linux" or libc_name is None:
+            raise OSError("inotify is available only on Linux")
+
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd == -1:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        # Editors and git often replace files instead of writing to them, so
+        # directories must be watched instead of files
+        self._paths: FrozenSet[pathlib.Path] = frozenset()
+        self._watch_descriptors: Dict[pathlib.Path, int] = {}
+        self._directories: Dict[int, pathlib.Path] = {}
+
+    def set_paths(self, paths: FrozenSet[pathlib.Path]) -> None:
+        if paths == self._paths:
+            return
+        self._paths = paths
+
+        directories = {path.parent for path in paths}
+        for directory in self._watch_descriptors.keys() - directories:
+            wd = self._watch_descriptors.pop(directory)
+            del self._directories[wd]
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+        mask = (
+            _IN_MODIFY
+            | _IN_ATTRIB
+            | _IN_CLOSE_WRITE
+            | _IN_MOVED_FROM
+            | _IN_MOVED_TO
+            | _IN_CREATE
+            | _IN_DELETE
+        )
+        for directory in directories - self._watch_descriptors.keys():
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), mask)
+            if wd == -1:
+                log.warning(f"can't watch '{directory}': {os.strerror(ctypes.get_errno())}")
+            else:
+                self._watch_descriptors[directory] = wd
+                self._directories[wd] = directory
+
+    def wait(self, timeout: float) -> None:
+        select.select([self._fd], [], [], timeout)
+
+    def get_changes(self) -> Set[pathlib.Path]:
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        result: Set[pathlib.Path] = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, name_length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset : offset + name_length].rstrip(b"\0")
+            offset += name_length
+
+            if mask & _IN_Q_OVERFLOW:
+                log.info("too many inotify events, assuming that all files changed")
+                result.update(self._paths)
+            elif mask & _IN_IGNORED:
+                # Directory was deleted
+                directory = self._directories.pop(wd, None)
+                if directory is not None:
+                    del self._watch_descriptors[directory]
+            elif wd in self._directories:
+                path = self._directories[wd] / os.fsdecode(name)
+                if path in self._paths:
+                    result.add(path)
+        return result
+
+
+class _PollingBackend:
+    def __init__(self) -> None:
+        self._paths: FrozenSet[pathlib.Path] = frozenset()
+        self._stats: Dict[pathlib.Path, Optional[Tuple[int, int, int]]] = {}
+        self._last_poll = time.monotonic()
+
+    def set_paths(self, paths: FrozenSet[pathlib.Path]) -> None:
+        if paths != self._paths:
+            self._paths = paths
+            self._stats = {path: self._stat(path) for path in paths}
+
+    def _stat(self, path: pathlib.Path) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat_result = path.stat()
+        except OSError:
+            return None
+        return (stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino)
+
+    def wait(self, timeout: float) -> None:
+        time.sleep(min(timeout, POLL_INTERVAL_SECONDS))
+
+    def get_changes(self) -> Set[pathlib.Path]:
+        if time.monotonic() - self._last_poll < POLL_INTERVAL_SECONDS:
+            return set()
+        self._last_poll = time.monotonic()
+
+        result: Set[pathlib.Path] = set()
+        for path, old_stat in self._stats.items():
+            new_stat = self._stat(path)
+            if new_stat != old_stat:
+                self._stats[path] = new_stat
+                result.add(path)
+        return result
+
+
+class FileWatcher:
+    """Call ``callback(changed_paths)`` when some of the watched files change.
+
+    The callback runs in a separate thread, so it must not do anything with
+    Tkinter. Paths must be absolute.
+    """
+
+    def __init__(self, callback: Callable[[Set[pathlib.Path]], None]) -> None:
+        self._callback = callback
+        self._lock = threading.Lock()
+
+        self._backend: Union[_InotifyBackend, _PollingBackend]
+        try:
+            self._backend = _InotifyBackend()
+        except (OSError, AttributeError):  # AttributeError if libc has no inotify functions
+            log.info("inotify not available, checking files with stat() instead", exc_info=True)
+            self._backend = _PollingBackend()
+
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def set_paths(self, paths: Set[pathlib.Path]) -> None:
+        """Watch the given files, and stop watching all other files."""
+        # Not done in the watcher thread, because it could miss changes
+        # that happen soon after this is called
+        with self._lock:
+            self._backend.set_paths(frozenset(paths))
+
+    def _run(self) -> None:
+        pending: Set[pathlib.Path] = set()
+        first_change_time = last_change_time = 0.0
+
+        while True:
+            self._backend.wait(DEBOUNCE_SECONDS if pending else 1)
+            with self._lock:
+                changed = self._backend.get_changes()
+
+            now = time.monotonic()
+            if changed:
+                if not pending:
+                    first_change_time = now
+                last_change_time = now
+                pending |= changed
+
+            if pending and (
+                now - last_change_time >= DEBOUNCE_SECONDS
+                or now - first_change_time >= MAX_DELAY_SECONDS
+            ):
+                try:
+                    self._callback(pending)
+                except Exception:
+                    log.exception("file watcher callback failed")
+                pending = set()
@@ -0,0 +1,197 @@
+"""Lists of lines that can be changed and searched without looping over all lines.
+
+The lines are stored in chunks of a few hundred lines. Chunks are leaves of
+segment trees, so finding the chunk that contains a line (or a character
+offset) is O(log n), and so is updating a chunk.
+"""
+from __future__ import annotations
+
+import itertools
+from typing import Callable, Generic, List, Set, Tuple, TypeVar
+
+_flatten = itertools.chain.from_iterable
+_T = TypeVar("_T")
+_V = TypeVar("_V")
+
+LINES_PER_CHUNK = 256
+
+
+class _SegmentTree(Generic[_V]):
+    # Leaves are at the end of the list, and node i has children 2i and 2i+1
+    def __init__(self, combine: Callable[[_V, _V], _V], empty: _V) -> None:
+        self._combine = combine
+        self.empty = empty
+        self.leaf_count = 0
+        self.nodes: List[_V] = []
+
+    def reset(self, values: List[_V]) -> None:
+        self.leaf_count = 1
+        while self.leaf_count < len(values):
+            self.leaf_count *= 2
+        self.nodes = [self.empty] * (2 * self.leaf_count)
+        self.nodes[self.leaf_count : self.leaf_count + len(values)] = values
+        for node in reversed(range(1, self.leaf_count)):
+            self.nodes[node] = self._combine(self.nodes[2 * node], self.nodes[2 * node + 1])
+
+    def set(self, index: int, value: _V) -> None:
+        node = self.leaf_count + index
+        self.nodes[node] = value
+        node //= 2
+        while node != 0:
+            self.nodes[node] = self._combine(self.nodes[2 * node], self.nodes[2 * node + 1])
+            node //= 2
+
+    def get_root(self) -> _V:
+        return self.nodes[1]
+
+
+class _SumTree(_SegmentTree[int]):
+    def __init__(self) -> None:
+        super().__init__(int.__add__, 0)
+
+    # Returns (leaf index, sum of everything before the leaf)
+    def find(self, target: int) -> Tuple[int, int]:
+        node = 1
+        before = 0
+        while node < self.leaf_count:
+            left_sum = self.nodes[2 * node]
+            if target < before + left_sum:
+                node = 2 * node
+            else:
+                before += left_sum
+                node = 2 * node + 1
+        return (node - self.leaf_count, before)
+
+    def sum_before(self, index: int) -> int:
+        result = 0
+        node = self.leaf_count + index
+        while node != 1:
+            if node % 2 == 1:
+                result += self.nodes[node - 1]
+            node //= 2
+        return result
+
+
+class ChunkedLines(Generic[_T, _V]):
+    """A list of lines, with a summary value for each chunk of lines.
+
+    The summary of a chunk is calculated with *summarize*. Summaries of
+    adjacent chunks are combined with *combine*, and *empty* must be a value
+    that *combine* doesn't change. Summaries are calculated lazily, so the
+    lines can contain placeholders until :meth:`update_summaries` is called.
+    """
+
+    def __init__(
+        self,
+        lines: List[_T],
+        summarize: Callable[[List[_T]], _V],
+        combine: Callable[[_V, _V], _V],
+        empty: _V,
+    ) -> None:
+        self._summarize = summarize
+        self.chunks: List[List[_T]] = []
+        # Summaries of these chunks are out of date
+        self.changed_chunks: Set[int] = set()
+        self._line_counts = _SumTree()
+        self._summaries = self._create_summary_tree(combine, empty)
+        self._replace_chunks(0, 0, lines)
+
+    def _create_summary_tree(self, combine: Callable[[_V, _V], _V], empty: _V) -> _SegmentTree[_V]:
+        return _SegmentTree(combine, empty)
+
+    def __len__(self) -> int:
+        return self._line_counts.get_root()
+
+    def __getitem__(self, line_index: int) -> _T:
+        if not 0 <= line_index < len(self):
+            raise IndexError(line_index)
+        chunk_index, chunk_start = self.find_chunk(line_index)
+        return self.chunks[chunk_index][line_index - chunk_start]
+
+    def _replace_chunks(self, start: int, end: int, lines: List[_T]) -> None:
+        new_chunks = [lines[i : i + LINES_PER_CHUNK] for i in range(0, len(lines), LINES_PER_CHUNK)]
+        shift = len(new_chunks) - (end - start)
+        if shift == 0 and self.chunks:
+            # Usually lines just move between neighbouring chunks
+            self.chunks[start:end] = new_chunks
+            for index, chunk in enumerate(new_chunks, start=start):
+                self._line_counts.set(index, len(chunk))
+            self.changed_chunks.update(range(start, end))
+            return
+
+        # Summaries of other chunks are kept, because they can be slow to calculate
+        leaf_count = self._summaries.leaf_count
+        summaries = self._summaries.nodes[leaf_count : leaf_count + len(self.chunks)]
+        summaries[start:end] = [self._summaries.empty] * len(new_chunks)
+        self.changed_chunks = {
+            index if index < start else index + shift
+            for index in self.changed_chunks
+            if not start <= index < end
+        }
+        self.changed_chunks.update(range(start, start + len(new_chunks)))
+
+        self.chunks[start:end] = new_chunks
+        self._line_counts.reset([len(chunk) for chunk in self.chunks])
+        self._summaries.reset(summaries)
+
+    def find_chunk(self, line_index: int) -> Tuple[int, int]:
+        """Return (chunk index, line index of first line in chunk)."""
+        return self._line_counts.find(line_index)
+
+    def find_chunk_start(self, chunk_index: int) -> int:
+        return self._line_counts.sum_before(chunk_index)
+
+    def replace_lines(self, start: int, end: int, new_lines: List[_T]) -> None:
+        """Like ``lines[start:end] = new_lines``, but *end* must be greater than *start*."""
+        first_chunk, first_chunk_start = self.find_chunk(start)
+        last_chunk, last_chunk_start = self.find_chunk(end - 1)
+
+        lines = list(_flatten(self.chunks[first_chunk : last_chunk + 1]))
+        lines[start - first_chunk_start : end - first_chunk_start] = new_lines
+
+        if (
+            first_chunk == last_chunk
+            and len(lines) <= 2 * LINES_PER_CHUNK
+            and (len(lines) >= LINES_PER_CHUNK // 2 or last_chunk == len(self.chunks) - 1)
+        ):
+            # Usual case, e.g. typing a character
+            self.chunks[first_chunk] = lines
+            self.changed_chunks.add(first_chunk)
+            self._line_counts.set(first_chunk, len(lines))
+        else:
+            # Don't leave behind tiny chunks
+            if len(lines) < LINES_PER_CHUNK // 2 and last_chunk + 1 < len(self.chunks):
+                last_chunk += 1
+                lines.extend(self.chunks[last_chunk])
+            self._replace_chunks(first_chunk, last_chunk + 1, lines)
+
+    def update_summaries(self) -> None:
+        for chunk_index in self.changed_chunks:
+            self._summaries.set(chunk_index, self._summarize(self.chunks[chunk_index]))
+        self.changed_chunks.clear()
+
+    def get_summary(self) -> _V:
+        """Return the combined summary of all chunks."""
+        self.update_summaries()
+        return self._summaries.get_root()
+
+
+class SummedLines(ChunkedLines[_T, int]):
+    """Chunked lines whose summary is an integer, e.g. number of characters."""
+
+    _summaries: _SumTree
+
+    def __init__(self, lines: List[_T], summarize: Callable[[List[_T]], int]) -> None:
+        super().__init__(lines, summarize, int.__add__, 0)
+
+    def _create_summary_tree(self, combine: Callable[[int, int], int], empty: int) -> _SumTree:
+        return _SumTree()
+
+    def find_chunk_by_summary(self, target: int) -> Tuple[int, int]:
+        """Return (chunk index, sum of summaries of chunks before it)."""
+        self.update_summaries()
+        return self._summaries.find(target)
+
+    def sum_before(self, chunk_index: int) -> int:
+        self.update_summaries()
+        return self._summaries.sum_before(chunk_index)
@@ -0,0 +1,132 @@
+"""Lines of a memory-mapped file, for viewing files that are too big to edit.
+
+Positions in the file are byte offsets. Nothing is read until it's needed, so
+scrolling to an offset is fast even if the file is many gigabytes. Line numbers
+need an index, which can be built in a separate thread with
+:meth:`MappedLines.build_index`.
+"""
+from __future__ import annotations
+
+import bisect
+import mmap
+import pathlib
+import threading
+from typing import List, Optional, Union
+
+# Index has a checkpoint at the start of each block
+INDEX_BLOCK_SIZE = 1024 * 1024
+# Longer lines are cut when displaying
+MAX_LINE_LENGTH = 10_000
+
+
+class MappedLines:
+    def __init__(self, path: pathlib.Path) -> None:
+        with path.open("rb") as file:
+            self.size = path.stat().st_size
+            # Empty files can't be mapped
+            if self.size == 0:
+                self._data: Union[mmap.mmap, bytes] = b""
+            else:
+                self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # Number of b"\n" bytes before the start of each block
+        self._newlines_before_block: List[int] = []
+        # Set when index is complete
+        self.line_count: Optional[int] = None
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+    def line_start(self, offset: int) -> int:
+        return self._data.rfind(b"\n", 0, offset) + 1
+
+    def next_line(self, offset: int) -> Optional[int]:
+        newline = self._data.find(b"\n", offset)
+        return None if newline == -1 else newline + 1
+
+    def previous_line(self, offset: int) -> Optional[int]:
+        line_start = self.line_start(offset)
+        if line_start == 0:
+            return None
+        return self.line_start(line_start - 1)
+
+    def get_line(self, offset: int) -> bytes:
+        """Return the line starting at *offset*, without the newline character."""
+        end = self._data.find(b"\n", offset, offset + MAX_LINE_LENGTH)
+        if end == -1:
+            end = min(offset + MAX_LINE_LENGTH, self.size)
+        return self._data[offset:end]
+
+    def find(self, needle: bytes, start: int) -> int:
+        """Return offset of *needle*, searching from *start* and wrapping around.
+
+        Returns -1 if *needle* is not in the file.
+        """
+        result = self._data.find(needle, start)
+        if result == -1:
+            # Make sure that a match containing start is not missed
+            result = self._data.find(needle, 0, start + len(needle) - 1)
+        return result
+
+    def build_index(self, cancel_event: threading.Event) -> None:
+        """Count lines of the file. This can be called in a separate thread."""
+        newline_count = 0
+        for block_start in range(0, self.size, INDEX_BLOCK_SIZE):
+            if cancel_event.is_set():
+                return
+            self._newlines_before_block.append(newline_count)
+            try:
+                newline_count += self._data[block_start : block_start + INDEX_BLOCK_SIZE].count(
+                    b"\n"
+                )
+            except ValueError:
+                # closed while indexing
+                return
+        self.line_count = newline_count + 1
+
+    def get_index_progress(self) -> float:
+        if self.line_count is not None:
+            return 1
+        return len(self._newlines_before_block) * INDEX_BLOCK_SIZE / self.size
+
+    def get_lineno(self, offset: int) -> Optional[int]:
+        """Return line number (1-based) of the line containing *offset*.
+
+        Returns None if the index hasn't been built that far yet.
+        """
+        if offset == 0:
+            return 1
+
+        block = offset // INDEX_BLOCK_SIZE
+        if block >= len(self._newlines_before_block):
+            if self.line_count is None:
+                return None
+            # offset == size at end of file
+            block = len(self._newlines_before_block) - 1
+
+        before = self._newlines_before_block[block]
+        return 1 + before + self._data[block * INDEX_BLOCK_SIZE : offset].count(b"\n")
+
+    def find_lineno(self, lineno: int) -> Optional[int]:
+        """Return offset where the given line (1-based) starts.
+
+        Returns None if the line doesn't exist, or the index hasn't been built
+        far enough to know where it is.
+        """
+        if lineno < 1 or (self.line_count is not None and lineno > self.line_count):
+            return None
+        if lineno == 1:
+            return 0
+
+        # Start from the last block that starts before the line
+        newlines_needed = lineno - 1
+        block = bisect.bisect_left(self._newlines_before_block, newlines_needed) - 1
+        if block == len(self._newlines_before_block) - 1 and self.line_count is None:
+            # Line may be in a part of the file that hasn't been indexed yet
+            return None
+
+        offset = block * INDEX_BLOCK_SIZE
+        for i in range(newlines_needed - self._newlines_before_block[block]):
+            offset = self._data.find(b"\n", offset) + 1
+        return offset
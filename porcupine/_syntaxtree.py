@@ -0,0 +1,633 @@
+"""Incremental parsers for syntax highlighting.
+
+Parsing creates a tree of nodes. When the text changes, parsing again reuses
+the nodes of the old tree that the change didn't affect, so that only the
+changed part of the text and the nodes around it are looked at. This is the
+same idea as in tree-sitter, but much simpler: the trees are good enough for
+highlighting and nothing else.
+
+Tokens are named like pygments token types (e.g. "Token.Keyword"), so that
+pygments styles can be used to color them.
+"""
+from __future__ import annotations
+
+import abc
+import builtins
+import keyword
+import re
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Type, Union
+
+# Long sequences of nodes (e.g. statements of a file) are grouped into
+# chunks, so that a chunk far away from a change can be reused as a whole
+CHUNK_SIZE = 64
+# Regexes may peek at a character or two after the end of their match
+_LOOKAHEAD_SLACK = 2
+# How many characters to get at a time from LazyText
+_WINDOW_SIZE = 4096
+# Matching in a part of the text gives the same result as matching in the
+# whole text, if the part continues this far after the match. Regexes don't
+# need that much, but they may look at a few characters of an alternative
+# that doesn't match, such as "true" when the text is "tru".
+_WINDOW_MARGIN = 100
+
+
+class Node:
+    __slots__ = ["kind", "start", "length", "lookahead", "children"]
+
+    def __init__(
+        self, kind: str, start: int, length: int, lookahead: int, children: List[Node]
+    ) -> None:
+        self.kind = kind
+        # Relative to the start of the parent node
+        self.start = start
+        self.length = length
+        # How many characters after the end were looked at when parsing
+        self.lookahead = lookahead
+        self.children = children
+
+
+class Edit(NamedTuple):
+    """Offsets of a change. Text between *start* and *old_end* was replaced
+    with text that is now between *start* and *new_end*.
+    """
+
+    start: int
+    old_end: int
+    new_end: int
+
+
+class LazyText(NamedTuple):
+    """Text that is given to the parser in pieces, as it's needed.
+
+    Usually only a small part of the text is parsed again after a change, and
+    this way the rest of it doesn't need to be joined into one string.
+    """
+
+    length: int
+    # get_text(start, end) returns the text between two offsets
+    get_text: Callable[[int, int], str]
+
+
+class ParseResult(NamedTuple):
+    # (start, end, token type) in the order they appear in the text
+    tokens: List[Tuple[int, int, str]]
+    # (start, end) of parts of the text that were parsed again. Anything
+    # outside these parts is tokenized exactly like it was before.
+    fresh_ranges: List[Tuple[int, int]]
+
+
+# Goes through the old tree from start to end, finding nodes that can be reused
+class _ReuseCursor:
+    def __init__(self, root: Optional[Node], edit: Optional[Edit]) -> None:
+        self._edit = edit
+        # (children, index of next child, absolute start of parent)
+        self._stack: List[Tuple[List[Node], int, int]] = []
+        if root is not None and edit is not None:
+            self._stack.append((root.children, 0, 0))
+
+    def _skip_child(self) -> None:
+        children, index, parent_start = self._stack[-1]
+        self._stack[-1] = (children, index + 1, parent_start)
+
+    def find(self, new_offset: int, kinds: Sequence[str]) -> Optional[Node]:
+        if not self._stack:
+            return None
+
+        edit = self._edit
+        assert edit is not None
+        if new_offset < edit.start:
+            old_offset = new_offset
+            before_edit = True
+        elif new_offset >= edit.new_end:
+            old_offset = new_offset - edit.new_end + edit.old_end
+            before_edit = False
+        else:
+            return None
+
+        while self._stack:
+            children, index, parent_start = self._stack[-1]
+            if index == len(children):
+                self._stack.pop()
+                if self._stack:
+                    self._skip_child()
+                continue
+
+            node = children[index]
+            node_start = parent_start + node.start
+            node_end = node_start + node.length
+            if node_start > old_offset:
+                return None
+            if (
+                node_start == old_offset
+                and node.kind in kinds
+                and (not before_edit or node_end + node.lookahead <= edit.start)
+            ):
+                self._skip_child()
+                return node
+            if node_end <= old_offset or not node.children:
+                self._skip_child()
+            else:
+                # A child node may start at old_offset
+                self._stack.append((node.children, 0, node_start))
+
+        return None
+
+
+# Like re.Match, but offsets are relative to the whole text, not the window
+class _Match:
+    __slots__ = ["_match", "_offset", "lastgroup"]
+
+    def __init__(self, match: re.Match[str], offset: int) -> None:
+        self._match = match
+        self._offset = offset
+        self.lastgroup = match.lastgroup
+
+    def start(self, group: Union[int, str] = 0) -> int:
+        return self._match.start(group) + self._offset
+
+    def end(self, group: Union[int, str] = 0) -> int:
+        return self._match.end(group) + self._offset
+
+    def group(self, group: Union[int, str] = 0) -> str:
+        return self._match.group(group)
+
+
+class Parser(abc.ABC):
+    """Base class for incremental parsers of different languages.
+
+    Subclasses implement :meth:`_parse_document`, usually with
+    :meth:`_sequence`, :meth:`_node` and :meth:`_token`.
+    """
+
+    def __init__(self) -> None:
+        self._tree: Optional[Node] = None
+        # These are used only while parsing
+        self._length = 0
+        self._lazy_text: Optional[LazyText] = None
+        # The part of the text that regexes are matched against
+        self._window = ""
+        self._window_start = 0
+        self._examined_end = 0
+        self._cursor = _ReuseCursor(None, None)
+        self._tokens: List[Tuple[int, int, str]] = []
+        self._reused: List[Tuple[int, int]] = []
+
+    def parse(self, text: Union[str, LazyText], edit: Optional[Edit] = None) -> ParseResult:
+        """Parse *text*, reusing the result of the previous call.
+
+        The *edit* says how the text changed since the previous call. If it
+        isn't given, everything is parsed from scratch.
+        """
+        if isinstance(text, LazyText):
+            self._length = text.length
+            self._lazy_text = text
+            self._window = ""
+        else:
+            self._length = len(text)
+            self._lazy_text = None
+            self._window = text
+        self._window_start = 0
+        self._examined_end = 0
+        self._cursor = _ReuseCursor(self._tree, edit)
+        self._tokens = []
+        self._reused = []
+
+        children = self._parse_document()
+        self._tree = Node("document", 0, self._length, 0, children)
+        result = ParseResult(self._tokens, self._get_fresh_ranges())
+
+        self._lazy_text = None
+        self._window = ""
+        self._tokens = []
+        self._reused = []
+        return result
+
+    def _get_fresh_ranges(self) -> List[Tuple[int, int]]:
+        result = []
+        position = 0
+        for start, end in self._reused:
+            if start > position:
+                result.append((position, start))
+            position = end
+        if position < self._length or not result:
+            result.append((position, self._length))
+        return result
+
+    @abc.abstractmethod
+    def _parse_document(self) -> List[Node]:
+        pass
+
+    def _token(self, start: int, end: int, tokentype: str) -> None:
+        if end > start:
+            self._tokens.append((start, end, tokentype))
+
+    # Ensures that the window contains the text between start and end
+    def _load_window(self, start: int, end: int) -> None:
+        window_end = self._window_start + len(self._window)
+        if self._window_start <= start and min(end, self._length) <= window_end:
+            return
+        assert self._lazy_text is not None
+        end = min(max(end, start + _WINDOW_SIZE), self._length)
+        self._window = self._lazy_text.get_text(start, end)
+        self._window_start = start
+
+    def _match_in_window(self, regex: re.Pattern[str], position: int) -> Optional[_Match]:
+        self._load_window(position, position + _WINDOW_MARGIN)
+        while True:
+            match = regex.match(self._window, position - self._window_start)
+            window_end = self._window_start + len(self._window)
+            end = position if match is None else self._window_start + match.end()
+            if end + _WINDOW_MARGIN <= window_end or window_end == self._length:
+                break
+            # The match might continue after the window, e.g. a long string
+            self._load_window(position, window_end + len(self._window))
+        return None if match is None else _Match(match, self._window_start)
+
+    def _match(
+        self, regex: re.Pattern[str], position: int
+    ) -> Optional[Union[re.Match[str], _Match]]:
+        if self._lazy_text is None:
+            match: Optional[Union[re.Match[str], _Match]] = regex.match(self._window, position)
+        else:
+            match = self._match_in_window(regex, position)
+        end = position if match is None else match.end()
+        self._examined_end = max(self._examined_end, end + _LOOKAHEAD_SLACK)
+        return match
+
+    def _reuse(self, node: Node, start: int) -> Node:
+        node.start = start
+        self._reused.append((start, start + node.length))
+        self._examined_end = max(self._examined_end, start + node.length + node.lookahead)
+        return node
+
+    def _fresh_node(
+        self, kind: str, start: int, parse: Callable[[int], Tuple[int, List[Node]]]
+    ) -> Node:
+        old_examined_end = self._examined_end
+        self._examined_end = start
+        end, children = parse(start)
+        assert end > start, "nodes must not be empty"
+        for child in children:
+            child.start -= start
+
+        node = Node(kind, start, end - start, max(0, self._examined_end - end), children)
+        self._examined_end = max(old_examined_end, self._examined_end)
+        return node
+
+    # parse(start) returns (end, child nodes), with absolute starts in the child nodes
+    def _node(self, kind: str, start: int, parse: Callable[[int], Tuple[int, List[Node]]]) -> Node:
+        reused = self._cursor.find(start, (kind,))
+        if reused is not None:
+            return self._reuse(reused, start)
+        return self._fresh_node(kind, start, parse)
+
+    def _sequence(
+        self,
+        kind: str,
+        start: int,
+        parse_item: Callable[[int], Tuple[int, List[Node]]],
+        is_at_end: Callable[[int], bool],
+    ) -> Tuple[int, List[Node]]:
+        # Reusing a chunk skips the is_at_end() checks between its items, so
+        # all sequences of the same kind must use the same is_at_end()
+        chunk_kind = kind + "*"
+        position = start
+        parts: List[Node] = []
+        while not is_at_end(position):
+            reused = self._cursor.find(position, (chunk_kind, kind))
+            if reused is None:
+                part = self._fresh_node(kind, position, parse_item)
+            else:
+                part = self._reuse(reused, position)
+            parts.append(part)
+            position += part.length
+        return (position, self._group_into_chunks(chunk_kind, parts))
+
+    def _group_into_chunks(self, chunk_kind: str, parts: List[Node]) -> List[Node]:
+        if len(parts) <= CHUNK_SIZE:
+            return parts
+
+        result: List[Node] = []
+        loose: List[Node] = []
+
+        def flush_loose() -> None:
+            for index in range(0, len(loose), CHUNK_SIZE):
+                items = loose[index : index + CHUNK_SIZE]
+                start = items[0].start
+                end = items[-1].start + items[-1].length
+                examined_end = max(item.start + item.length + item.lookahead for item in items)
+                for item in items:
+                    item.start -= start
+                result.append(Node(chunk_kind, start, end - start, examined_end - end, items))
+            loose.clear()
+
+        for part in parts:
+            if part.kind == chunk_kind:
+                flush_loose()
+                result.append(part)
+            else:
+                loose.append(part)
+        flush_loose()
+        return result
+
+
+_PYTHON_TOKEN = re.compile(
+    r"""
+    (?P<newline> \n )
+    | (?P<space> [ \t\f\r]+ | \\\n )
+    | (?P<comment> \#[^\n]* )
+    | (?P<string> (?P<affix> (?i: rb | br | fr | rf | [rbuf] ) )? (?P<quote> '''|\"\"\"|'|\" ) )
+    | (?P<hex> 0[xX][0-9a-fA-F_]+ )
+    | (?P<bin> 0[bB][01_]+ )
+    | (?P<oct> 0[oO][0-7_]+ )
+    | (?P<float> (?: \d[\d_]*\.[\d_]* | \.\d[\d_]* ) (?: [eE][+-]?\d[\d_]* )? [jJ]?
+                 | \d[\d_]* (?: [eE][+-]?\d[\d_]* ) [jJ]? )
+    | (?P<integer> \d[\d_]* [jJ]? )
+    | (?P<name> \w+ )
+    | (?P<open> [(\[{] )
+    | (?P<close> [)\]}] )
+    | (?P<operator> \*\*=? | //=? | >>=? | <<=? | -> | := | [-+*/%@&|^=<>!]=? | [~.] )
+    | (?P<punctuation> [,:;] )
+    | (?P<error> . )
+    """,
+    re.VERBOSE,
+)
+# These always match, even when the text ends with a backslash
+_PYTHON_STRING_BODIES = {
+    "'''": re.compile(r"(?:[^\\]|\\.|\\\Z)*?(?:'''|\Z)", re.DOTALL),
+    '"""': re.compile(r'(?:[^\\]|\\.|\\\Z)*?(?:"""|\Z)', re.DOTALL),
+    "'": re.compile(r"(?:[^\\\n']|\\.|\\\n|\\\Z)*(?:'|(?=\n)|\Z)"),
+    '"': re.compile(r'(?:[^\\\n"]|\\.|\\\n|\\\Z)*(?:"|(?=\n)|\Z)'),
+}
+_PYTHON_DECORATOR = re.compile(r"@[ \t]*[\w.]+")
+
+_PYTHON_NUMBER_TYPES = {
+    "hex": "Token.Literal.Number.Hex",
+    "bin": "Token.Literal.Number.Bin",
+    "oct": "Token.Literal.Number.Oct",
+    "float": "Token.Literal.Number.Float",
+    "integer": "Token.Literal.Number.Integer",
+}
+_PYTHON_NAME_TYPES: Dict[str, str] = {}
+for _name in dir(builtins):
+    if _name.startswith("_"):
+        continue
+    if _name.endswith(("Error", "Exception", "Warning")) or _name in {
+        "KeyboardInterrupt",
+        "StopIteration",
+        "StopAsyncIteration",
+        "GeneratorExit",
+        "SystemExit",
+    }:
+        _PYTHON_NAME_TYPES[_name] = "Token.Name.Exception"
+    else:
+        _PYTHON_NAME_TYPES[_name] = "Token.Name.Builtin"
+_PYTHON_NAME_TYPES.update(
+    {
+        "self": "Token.Name.Builtin.Pseudo",
+        "cls": "Token.Name.Builtin.Pseudo",
+        "Ellipsis": "Token.Name.Builtin.Pseudo",
+        "NotImplemented": "Token.Name.Builtin.Pseudo",
+    }
+)
+for _name in keyword.kwlist:
+    _PYTHON_NAME_TYPES[_name] = "Token.Keyword"
+_PYTHON_NAME_TYPES.update(
+    {
+        "True": "Token.Keyword.Constant",
+        "False": "Token.Keyword.Constant",
+        "None": "Token.Keyword.Constant",
+        "import": "Token.Keyword.Namespace",
+        "from": "Token.Keyword.Namespace",
+        "and": "Token.Operator.Word",
+        "or": "Token.Operator.Word",
+        "not": "Token.Operator.Word",
+        "in": "Token.Operator.Word",
+        "is": "Token.Operator.Word",
+    }
+)
+
+
+class PythonParser(Parser):
+    """Statements are nodes, and so are parenthesized parts of statements.
+
+    Elements of lists, tuples, function calls etc. are nodes too, so that
+    editing a big dict literal doesn't parse the whole dict again.
+    """
+
+    def _parse_document(self) -> List[Node]:
+        end, children = self._sequence(
+            "py_statement", 0, self._parse_statement, (lambda pos: pos >= self._length)
+        )
+        return children
+
+    def _parse_statement(self, start: int) -> Tuple[int, List[Node]]:
+        return self._parse_tokens(start, in_brackets=False)
+
+    def _parse_element(self, start: int) -> Tuple[int, List[Node]]:
+        return self._parse_tokens(start, in_brackets=True)
+
+    def _is_at_closing_bracket(self, position: int) -> bool:
+        match = self._match(_PYTHON_TOKEN, position)
+        return match is None or match.lastgroup == "close"
+
+    def _parse_brackets(self, start: int) -> Tuple[int, List[Node]]:
+        self._token(start, start + 1, "Token.Punctuation")
+        end, children = self._sequence(
+            "py_element", start + 1, self._parse_element, self._is_at_closing_bracket
+        )
+        if end < self._length:
+            self._token(end, end + 1, "Token.Punctuation")
+            end += 1
+        return (end, children)
+
+    def _parse_string(self, match: Union[re.Match[str], _Match], is_first: bool) -> int:
+        self._token(match.start("affix"), match.end("affix"), "Token.Literal.String.Affix")
+        quote = match.group("quote")
+        body = self._match(_PYTHON_STRING_BODIES[quote], match.end())
+        assert body is not None
+        end = body.end()
+
+        if is_first and len(quote) == 3:
+            tokentype = "Token.Literal.String.Doc"
+        elif quote.startswith("'"):
+            tokentype = "Token.Literal.String.Single"
+        else:
+            tokentype = "Token.Literal.String.Double"
+        self._token(match.start("quote"), end, tokentype)
+        return end
+
+    # Returns when a statement or bracketed element ends
+    def _parse_tokens(self, start: int, *, in_brackets: bool) -> Tuple[int, List[Node]]:
+        children: List[Node] = []
+        position = start
+        previous_word = None
+        is_first = not in_brackets
+
+        while position < self._length:
+            match = self._match(_PYTHON_TOKEN, position)
+            assert match is not None
+            kind = match.lastgroup
+            end = match.end()
+
+            if kind == "newline":
+                if not in_brackets:
+                    return (end, children)
+            elif kind == "space":
+                pass
+            elif kind == "comment":
+                self._token(position, end, "Token.Comment.Single")
+            elif kind == "string":
+                end = self._parse_string(match, is_first)
+            elif kind in _PYTHON_NUMBER_TYPES:
+                self._token(position, end, _PYTHON_NUMBER_TYPES[kind])
+            elif kind == "name":
+                word = match.group()
+                if previous_word == "def":
+                    tokentype = "Token.Name.Function"
+                elif previous_word == "class":
+                    tokentype = "Token.Name.Class"
+                elif previous_word in {"import", "from"}:
+                    tokentype = "Token.Name.Namespace"
+                else:
+                    tokentype = _PYTHON_NAME_TYPES.get(word, "Token.Name")
+                self._token(position, end, tokentype)
+                previous_word = word
+            elif kind == "open":
+                node = self._node("py_brackets", position, self._parse_brackets)
+                children.append(node)
+                end = position + node.length
+            elif kind == "close":
+                if in_brackets:
+                    assert position != start
+                    return (position, children)
+                self._token(position, end, "Token.Punctuation")
+            elif kind == "operator":
+                decorator = self._match(_PYTHON_DECORATOR, position) if is_first else None
+                if decorator is None:
+                    self._token(position, end, "Token.Operator")
+                else:
+                    end = decorator.end()
+                    self._token(position, end, "Token.Name.Decorator")
+            elif kind == "punctuation":
+                self._token(position, end, "Token.Punctuation")
+                if in_brackets and match.group() == ",":
+                    return (end, children)
+            else:
+                self._token(position, end, "Token.Error")
+
+            if kind not in {"newline", "space", "comment"}:
+                is_first = False
+                if kind != "name":
+                    previous_word = None
+            position = end
+
+        return (position, children)
+
+
+_JSON_TOKEN = re.compile(
+    r"""
+    (?P<space> \s+ )
+    | (?P<string> "(?:[^"\\\n]|\\.)*"? )
+    | (?P<number> -?\d+ (?P<fraction> \.\d+ )? (?P<exponent> [eE][+-]?\d+ )? )
+    | (?P<constant> true | false | null )
+    | (?P<open> [\[{] )
+    | (?P<close> [\]}] )
+    | (?P<punctuation> [,:] )
+    | (?P<error> . )
+    """,
+    re.VERBOSE,
+)
+
+
+class JsonParser(Parser):
+    """Arrays and objects are nodes, and so are their elements and members."""
+
+    def _parse_document(self) -> List[Node]:
+        # Many values at top level is an error, but it's highlighted anyway.
+        # Top-level values are not "json_element" nodes, because closing
+        # brackets don't end the sequence of top-level values.
+        end, children = self._sequence(
+            "json_value", 0, self._parse_element, (lambda pos: pos >= self._length)
+        )
+        return children
+
+    def _is_at_closing_bracket(self, position: int) -> bool:
+        match = self._match(_JSON_TOKEN, position)
+        return match is None or match.lastgroup == "close"
+
+    def _parse_container(self, start: int) -> Tuple[int, List[Node]]:
+        self._token(start, start + 1, "Token.Punctuation")
+        opening = self._match(_JSON_TOKEN, start)
+        assert opening is not None
+        if opening.group() == "{":
+            item_kind = "json_member"
+            parse_item = self._parse_member
+        else:
+            item_kind = "json_element"
+            parse_item = self._parse_element
+        end, children = self._sequence(
+            item_kind, start + 1, parse_item, self._is_at_closing_bracket
+        )
+        if end < self._length:
+            self._token(end, end + 1, "Token.Punctuation")
+            end += 1
+        return (end, children)
+
+    def _parse_element(self, start: int) -> Tuple[int, List[Node]]:
+        return self._parse_values(start, is_member=False)
+
+    def _parse_member(self, start: int) -> Tuple[int, List[Node]]:
+        return self._parse_values(start, is_member=True)
+
+    def _parse_values(self, start: int, *, is_member: bool) -> Tuple[int, List[Node]]:
+        children: List[Node] = []
+        position = start
+        after_colon = False
+
+        while position < self._length:
+            match = self._match(_JSON_TOKEN, position)
+            assert match is not None
+            kind = match.lastgroup
+            end = match.end()
+
+            if kind == "string":
+                if is_member and not after_colon:
+                    self._token(position, end, "Token.Name.Tag")
+                else:
+                    self._token(position, end, "Token.Literal.String.Double")
+            elif kind == "number":
+                if match.group("fraction") or match.group("exponent"):
+                    self._token(position, end, "Token.Literal.Number.Float")
+                else:
+                    self._token(position, end, "Token.Literal.Number.Integer")
+            elif kind == "constant":
+                self._token(position, end, "Token.Keyword.Constant")
+            elif kind == "open":
+                kind_of_node = "json_object" if match.group() == "{" else "json_array"
+                node = self._node(kind_of_node, position, self._parse_container)
+                children.append(node)
+                end = position + node.length
+            elif kind == "close":
+                if position != start:
+                    return (position, children)
+                # Closing bracket without opening bracket
+                self._token(position, end, "Token.Error")
+            elif kind == "punctuation":
+                self._token(position, end, "Token.Punctuation")
+                if match.group() == ",":
+                    return (end, children)
+                after_colon = True
+            elif kind == "error":
+                self._token(position, end, "Token.Error")
+            position = end
+
+        return (position, children)
+
+
+# Keys are pygments lexer aliases
+PARSERS: Dict[str, Type[Parser]] = {
+    "python": PythonParser,
+    "python3": PythonParser,
+    "json": JsonParser,
+}
@@ -0,0 +1,327 @@
+"""An index for finding out which files can't contain a search string, without reading them.
+
+For each file, the index has a Bloom filter of the trigrams (three-byte
+sequences) in the file. A string can be in the file only if all of its
+trigrams are in the filter. Filters have 8 bits for each distinct trigram of
+the file, and there are two hash functions, so about 5% of the trigrams that
+aren't in a file appear to be there. Searching for a few characters of text
+rules out almost all files that don't contain it.
+
+Trigrams are taken from the bytes of the file, with ASCII letters converted
+to lowercase, so the same index works for case-sensitive and ignore-case
+searches. Files are indexed again when their modification time or size
+changes. The index of each project is pickled to Porcupine's cache directory.
+"""
+from __future__ import annotations
+
+import dataclasses
+import functools
+import hashlib
+import logging
+import os
+import pickle
+import re
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Pattern, Set, Tuple
+
+from porcupine import dirs
+
+if sys.version_info >= (3, 11):
+    from re import _constants as sre_constants
+    from re import _parser as sre_parse
+else:
+    import sre_constants
+    import sre_parse
+
+log = logging.getLogger(__name__)
+
+_VERSION = 1
+# Bigger files are not indexed, so they are always searched
+MAX_FILE_SIZE = 4 * 1024 * 1024
+# Binary files are detected like find_in_files.search_file() does it
+_BINARY_SNIFF_SIZE = 8192
+_BITS_PER_TRIGRAM = 8
+_BITS_TO_ASCII = bytes.maketrans(b"\0\1", b"01")
+
+# Trigrams are tuples of three ints. Their hash() doesn't depend on
+# PYTHONHASHSEED, unlike the hash of a bytes object, but it can change in a
+# new Python version, so the index is built again when Python is updated.
+_Trigram = Tuple[int, int, int]
+
+# Under re.IGNORECASE, these ASCII letters also match non-ASCII characters
+_SPECIAL_CASE_FOLDING = "iks"
+
+
+class _FileInfo(NamedTuple):
+    mtime_ns: int
+    size: int
+    # None means that the file isn't indexed and it must always be searched
+    bloom_filter: Optional[int]
+    bit_count: int  # 0 for binary files
+
+
+@dataclasses.dataclass
+class IndexStatus:
+    loaded: bool
+    exists: bool  # False if the index hasn't been saved to the cache directory
+    file_count: int
+    size_on_disk: int  # in bytes
+    progress: Optional[Tuple[int, int]]  # (done, total) when indexing many files
+
+
+def _get_trigrams(data: bytes) -> Set[_Trigram]:
+    return set(zip(data, data[1:], data[2:]))
+
+
+def _make_bloom_filter(trigrams: Set[_Trigram]) -> Tuple[int, int]:
+    bit_count = 64
+    while bit_count < _BITS_PER_TRIGRAM * len(trigrams):
+        bit_count *= 2
+
+    # A byte for each bit, because setting bytes is fast
+    bits = bytearray(bit_count)
+    mask = bit_count - 1
+    for trigram in trigrams:
+        trigram_hash = hash(trigram)
+        bits[trigram_hash & mask] = 1
+        bits[(trigram_hash >> 32) & mask] = 1
+    return (int(bits.translate(_BITS_TO_ASCII)[::-1], 2), bit_count)
+
+
+# Bits that must be set in the Bloom filter of a file that contains the trigrams
+@functools.lru_cache(maxsize=256)
+def _get_mask(trigrams: FrozenSet[_Trigram], bit_count: int) -> int:
+    result = 0
+    mask = bit_count - 1
+    for trigram in trigrams:
+        trigram_hash = hash(trigram)
+        result |= 1 << (trigram_hash & mask)
+        result |= 1 << ((trigram_hash >> 32) & mask)
+    return result
+
+
+def _find_literals(parsed: List[Tuple[Any, Any]], ignore_case: bool) -> List[str]:
+    # Returns strings that every match must contain
+    result = []
+    current: List[str] = []
+
+    for op, arg in parsed:
+        if (
+            op is sre_constants.LITERAL
+            and arg != 0xFFFD  # can come from decoding invalid UTF-8
+            and not (ignore_case and (arg >= 0x80 or chr(arg).lower() in _SPECIAL_CASE_FOLDING))
+        ):
+            current.append(chr(arg))
+            continue
+        if op is sre_constants.AT:
+            # Doesn't match any characters, e.g. ^ or \b
+            continue
+
+        result.append("".join(current))
+        current = []
+        if op is sre_constants.SUBPATTERN:
+            group, add_flags, del_flags, subpattern = arg
+            if not add_flags and not del_flags:
+                result.extend(_find_literals(subpattern.data, ignore_case))
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            min_count, max_count, subpattern = arg
+            if min_count >= 1:
+                result.extend(_find_literals(subpattern.data, ignore_case))
+
+    result.append("".join(current))
+    return result
+
+
+def get_required_trigrams(regex: Pattern[str]) -> FrozenSet[_Trigram]:
+    """Return trigrams that are in every file that contains a match of the regex.
+
+    This understands literal text and simple regexes. Anything else is
+    ignored, and in the worst case, the result is empty.
+    """
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception:
+        log.warning(f"can't parse regex {regex.pattern!r}", exc_info=True)
+        return frozenset()
+
+    result: Set[_Trigram] = set()
+    for literal in _find_literals(parsed.data, ignore_case=bool(regex.flags & re.IGNORECASE)):
+        result |= _get_trigrams(literal.encode("utf-8").lower())
+    return frozenset(result)
+
+
+def _read_text_file(path: str) -> Optional[bytes]:
+    with open(path, "rb") as file:
+        data = file.read()
+    if b"\0" in data[:_BINARY_SNIFF_SIZE]:
+        return None
+    return data
+
+
+def _index_file(path: str, stat: os.stat_result) -> Optional[_FileInfo]:
+    if stat.st_size > MAX_FILE_SIZE:
+        return _FileInfo(stat.st_mtime_ns, stat.st_size, None, 0)
+    try:
+        data = _read_text_file(path)
+    except OSError:
+        log.debug(f"can't index '{path}'", exc_info=True)
+        return None
+
+    if data is None:
+        return _FileInfo(stat.st_mtime_ns, stat.st_size, 0, 0)
+    bloom_filter, bit_count = _make_bloom_filter(_get_trigrams(data.lower()))
+    return _FileInfo(stat.st_mtime_ns, stat.st_size, bloom_filter, bit_count)
+
+
+class TrigramIndex:
+    """The index of one project.
+
+    All methods can be called from any thread. Loading and saving read and
+    write the whole index, so they should not run in the main thread.
+    """
+
+    def __init__(self, project_root: Path) -> None:
+        self.project_root = project_root
+        path_hash = hashlib.sha1(str(project_root).encode("utf-8")).hexdigest()
+        self.cache_path = Path(dirs.user_cache_dir) / "trigram_index" / f"{path_hash}.pickle"
+
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()
+        self._loaded = False
+        self._dirty = False
+        self._files: Dict[str, _FileInfo] = {}
+        self._progress: Optional[Tuple[int, int]] = None
+
+    def load(self) -> None:
+        """Read the index from the cache directory, unless it has been read already."""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+
+            try:
+                with self.cache_path.open("rb") as file:
+                    content = pickle.load(file)
+            except FileNotFoundError:
+                return
+            except Exception:
+                log.exception(f"reading '{self.cache_path}' failed")
+                return
+
+            if content["version"] == _VERSION and content["python"] == sys.version_info[:2]:
+                self._files = content["files"]
+            else:
+                log.info(f"'{self.cache_path}' is from an old version, indexing again")
+
+    def save(self) -> None:
+        """Write the index to the cache directory if it has changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            content = {
+                "version": _VERSION,
+                "python": sys.version_info[:2],
+                "project_root": str(self.project_root),
+                "files": self._files.copy(),
+            }
+            self._dirty = False
+
+        # Writing a new file and renaming it makes sure that there's never a
+        # half-written index file, even if Porcupine gets killed
+        temp_path = self.cache_path.with_name(f"{self.cache_path.stem}-{threading.get_ident()}.tmp")
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with temp_path.open("wb") as file:
+                pickle.dump(content, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.cache_path)
+        except OSError:
+            log.exception(f"writing '{self.cache_path}' failed")
+
+    def delete(self) -> None:
+        """Forget everything and delete the file in the cache directory."""
+        with self._lock:
+            self._files.clear()
+            self._dirty = False
+        try:
+            self.cache_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def is_up_to_date(self, path: str, stat: os.stat_result) -> bool:
+        with self._lock:
+            info = self._files.get(path)
+        return info is not None and (info.mtime_ns, info.size) == (stat.st_mtime_ns, stat.st_size)
+
+    def might_contain(self, path: str, trigrams: FrozenSet[_Trigram]) -> bool:
+        """Return False if the file surely doesn't contain all of the trigrams.
+
+        Call :meth:`is_up_to_date` before this.
+        """
+        with self._lock:
+            info = self._files[path]
+        if info.bloom_filter is None or not trigrams:
+            return True
+        if info.bit_count == 0:
+            return False  # binary file
+        mask = _get_mask(trigrams, info.bit_count)
+        return info.bloom_filter & mask == mask
+
+    def update(self, paths: List[Tuple[str, os.stat_result]]) -> None:
+        """Index the given files again.
+
+        If another thread is already updating the index, this does nothing.
+        Files that were changed while updating get indexed again next time.
+        """
+        if not self._update_lock.acquire(blocking=False):
+            return
+        try:
+            for index, (path, stat) in enumerate(paths):
+                # stat is from before reading, so later changes will be noticed
+                info = _index_file(path, stat)
+                with self._lock:
+                    if info is None:
+                        self._files.pop(path, None)
+                    else:
+                        self._files[path] = info
+                    self._dirty = True
+                    self._progress = (index + 1, len(paths))
+        finally:
+            with self._lock:
+                self._progress = None
+            self._update_lock.release()
+
+    def forget_other_files(self, existing_paths: Set[str]) -> None:
+        """Remove files that are not in *existing_paths* from the index."""
+        with self._lock:
+            for path in self._files.keys() - existing_paths:
+                del self._files[path]
+                self._dirty = True
+
+    def get_status(self) -> IndexStatus:
+        try:
+            size_on_disk = self.cache_path.stat().st_size
+            exists = True
+        except OSError:
+            size_on_disk = 0
+            exists = False
+        with self._lock:
+            return IndexStatus(self._loaded, exists, len(self._files), size_on_disk, self._progress)
+
+
+_indexes: Dict[Path, TrigramIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(project_root: Path) -> TrigramIndex:
+    """Return the index of a project. It isn't loaded until :meth:`load` is called."""
+    with _indexes_lock:
+        if project_root not in _indexes:
+            _indexes[project_root] = TrigramIndex(project_root)
+        return _indexes[project_root]
+
+
+def get_loaded_indexes() -> List[TrigramIndex]:
+    with _indexes_lock:
+        return [index for index in _indexes.values() if index._loaded]
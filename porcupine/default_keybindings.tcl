@@ -32,6 +32,9 @@ event add "<<Menubar:View/Full Screen>>" <F11>
 # find plugin
 event add "<<Menubar:Edit/Find and Replace>>" <$contmand-f>
 
+# find_in_files plugin
+event add "<<Menubar:Edit/Find in Project>>" <$contmand-F>
+
 # fold plugin
 event add "<<Menubar:Edit/Fold>>" <Alt-f>
 
@@ -336,7 +336,7 @@ def _fill_menus_with_default_stuff() -> None:
         paths = filedialog.askopenfilenames(**filedialog_kwargs)  # type: ignore[no-untyped-call]
         for path in map(pathlib.Path, paths):
             try:
-                tab = tabs.FileTab.open_file(get_tab_manager(), path)
+                tab = tabs.open_path(get_tab_manager(), path)
             except (UnicodeError, OSError) as e:
                 log.exception(f"opening '{path}' failed")
                 utils.errordialog(type(e).__name__, "Opening failed!", traceback.format_exc())
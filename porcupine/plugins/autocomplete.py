@@ -261,18 +261,18 @@ def text_index_less_than(index1: str, index2: str) -> bool:
 
 
 # stupid fallback
-def _all_words_in_file_completions(textwidget: tkinter.Text) -> List[Completion]:
-    match = re.search(r"\w*$", textwidget.get("insert linestart", "insert"))
+def _all_words_in_file_completions(widget: tkinter.Text) -> List[Completion]:
+    match = re.search(r"\w*$", widget.get("insert linestart", "insert"))
     assert match is not None
     before_cursor = match.group(0)
-    replace_start = textwidget.index(f"insert - {len(before_cursor)} chars")
-    replace_end = textwidget.index("insert")
+    replace_start = widget.index(f"insert - {len(before_cursor)} chars")
+    replace_end = widget.index("insert")
 
     counts = dict(
         collections.Counter(
             [
                 word
-                for word in re.findall(r"\w+", textwidget.get("1.0", "end"))
+                for word in re.findall(r"\w+", textwidget.get_mirror(widget).get_all())
                 if before_cursor.casefold() in word.casefold()
             ]
         )
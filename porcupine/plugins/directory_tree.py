@@ -9,7 +9,7 @@ import tkinter
 from functools import partial
 from pathlib import Path
 from tkinter import ttk
-from typing import Any, Callable, Dict, Iterator, List, Tuple
+from typing import Any, Callable, Dict, Generator, Iterator, List, Tuple
 
 from porcupine import (
     get_main_window,
@@ -118,6 +118,7 @@ class DirectoryTree(ttk.Treeview):
         self.column("#0", minwidth=500)  # allow scrolling sideways
         self._config_tags()
         self.git_statuses: Dict[Path, Dict[Path, str]] = {}
+        self._refresh_done_callbacks: List[Callable[[], None]] = []
 
         self._last_click_time = 0  # Very long time since previous click, no double click
         self._last_click_item: str | None = None
@@ -293,16 +294,31 @@ class DirectoryTree(ttk.Treeview):
         def thread_target() -> dict[Path, dict[Path, str]]:
             return {path: run_git_status(path) for path in map(get_path, project_ids)}
 
+        def update_tree() -> Generator[None, None, None]:
+            for project_id in self.get_children(""):
+                yield from self._update_tags_and_content(get_path(project_id), project_id)
+            self._update_selection_color()
+            log.info(f"refreshing done in {round((time.time()-start_time)*1000)}ms")
+
+            callbacks = self._refresh_done_callbacks.copy()
+            self._refresh_done_callbacks.clear()
+            for callback in callbacks:
+                callback()
+
         def done_callback(success: bool, result: str | dict[Path, dict[Path, str]]) -> None:
             log.debug(f"thread done in {round((time.time()-start_time)*1000)}ms")
             if success and set(self.get_children()) == set(project_ids):
                 assert isinstance(result, dict)
                 self.git_statuses = result
-                for project_id in self.get_children(""):
-                    self._update_tags_and_content(get_path(project_id), project_id)
-                self._update_selection_color()
-                log.info(f"refreshing done in {round((time.time()-start_time)*1000)}ms")
-                when_done()
+                # If a previous refresh is still updating the tree, it gets
+                # cancelled, but its when_done callback runs when this is done
+                self._refresh_done_callbacks.append(when_done)
+                utils.start_job(
+                    self,
+                    f"directory_tree_refresh:{self}",
+                    update_tree(),
+                    utils.JobPriority.BACKGROUND,
+                )
             elif success:
                 log.info(
                     "projects added/removed while refreshing, assuming another fresh is coming soon"
@@ -319,9 +335,18 @@ class DirectoryTree(ttk.Treeview):
         [result] = [id for id in self.get_children("") if id.startswith(f"project:{num}:")]
         return result
 
-    # The following two methods call each other recursively.
-
-    def _update_tags_and_content(self, project_root: Path, child_id: str) -> None:
+    # The following two methods call each other recursively. They are
+    # generators that yield after refreshing each directory, so that a big
+    # tree can be refreshed with utils.start_job() without freezing.
+    #
+    # Items can be deleted between the steps, and that's why the code checks
+    # whether they still exist.
+
+    def _update_tags_and_content(
+        self, project_root: Path, child_id: str
+    ) -> Generator[None, None, None]:
+        if not self.exists(child_id):  # type: ignore[no-untyped-call]
+            return
         child_path = get_path(child_id)
         path_to_status = self.git_statuses[project_root]
 
@@ -352,9 +377,13 @@ class DirectoryTree(ttk.Treeview):
 
         self.item(child_id, tags=([] if status is None else status))
         if child_id.startswith(("dir:", "project:")) and not self.contains_dummy(child_id):
-            self._open_and_refresh_directory(child_path, child_id)
+            yield from self._open_and_refresh_directory(child_path, child_id)
 
-    def _open_and_refresh_directory(self, dir_path: Path, dir_id: str) -> None:
+    def _open_and_refresh_directory(
+        self, dir_path: Path, dir_id: str
+    ) -> Generator[None, None, None]:
+        if not self.exists(dir_id):  # type: ignore[no-untyped-call]
+            return
         if self.contains_dummy(dir_id):
             self.delete(self.get_children(dir_id)[0])  # type: ignore[no-untyped-call]
 
@@ -384,7 +413,9 @@ class DirectoryTree(ttk.Treeview):
         project_id = self.find_project_id(dir_id)
         project_root = get_path(project_id)
         for child_path, child_id in path2id.items():
-            self._update_tags_and_content(project_root, child_id)
+            yield from self._update_tags_and_content(project_root, child_id)
+        if not self.exists(dir_id):  # type: ignore[no-untyped-call]
+            return
 
         for index, child_id in enumerate(sorted(self.get_children(dir_id), key=self._sorting_key)):
             self.move(child_id, dir_id, index)  # type: ignore[no-untyped-call]
@@ -394,6 +425,7 @@ class DirectoryTree(ttk.Treeview):
         self.event_generate(
             "<<FolderRefreshed>>", data=FolderRefreshed(project_id=project_id, folder_id=dir_id)
         )
+        yield
 
     def _sorting_key(self, item_id: str) -> Tuple[Any, ...]:
         [git_tag] = [t for t in self.item(item_id, "tags") if t.startswith("git_")] or [None]
@@ -418,11 +450,14 @@ class DirectoryTree(ttk.Treeview):
             return
 
         if selected_id.startswith("file:"):
-            get_tab_manager().add_tab(
-                tabs.FileTab.open_file(get_tab_manager(), get_path(selected_id))
-            )
+            get_tab_manager().add_tab(tabs.open_path(get_tab_manager(), get_path(selected_id)))
         elif selected_id.startswith(("dir:", "project:")):  # not dummy item
-            self._open_and_refresh_directory(get_path(selected_id), selected_id)
+            utils.start_job(
+                self,
+                f"directory_tree_open:{selected_id}",
+                self._open_and_refresh_directory(get_path(selected_id), selected_id),
+                utils.JobPriority.INPUT,
+            )
 
             tab = get_tab_manager().select()
             if (
@@ -484,13 +519,11 @@ def focus_treeview(tree: DirectoryTree) -> None:
 # There's no way to bind so you get only main window's events.
 #
 # When the treeview is focused inside the Porcupine window but the Porcupine
-# window itself is not focused, this refreshes twice when the window gets
-# focus. If that ever becomes a problem, it can be fixed with a debouncer. At
-# the time of writing this, Porcupine contains debouncer code used for
-# something else. That can be found with grep.
+# window itself is not focused, this gets called twice when the window gets
+# focus, but run_when_idle() refreshes only once.
 def on_any_widget_focused(tree: DirectoryTree, event: tkinter.Event[tkinter.Misc]) -> None:
     if event.widget is get_main_window() or event.widget is tree:
-        tree.refresh()
+        utils.run_when_idle(tree, tree.refresh)
 
 
 def setup() -> None:
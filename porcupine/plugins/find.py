@@ -1,20 +1,179 @@
 """Find and replace text."""
-# FIXME: finding 'as' or 'asa' from 'asasasasa' is broken
 from __future__ import annotations
 
+import functools
 import re
 import sys
+import time
 import tkinter
 from functools import partial
 from tkinter import ttk
-from typing import Any, Iterator, List, Optional, Tuple, cast
+from typing import Any, Generator, Iterator, List, Optional, Pattern, Tuple, cast
 
 if sys.version_info >= (3, 8):
     from typing import Literal
 else:
     from typing_extensions import Literal
 
-from porcupine import get_tab_manager, images, menubar, tabs, textwidget
+from porcupine import _linetree, get_tab_manager, images, menubar, tabs, textwidget, utils
+
+# Finding stops here, because highlighting more matches would take too long
+MAX_MATCHES = 10000
+
+# A match is (start column, number of newlines in match, end column), and
+# it's stored with the line number where it starts
+_Match = Tuple[int, int, int]
+_LineMatches = Tuple[_Match, ...]
+
+
+# Compiling a regex is slow compared to finding from a few changed lines, and
+# re's own cache is shared with everything else that uses re
+@functools.lru_cache(maxsize=64)
+def _compile_regex(pattern: str, flags: int) -> Pattern[str]:
+    return re.compile(pattern, flags)
+
+
+# Yields (lineno, match) pairs for text that starts at the given line
+def _find_matches(
+    regex: Pattern[str], text: str, first_lineno: int
+) -> Iterator[Tuple[int, _Match]]:
+    lineno = first_lineno
+    line_start = 0  # offset in text
+    counted_until = 0
+    for match in regex.finditer(text):
+        if match.start() == match.end():
+            # Can't be highlighted or selected, e.g. regex "^"
+            continue
+
+        newline_count = text.count("\n", counted_until, match.start())
+        if newline_count != 0:
+            lineno += newline_count
+            line_start = text.rindex("\n", counted_until, match.start()) + 1
+        counted_until = match.start()
+
+        match_newlines = text.count("\n", match.start(), match.end())
+        if match_newlines == 0:
+            end_column = match.end() - line_start
+        else:
+            end_column = match.end() - text.rindex("\n", match.start(), match.end()) - 1
+        yield (lineno, (match.start() - line_start, match_newlines, end_column))
+
+
+def _count_matches(chunk: List[_LineMatches]) -> int:
+    return sum(map(len, chunk))
+
+
+class _MatchIndex:
+    # Knows where the highlighted matches are on each line, so that changing
+    # the text doesn't need finding everything again.
+    def __init__(self, line_matches: List[_LineMatches], capped: bool) -> None:
+        self._lines = _linetree.SummedLines(line_matches, _count_matches)
+        # True if finding stopped before the end, so that there may be more matches
+        self.capped = capped
+        # How many lines before a change must be checked for matches that extend into it
+        self._max_match_newlines = max(
+            (newlines for matches in line_matches for column, newlines, end in matches), default=0
+        )
+
+    def get_count(self) -> int:
+        return self._lines.get_summary()
+
+    def get_matches(self, lineno: int) -> _LineMatches:
+        return self._lines[lineno - 1]
+
+    def set_lines(self, first_lineno: int, line_matches: List[_LineMatches]) -> None:
+        self._max_match_newlines = max(
+            [self._max_match_newlines]
+            + [newlines for matches in line_matches for column, newlines, end in matches]
+        )
+        self._lines.replace_lines(
+            first_lineno - 1, first_lineno - 1 + len(line_matches), line_matches
+        )
+
+    def iter_matches(
+        self, lineno: int = 1, *, backwards: bool = False
+    ) -> Iterator[Tuple[int, _Match]]:
+        # Yields (lineno, match) pairs, and backwards also reverses matches on each line
+        chunk_index, chunk_start = self._lines.find_chunk(lineno - 1)
+        chunks = self._lines.chunks
+        if backwards:
+            for chunk_index in range(chunk_index, -1, -1):
+                chunk_start = self._lines.find_chunk_start(chunk_index)
+                chunk = chunks[chunk_index]
+                for index in range(min(lineno - 1 - chunk_start, len(chunk) - 1), -1, -1):
+                    for match in reversed(chunk[index]):
+                        yield (chunk_start + index + 1, match)
+        else:
+            for chunk_index in range(chunk_index, len(chunks)):
+                chunk = chunks[chunk_index]
+                for index in range(max(lineno - 1 - chunk_start, 0), len(chunk)):
+                    for match in chunk[index]:
+                        yield (chunk_start + index + 1, match)
+                chunk_start += len(chunk)
+
+    # Matches move with the text like tags do, and matches that overlap the
+    # change are forgotten
+    def apply_change(self, change: textwidget.Change) -> None:
+        start = (change.start[0], change.start[1])
+        end = (change.end[0], change.end[1])
+        new_lines = change.new_text.split("\n")
+        if len(new_lines) == 1:
+            new_end = (start[0], start[1] + len(new_lines[0]))
+        else:
+            new_end = (start[0] + len(new_lines) - 1, len(new_lines[-1]))
+
+        # Where something after the changed part ends up
+        def move(lineno: int, column: int) -> Tuple[int, int]:
+            if lineno == end[0]:
+                return (new_end[0], column - end[1] + new_end[1])
+            return (lineno + new_end[0] - end[0], column)
+
+        for lineno in range(max(1, start[0] - self._max_match_newlines), start[0]):
+            matches = self._lines[lineno - 1]
+            kept = tuple(m for m in matches if (lineno + m[1], m[2]) <= start)
+            if kept != matches:
+                self._lines.replace_lines(lineno - 1, lineno, [kept])
+
+        line_matches: List[List[_Match]] = [[] for line in new_lines]
+        for lineno in range(start[0], end[0] + 1):
+            for column, newlines, end_column in self._lines[lineno - 1]:
+                if (lineno + newlines, end_column) <= start:
+                    line_matches[0].append((column, newlines, end_column))
+                elif (lineno, column) >= end:
+                    new_start = move(lineno, column)
+                    new_match_end = move(lineno + newlines, end_column)
+                    line_matches[-1].append(
+                        (new_start[1], new_match_end[0] - new_start[0], new_match_end[1])
+                    )
+        self._lines.replace_lines(
+            start[0] - 1, end[0], [tuple(matches) for matches in line_matches]
+        )
+
+
+def _get_changed_lines(change_list: List[textwidget.Change]) -> List[Tuple[int, int]]:
+    # Returns (first_lineno, last_lineno) ranges of lines in the new text
+    # that contain something from the changes
+    result: List[Tuple[int, int]] = []
+    for change in change_list:
+        start_line = change.start[0]
+        end_line = change.end[0]
+        new_end_line = start_line + change.new_text.count("\n")
+        line_count_diff = new_end_line - end_line
+
+        new_result = []
+        first, last = start_line, new_end_line
+        for old_first, old_last in result:
+            if old_last < start_line:
+                new_result.append((old_first, old_last))
+            elif old_first > end_line:
+                new_result.append((old_first + line_count_diff, old_last + line_count_diff))
+            else:
+                # Overlaps with this change, combine them
+                first = min(first, old_first)
+                last = max(last, old_last + line_count_diff)
+        new_result.append((first, last))
+        result = sorted(new_result)
+    return result
 
 
 class Finder(ttk.Frame):
@@ -26,6 +185,10 @@ class Finder(ttk.Frame):
     def __init__(self, parent: tkinter.Misc, tab_textwidget: tkinter.Text, **kwargs: Any) -> None:
         super().__init__(parent, **kwargs)
         self._textwidget = tab_textwidget
+        # None when not finding anything, or when finding is still in progress
+        self._match_index: Optional[_MatchIndex] = None
+        self._unfinished_line_matches: Optional[List[List[_Match]]] = None
+        self._replacing = False
 
         # grid layout:
         #         column 0        column 1     column 2        column 3
@@ -33,8 +196,8 @@ class Finder(ttk.Frame):
         # row0|     Find:     | text entry    |       | [x] Full words only   |
         #     |---------------|---------------|-------|-----------------------|
         # row1| Replace with: | text entry    |       | [x] Ignore case       |
-        #     |---------------------------------------------------------------|
-        # row2| button frame, this thing contains a bunch of buttons          |
+        #     |-------------------------------------------------------|-------|
+        # row2| button frame, this thing contains a bunch of buttons  | [x] Regex
         #     |---------------------------------------------------------------|
         # row3| status label with useful-ish text                             |
         #     |---------------------------------------------------------------|
@@ -48,6 +211,7 @@ class Finder(ttk.Frame):
 
         self.full_words_var = tkinter.BooleanVar()
         self.ignore_case_var = tkinter.BooleanVar()
+        self.regex_var = tkinter.BooleanVar()
         find_var = tkinter.StringVar()
 
         self.find_entry = self._add_entry(0, "Find:")
@@ -63,7 +227,7 @@ class Finder(ttk.Frame):
         self.find_entry.bind("<Return>", self._go_to_next_match, add=True)
 
         buttonframe = ttk.Frame(self)
-        buttonframe.grid(row=2, column=0, columnspan=4, sticky="we")
+        buttonframe.grid(row=2, column=0, columnspan=3, sticky="we")
 
         self.previous_button = ttk.Button(
             buttonframe, text="Previous match", command=self._go_to_previous_match
@@ -89,6 +253,7 @@ class Finder(ttk.Frame):
 
         self.full_words_var.trace_add("write", self.highlight_all_matches)
         self.ignore_case_var.trace_add("write", self.highlight_all_matches)
+        self.regex_var.trace_add("write", self.highlight_all_matches)
 
         ttk.Checkbutton(
             self, text="Full words only", underline=0, variable=self.full_words_var
@@ -96,6 +261,9 @@ class Finder(ttk.Frame):
         ttk.Checkbutton(self, text="Ignore case", underline=0, variable=self.ignore_case_var).grid(
             row=1, column=3, sticky="w"
         )
+        ttk.Checkbutton(self, text="Regex", underline=0, variable=self.regex_var).grid(
+            row=2, column=3, sticky="w"
+        )
 
         self.statuslabel = ttk.Label(self)
         self.statuslabel.grid(row=3, column=0, columnspan=4, sticky="we")
@@ -117,6 +285,10 @@ class Finder(ttk.Frame):
         # catch highlight issue after undo
         tab_textwidget.bind("<<Undo>>", self._handle_undo, add=True)
 
+        utils.bind_with_data(
+            tab_textwidget, "<<ContentChanged>>", self._on_content_changed, add=True
+        )
+
     def _config_tags(self, junk: object = None) -> None:
         # TODO: use more pygments theme instead of hard-coded colors?
         self._textwidget.tag_config("find_highlight", foreground="black", background="yellow")
@@ -129,11 +301,12 @@ class Finder(ttk.Frame):
     def _add_entry(self, row: int, text: str) -> ttk.Entry:
         ttk.Label(self, text=text).grid(row=row, column=0, sticky="w")
         entry = ttk.Entry(self, width=35, font="TkFixedFont")
-        entry.bind("<Escape>", self.hide, add=True)
+        entry.bind("<Escape>", self._on_escape, add=True)
         entry.bind("<Alt-t>", self._replace_this, add=True)
         entry.bind("<Alt-a>", self._replace_all, add=True)
         entry.bind("<Alt-f>", partial(self._toggle_var, self.full_words_var), add=True)
         entry.bind("<Alt-i>", partial(self._toggle_var, self.ignore_case_var), add=True)
+        entry.bind("<Alt-r>", partial(self._toggle_var, self.regex_var), add=True)
         entry.grid(row=row, column=1, sticky="we")
         return entry
 
@@ -149,11 +322,17 @@ class Finder(ttk.Frame):
 
         self.pack(fill="x")
 
-        if selected_text is None or "\n" in selected_text:
+        if selected_text is None:
             self.find_entry.focus_set()
             # when ctrl + f without text selected
             self.find_entry.selection_range(0, "end")  # type: ignore[no-untyped-call]
         else:
+            if "\n" in selected_text:
+                # Newline characters don't look good in the entry, but regexes have \n
+                self.regex_var.set(True)
+                selected_text = re.escape(selected_text).replace("\\\n", r"\n")
+            elif self.regex_var.get():
+                selected_text = re.escape(selected_text)
             self.find_entry.delete(0, "end")
             self.find_entry.insert(0, selected_text)  # type: ignore[no-untyped-call]
             self.find_entry.select_range(0, "end")
@@ -161,25 +340,56 @@ class Finder(ttk.Frame):
 
         self.highlight_all_matches()
 
+    def _on_escape(self, junk: object) -> None:
+        if self._stop_finding():
+            self.statuslabel.config(
+                text=self.statuslabel["text"] + " Finding was stopped. Press Esc again to close."
+            )
+        else:
+            self.hide()
+
     def hide(self, junk: object = None) -> None:
+        utils.cancel_job(f"find_highlight:{self}")
+        self._match_index = None
         self._textwidget.tag_remove("find_highlight", "1.0", "end")
         self._textwidget.tag_remove("find_highlight_selected", "1.0", "end")
         self.pack_forget()
         self._textwidget.focus_set()
 
-    # tag_ranges returns (start1, end1, start2, end2, ...), and this thing
-    # gives a list of (start, end) pairs
     def get_match_ranges(self) -> List[Tuple[str, str]]:
+        """Return (start, end) text widget indexes of highlighted matches."""
+        if self._match_index is not None:
+            return [
+                (f"{lineno}.{column}", f"{lineno + newlines}.{end_column}")
+                for lineno, (column, newlines, end_column) in self._match_index.iter_matches()
+            ]
+
+        # Finding is still in progress. This doesn't work if two matches are
+        # next to each other, because tag_ranges() returns them as one range.
         starts_and_ends = list(map(str, self._textwidget.tag_ranges("find_highlight")))
         assert len(starts_and_ends) % 2 == 0
         pairs = list(zip(starts_and_ends[0::2], starts_and_ends[1::2]))
         return pairs
 
+    def _is_match(self, start: str, end: str) -> bool:
+        if self._match_index is None:
+            return (start, end) in self.get_match_ranges()
+
+        lineno, column = map(int, start.split("."))
+        return any(
+            f"{lineno}.{column}" == start and f"{lineno + newlines}.{end_column}" == end
+            for column, newlines, end_column in self._match_index.get_matches(lineno)
+        )
+
     # must be called when going to another match or replacing becomes possible
     # or impossible, i.e. when find_highlight areas or the selection changes
     def _update_buttons(self, junk: object = None) -> None:
         State = Literal["normal", "disabled"]
-        matches_something_state: State = "normal" if self.get_match_ranges() else "disabled"
+        if self._match_index is None:
+            has_matches = bool(self.get_match_ranges())
+        else:
+            has_matches = self._match_index.get_count() != 0
+        matches_something_state: State = "normal" if has_matches else "disabled"
         replace_this_state: State
 
         try:
@@ -187,7 +397,7 @@ class Finder(ttk.Frame):
         except ValueError:
             replace_this_state = "disabled"
         else:  # no, elif doesn't work here
-            if (start, end) in self.get_match_ranges():
+            if self._is_match(start, end):
                 replace_this_state = "normal"
             else:
                 replace_this_state = "disabled"
@@ -197,30 +407,39 @@ class Finder(ttk.Frame):
         self.replace_this_button.config(state=replace_this_state)
         self.replace_all_button.config(state=matches_something_state)
 
-    def _get_matches_to_highlight(self, looking4: str) -> Iterator[str]:
-        # Tkinter's .search() is slow when there are lots of tags from highlight plugin.
-        # See "PERFORMANCE ISSUES" in text widget manual page
-        text = self._textwidget.get("1.0", "end - 1 char")
-
+    # Raises re.error if the regex is invalid
+    def _get_regex(self) -> Pattern[str]:
+        looking4 = self.find_entry.get()  # type: ignore[no-untyped-call]
+        regex = looking4 if self.regex_var.get() else re.escape(looking4)
         if self.full_words_var.get():
-            regex = r"\b" + re.escape(looking4) + r"\b|\n"
+            regex = r"\b(?:" + regex + r")\b"
+
+        # With MULTILINE, ^ and $ match at start and end of each line
+        flags = re.MULTILINE
+        if self.ignore_case_var.get():
+            flags |= re.IGNORECASE
+        return _compile_regex(regex, flags)
+
+    def _matches_can_span_lines(self) -> bool:
+        return self.regex_var.get() or "\n" in self.find_entry.get()  # type: ignore[no-untyped-call]
+
+    def _show_match_count(self) -> None:
+        assert self._match_index is not None
+        count = self._match_index.get_count()
+        if self._match_index.capped:
+            self.statuslabel.config(text=f"Found {count}+ matches.")
+        elif count == 0:
+            self.statuslabel.config(text="Found no matches :(")
+        elif count == 1:
+            self.statuslabel.config(text="Found 1 match.")
         else:
-            regex = re.escape(looking4) + "|\n"
-        flags = re.IGNORECASE if self.ignore_case_var.get() else 0
-
-        lineno = 1
-        for match in re.finditer(regex, text, flags):
-            if match.group(0) == "\n":
-                lineno += 1
-            else:
-                if lineno == 1:
-                    column = match.start()
-                else:
-                    column = match.start() - text.rindex("\n", 0, match.start()) - 1
-                yield f"{lineno}.{column}"
+            self.statuslabel.config(text=f"Found {count} matches.")
 
     def highlight_all_matches(self, *junk: object) -> None:
         # clear previous highlights
+        utils.cancel_job(f"find_highlight:{self}")
+        self._match_index = None
+        self._unfinished_line_matches = None
         self._textwidget.tag_remove("find_highlight", "1.0", "end")
 
         looking4 = self.find_entry.get()  # type: ignore[no-untyped-call]
@@ -228,7 +447,7 @@ class Finder(ttk.Frame):
             self._update_buttons()
             self.statuslabel.config(text="Type something to find.")
             return
-        if self.full_words_var.get():
+        if self.full_words_var.get() and not self.regex_var.get():
             # check for non-wordy characters
             match = re.search(r"\W", looking4)
             if match is not None:
@@ -241,20 +460,119 @@ class Finder(ttk.Frame):
                 )
                 return
 
+        try:
+            regex = self._get_regex()
+        except re.error as e:
+            self._update_buttons()
+            self.statuslabel.config(text=f"Invalid regex: {e}")
+            return
+
+        # Finding from a big file can take a while, and the tab shouldn't
+        # freeze. This also makes it possible to stop a very slow regex.
+        utils.start_job(
+            self,
+            f"find_highlight:{self}",
+            self._highlight_matches_job(regex),
+            priority=utils.JobPriority.INPUT,
+        )
+
+    def _highlight_matches_job(self, regex: Pattern[str]) -> Generator[None, None, None]:
+        # Tkinter's .search() is slow when there are lots of tags from highlight plugin.
+        # See "PERFORMANCE ISSUES" in text widget manual page
+        mirror = textwidget.get_mirror(self._textwidget)
+        line_matches: List[List[_Match]] = [[] for junk in range(mirror.get_line_count())]
+        self._unfinished_line_matches = line_matches
+
         count = 0
-        for start_index in self._get_matches_to_highlight(looking4):
-            self._textwidget.tag_add(
-                "find_highlight", start_index, f"{start_index} + {len(looking4)} chars"
-            )
+        batch: List[str] = []
+        # Yielding after every match lets a slow regex be stopped between matches
+        for lineno, (column, newlines, end_column) in _find_matches(regex, mirror.get_all(), 1):
+            line_matches[lineno - 1].append((column, newlines, end_column))
+            batch.extend([f"{lineno}.{column}", f"{lineno + newlines}.{end_column}"])
             count += 1
+            if count == MAX_MATCHES:
+                break
+            if len(batch) >= 200:
+                self._textwidget.tag_add("find_highlight", *batch)
+                batch.clear()
+                self.statuslabel.config(text=f"Found {count} matches so far...")
+            yield
+        if batch:
+            self._textwidget.tag_add("find_highlight", *batch)
+
+        self._unfinished_line_matches = None
+        self._set_match_index(line_matches, capped=(count == MAX_MATCHES))
+
+    def _set_match_index(self, line_matches: List[List[_Match]], capped: bool) -> None:
+        self._match_index = _MatchIndex([tuple(matches) for matches in line_matches], capped)
+        self._update_buttons()
+        self._show_match_count()
+
+    # Returns True if finding was in progress
+    def _stop_finding(self) -> bool:
+        line_matches = self._unfinished_line_matches
+        if not utils.cancel_job(f"find_highlight:{self}") or line_matches is None:
+            return False
+
+        # Tag the matches that were found but not highlighted yet
+        self._textwidget.tag_remove("find_highlight", "1.0", "end")
+        tag_locations = [
+            index
+            for lineno, matches in enumerate(line_matches, start=1)
+            for column, newlines, end_column in matches
+            for index in [f"{lineno}.{column}", f"{lineno + newlines}.{end_column}"]
+        ]
+        if tag_locations:
+            self._textwidget.tag_add("find_highlight", *tag_locations)
+        self._set_match_index(line_matches, capped=True)
+        return True
+
+    def _on_content_changed(self, event: utils.EventWithData) -> None:
+        if self._replacing:
+            # Don't highlight the replacements, even if they match
+            if self._match_index is not None:
+                for change in event.data_class(textwidget.Changes).change_list:
+                    self._match_index.apply_change(change)
+            return
+
+        if any(job.key == f"find_highlight:{self}" for job in utils.get_jobs()):
+            # matches found before the change would be highlighted in wrong places
+            self.highlight_all_matches()
+            return
+        if self._match_index is None:
+            return
+
+        if self._matches_can_span_lines():
+            # Finding only from changed lines isn't enough
+            self.highlight_all_matches()
+            return
+
+        change_list = event.data_class(textwidget.Changes).change_list
+        for change in change_list:
+            self._match_index.apply_change(change)
+
+        # Find again from changed lines only. Tags of matches on other lines
+        # moved along with the text.
+        mirror = textwidget.get_mirror(self._textwidget)
+        regex = self._get_regex()
+        for first_lineno, last_lineno in _get_changed_lines(change_list):
+            self._textwidget.tag_remove(
+                "find_highlight", f"{first_lineno}.0", f"{last_lineno}.0 lineend"
+            )
+            text = mirror.get((first_lineno, 0), (last_lineno, len(mirror.get_line(last_lineno))))
+
+            line_matches: List[List[_Match]] = [[] for junk in range(first_lineno, last_lineno + 1)]
+            tag_locations = []
+            for lineno, (column, newlines, end_column) in _find_matches(regex, text, first_lineno):
+                line_matches[lineno - first_lineno].append((column, newlines, end_column))
+                tag_locations.extend([f"{lineno}.{column}", f"{lineno + newlines}.{end_column}"])
+
+            self._match_index.set_lines(first_lineno, [tuple(matches) for matches in line_matches])
+            if tag_locations:
+                self._textwidget.tag_add("find_highlight", *tag_locations)
 
         self._update_buttons()
-        if count == 0:
-            self.statuslabel.config(text="Found no matches :(")
-        elif count == 1:
-            self.statuslabel.config(text="Found 1 match.")
-        else:
-            self.statuslabel.config(text=f"Found {count} matches.")
+        self._show_match_count()
 
     def _select_match(self, start: str, end: str) -> None:
         self._textwidget.tag_remove("sel", "1.0", "end")
@@ -264,57 +582,103 @@ class Finder(ttk.Frame):
         self._textwidget.mark_set("insert", start)
         self._textwidget.see(start)
 
+    # Returns (start, end) of the match after the cursor, or before the cursor if backwards
+    def _find_match_near_cursor(self, *, backwards: bool) -> Optional[Tuple[str, str]]:
+        if self._match_index is None:
+            pairs = self.get_match_ranges()
+            if not pairs:
+                return None
+            if backwards:
+                pairs.reverse()
+            for start, end in pairs:
+                if self._textwidget.compare(start, "<" if backwards else ">", "insert"):
+                    return (start, end)
+            # reached end of file, use the first match
+            return pairs[0]
+
+        if self._match_index.get_count() == 0:
+            return None
+
+        cursor_line, cursor_column = map(int, self._textwidget.index("insert").split("."))
+        cursor = (cursor_line, cursor_column)
+        matches = self._match_index.iter_matches(cursor_line, backwards=backwards)
+        for lineno, (column, newlines, end_column) in matches:
+            if (backwards and (lineno, column) < cursor) or (
+                not backwards and (lineno, column) > cursor
+            ):
+                return (f"{lineno}.{column}", f"{lineno + newlines}.{end_column}")
+
+        # reached end of file, use the first match
+        last_line = textwidget.get_mirror(self._textwidget).get_line_count()
+        lineno, (column, newlines, end_column) = next(
+            self._match_index.iter_matches(last_line if backwards else 1, backwards=backwards)
+        )
+        return (f"{lineno}.{column}", f"{lineno + newlines}.{end_column}")
+
     def _go_to_next_match(self, junk: object = None) -> None:
-        pairs = self.get_match_ranges()
-        if not pairs:
+        match = self._find_match_near_cursor(backwards=False)
+        if match is None:
             # the "Next match" button is disabled in this case, but the key
             # binding of the find entry is not
             self.statuslabel.config(text="No matches found!")
             return
 
-        # find first pair that starts after the cursor
-        for start, end in pairs:
-            if self._textwidget.compare(start, ">", "insert"):
-                self._select_match(start, end)
-                break
-        else:
-            # reached end of file, use the first match
-            self._select_match(*pairs[0])
-
+        self._select_match(*match)
         self.statuslabel.config(text="")
         self._update_buttons()
 
     # see _go_to_next_match for comments
     def _go_to_previous_match(self, junk: object = None) -> None:
-        pairs = self.get_match_ranges()
-        if not pairs:
+        match = self._find_match_near_cursor(backwards=True)
+        if match is None:
             self.statuslabel.config(text="No matches found!")
             return
 
-        for start, end in reversed(pairs):
-            if self._textwidget.compare(start, "<", "insert"):
-                self._select_match(start, end)
-                break
-        else:
-            self._select_match(*pairs[-1])
-
+        self._select_match(*match)
         self.statuslabel.config(text="")
         self._update_buttons()
-        return
+
+    # Returns the replacement text, with \1 and \g<name> expanded in regex mode
+    def _get_replacement(self, start: str, end: str) -> str:
+        replace_with = self.replace_entry.get()  # type: ignore[no-untyped-call]
+        if not self.regex_var.get():
+            return replace_with
+
+        # Match again, so that groups are available
+        mirror = textwidget.get_mirror(self._textwidget)
+        start_offset = mirror.index_to_offset(*map(int, start.split(".")))
+        end_offset = mirror.index_to_offset(*map(int, end.split(".")))
+        match = self._get_regex().match(mirror.get_all(), start_offset)
+        if match is None or match.end() != end_offset:
+            # Should be rare, e.g. when a lookahead looks at changed text
+            raise re.error("the match has changed, find again and try again")
+        return match.expand(replace_with)
 
     def _replace_this(self, junk: object = None) -> Literal["break"]:
         if str(self.replace_this_button["state"]) == "disabled":
             self.statuslabel.config(text='Click "Previous match" or "Next match" first.')
             return "break"
 
+        self._stop_finding()
+
+        start, end = map(str, self._textwidget.tag_ranges("sel"))
+        try:
+            replacement = self._get_replacement(start, end)
+        except re.error as e:
+            self.statuslabel.config(text=f"Can't replace: {e}")
+            return "break"
+
         # highlighted areas must not be moved after .replace, think about what
         # happens when you replace 'asd' with 'asd'
-        start, end = self._textwidget.tag_ranges("sel")
         self._textwidget.tag_remove("find_highlight", start, end)
         self._update_buttons()
 
-        with textwidget.change_batch(self._textwidget):
-            self._textwidget.replace(start, end, self.replace_entry.get())  # type: ignore[no-untyped-call]
+        self._replacing = True
+        try:
+            with textwidget.change_batch(self._textwidget):
+                self._textwidget.replace(start, end, replacement)
+        finally:
+            self._replacing = False
 
         self._textwidget.mark_set("insert", start)
         self._go_to_next_match()
@@ -328,22 +692,111 @@ class Finder(ttk.Frame):
             self.statuslabel.config(text=f"Replaced a match. There are {left} more matches.")
         return "break"
 
+    # Returns (start offset, end offset) pairs for all matches, including
+    # matches that weren't highlighted because there were too many
+    def _get_all_match_offsets(self, text: str) -> List[Tuple[int, int]]:
+        if self._match_index is not None and self._match_index.capped:
+            # The index has matches up to where finding stopped, and matches
+            # found later on changed lines. Matches between them are unknown.
+            return [
+                match.span()
+                for match in self._get_regex().finditer(text)
+                if match.start() != match.end()
+            ]
+
+        if self._match_index is None:
+            positions = [
+                tuple(tuple(map(int, index.split("."))) for index in pair)
+                for pair in self.get_match_ranges()
+            ]
+        else:
+            positions = [
+                ((lineno, column), (lineno + newlines, end_column))
+                for lineno, (column, newlines, end_column) in self._match_index.iter_matches()
+            ]
+
+        # Matches are in order, so offsets can be calculated while going through the text
+        lineno = 1
+        line_start = 0
+
+        def to_offset(position: Tuple[int, ...]) -> int:
+            nonlocal lineno, line_start
+            target_lineno, column = position
+            while lineno < target_lineno:
+                line_start = text.index("\n", line_start) + 1
+                lineno += 1
+            return line_start + column
+
+        return [(to_offset(start), to_offset(end)) for start, end in positions]
+
     def _replace_all(self, junk: object = None) -> Literal["break"]:
-        match_ranges = self.get_match_ranges()
+        start_time = time.perf_counter()
+        # Matches that haven't been found yet are found in _get_all_match_offsets()
+        self._stop_finding()
+
+        mirror = textwidget.get_mirror(self._textwidget)
+        text = mirror.get_all()
+        match_offsets = self._get_all_match_offsets(text)
+        replace_with = self.replace_entry.get()  # type: ignore[no-untyped-call]
+
+        # Matches on the same or adjacent lines are replaced with one replace()
+        # call. Calling replace() for each match is slow when there are many
+        # matches, even with change_batch().
+        regex = self._get_regex() if match_offsets and self.regex_var.get() else None
+        groups: List[Tuple[int, int, List[str]]] = []  # (start, end, new text parts)
+        for start, end in match_offsets:
+            if regex is not None:
+                match = regex.match(text, start)
+                if match is None or match.end() != end:
+                    self.statuslabel.config(text="Can't replace: the matches have changed")
+                    return "break"
+                try:
+                    replacement = match.expand(replace_with)
+                except re.error as e:
+                    self.statuslabel.config(text=f"Can't replace: {e}")
+                    return "break"
+            else:
+                replacement = replace_with
 
-        with textwidget.change_batch(self._textwidget):
-            # must do this backwards because replacing may screw up indexes AFTER
-            # the replaced place
-            for start, end in reversed(match_ranges):
-                self._textwidget.replace(start, end, self.replace_entry.get())  # type: ignore[no-untyped-call]
+            if groups and text.count("\n", groups[-1][1], start) <= 1:
+                group_start, group_end, parts = groups[-1]
+                parts.extend([text[group_end:start], replacement])
+                groups[-1] = (group_start, end, parts)
+            else:
+                groups.append((start, end, [replacement]))
+
+        # Indexes must be calculated before changing the text
+        replaces = [
+            (mirror.offset_to_index(start), mirror.offset_to_index(end), "".join(parts))
+            for start, end, parts in groups
+        ]
+
+        self._replacing = True
+        try:
+            with textwidget.change_batch(self._textwidget):
+                # must do this backwards because replacing may screw up indexes AFTER
+                # the replaced place
+                for (start_line, start_column), (end_line, end_column), new_text in reversed(
+                    replaces
+                ):
+                    self._textwidget.replace(
+                        f"{start_line}.{start_column}", f"{end_line}.{end_column}", new_text
+                    )
+        finally:
+            self._replacing = False
 
         self._textwidget.tag_remove("find_highlight", "1.0", "end")
+        if self._match_index is not None:
+            self._match_index = _MatchIndex([()] * mirror.get_line_count(), capped=False)
         self._update_buttons()
 
-        if len(match_ranges) == 1:
-            self.statuslabel.config(text="Replaced 1 match.")
+        milliseconds = round((time.perf_counter() - start_time) * 1000)
+        if len(match_offsets) == 1:
+            self.statuslabel.config(text=f"Replaced 1 match in {milliseconds}ms.")
         else:
-            self.statuslabel.config(text=f"Replaced {len(match_ranges)} matches.")
+            self.statuslabel.config(
+                text=f"Replaced {len(match_offsets)} matches in {milliseconds}ms."
+            )
         return "break"
 
     def _handle_undo(self, event: object) -> None:
@@ -0,0 +1,635 @@
+"""Find text in all files of a project.
+
+Files are searched in a thread pool, and the results show up in a new tab
+while the search is still running. Files that git ignores and binary files
+are skipped. Click a result to open the file.
+
+Big projects get a trigram index (see porcupine/_trigramindex.py), so that
+searching again doesn't need to read files that can't contain a match.
+"""
+from __future__ import annotations
+
+import concurrent.futures
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import tkinter
+import traceback
+from functools import partial
+from pathlib import Path
+from tkinter import ttk
+from typing import Dict, Iterator, List, NamedTuple, Optional, Pattern, Set, Tuple
+
+from porcupine import (
+    _trigramindex,
+    get_main_window,
+    get_paned_window,
+    get_tab_manager,
+    menubar,
+    settings,
+    tabs,
+    utils,
+)
+from porcupine.plugins import directory_tree
+
+log = logging.getLogger(__name__)
+
+# Stop searching when this many matches have been found
+MAX_MATCHES = 10000
+# Files are searched in groups, so that there's less overhead per file
+BATCH_SIZE = 64
+# If this much of the beginning of a file contains a zero byte, it's not text
+_BINARY_SNIFF_SIZE = 8192
+# Matches on long lines are shown with this many characters around them
+_CONTEXT_LENGTH = 60
+
+_executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix="find_in_files")
+
+
+class LineMatch(NamedTuple):
+    lineno: int
+    column: int
+    end_lineno: int
+    end_column: int
+    text: str  # the line containing the match, or a part of it if it's long
+
+
+def _iter_files(project_root: Path, ignored_paths: Set[str]) -> Iterator[os.DirEntry[str]]:
+    stack = [str(project_root)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                # sorted, so that results appear in about the same order every time
+                for entry in sorted(entries, key=(lambda entry: entry.name)):
+                    if entry.path in ignored_paths:
+                        continue
+                    # Don't follow symlinks to directories, they can cause infinite loops
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        yield entry
+        except OSError:
+            log.debug("can't list directory", exc_info=True)
+
+
+def _get_ignored_paths(project_root: Path, git_statuses: Optional[Dict[Path, str]]) -> Set[str]:
+    if git_statuses is None:
+        git_statuses = directory_tree.run_git_status(project_root)
+    return {str(path) for path, status in git_statuses.items() if status == "git_ignored"}
+
+
+def _get_context(line: str, start: int, end: int) -> str:
+    if start <= _CONTEXT_LENGTH:
+        return line[: end + _CONTEXT_LENGTH]
+    return "..." + line[start - _CONTEXT_LENGTH // 2 : end + _CONTEXT_LENGTH]
+
+
+def search_file(path: Path, regex: Pattern[str]) -> List[LineMatch]:
+    """Return matches of *regex* in a file, or an empty list for binary files."""
+    with path.open("rb") as file:
+        beginning = file.read(_BINARY_SNIFF_SIZE)
+        if b"\0" in beginning:
+            return []
+        text = (beginning + file.read()).decode("utf-8", errors="replace")
+
+    # Most files don't match, and this is the fastest way to find out
+    if regex.search(text) is None:
+        return []
+
+    result = []
+    lineno = 1
+    line_start = 0
+    for match in regex.finditer(text):
+        start, end = match.span()
+        if start == end:
+            continue
+
+        lineno += text.count("\n", line_start, start)
+        line_start = text.rfind("\n", 0, start) + 1
+        line_end = text.find("\n", start)
+        if line_end == -1:
+            line_end = len(text)
+
+        end_lineno = lineno + text.count("\n", start, end)
+        end_column = end - (text.rfind("\n", 0, end) + 1)
+        line = text[line_start:line_end]
+        column = start - line_start
+        result.append(
+            LineMatch(
+                lineno, column, end_lineno, end_column, _get_context(line, column, end - line_start)
+            )
+        )
+        if len(result) >= MAX_MATCHES:
+            break
+    return result
+
+
+def search_files(paths: List[Path], regex: Pattern[str]) -> List[Tuple[Path, List[LineMatch]]]:
+    """Search many files with :func:`search_file`, ignoring files that can't be read.
+
+    Returns the files that contain matches.
+    """
+    result = []
+    for path in paths:
+        try:
+            matches = search_file(path, regex)
+        except OSError:
+            log.debug(f"can't search '{path}'", exc_info=True)
+            continue
+        if matches:
+            result.append((path, matches))
+    return result
+
+
+class ProjectSearch:
+    """Search all files of a project in the background.
+
+    Listing files runs in a separate thread, and searching runs in the given
+    executor, :data:`_executor` by default. Nothing here uses tkinter, so
+    this works without Porcupine's GUI. If *git_statuses* is not given,
+    ``git status`` runs in the listing thread.
+
+    If an *index* is given, files that it rules out are not searched. After
+    listing the files, the listing thread indexes files that changed, and
+    saves the index. If the index has never been saved, that happens only
+    when the project has at least *index_min_files* files.
+    """
+
+    def __init__(
+        self,
+        project_root: Path,
+        regex: Pattern[str],
+        *,
+        git_statuses: Optional[Dict[Path, str]] = None,
+        executor: concurrent.futures.Executor = _executor,
+        index: Optional[_trigramindex.TrigramIndex] = None,
+        index_min_files: int = 0,
+    ) -> None:
+        self.project_root = project_root
+        self.regex = regex
+        self.file_count = 0  # files searched so far, including files without matches
+        self.skipped_file_count = 0  # files that the index ruled out
+        self._index = index
+        self._index_min_files = index_min_files
+        self._executor = executor
+        self._results: queue.Queue[Tuple[Path, List[LineMatch]]] = queue.Queue()
+
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._pending: Set[concurrent.futures.Future[List[Tuple[Path, List[LineMatch]]]]] = set()
+        self._listing_done = False
+
+        threading.Thread(target=self._list_files, args=[git_statuses], daemon=True).start()
+
+    def _list_files(self, git_statuses: Optional[Dict[Path, str]]) -> None:
+        all_files: Set[str] = set()
+        changed_files: List[Tuple[str, os.stat_result]] = []
+        try:
+            ignored_paths = _get_ignored_paths(self.project_root, git_statuses)
+            if self._index is not None:
+                self._index.load()
+                trigrams = _trigramindex.get_required_trigrams(self.regex)
+
+            batch: List[Path] = []
+            for entry in _iter_files(self.project_root, ignored_paths):
+                if self._cancelled.is_set():
+                    return
+                if self._index is not None:
+                    all_files.add(entry.path)
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue  # file was deleted just now
+                    if not self._index.is_up_to_date(entry.path, stat):
+                        changed_files.append((entry.path, stat))
+                    elif not self._index.might_contain(entry.path, trigrams):
+                        self.skipped_file_count += 1
+                        continue
+
+                batch.append(Path(entry.path))
+                if len(batch) == BATCH_SIZE:
+                    self._submit(batch)
+                    batch = []
+            if batch:
+                self._submit(batch)
+        except Exception:
+            log.exception(f"listing files in '{self.project_root}' failed")
+            return
+        finally:
+            with self._lock:
+                self._listing_done = True
+
+        # Searching doesn't wait for this
+        if self._index is not None and (
+            self._index.get_status().exists or len(all_files) >= self._index_min_files
+        ):
+            self._index.forget_other_files(all_files)
+            self._index.update(changed_files)
+            self._index.save()
+
+    def _submit(self, batch: List[Path]) -> None:
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            future = self._executor.submit(search_files, batch, self.regex)
+            self._pending.add(future)
+        future.add_done_callback(lambda future: self._on_batch_done(future, len(batch)))
+
+    def _on_batch_done(
+        self, future: concurrent.futures.Future[List[Tuple[Path, List[LineMatch]]]], size: int
+    ) -> None:
+        results = []
+        if not future.cancelled():
+            try:
+                results = future.result()
+            except Exception:
+                log.exception("searching files failed")
+
+        # Results must be in the queue before is_done() can return True
+        with self._lock:
+            if not self._cancelled.is_set():
+                self.file_count += size
+                for result in results:
+                    self._results.put(result)
+            self._pending.discard(future)
+
+    def get_results(self) -> List[Tuple[Path, List[LineMatch]]]:
+        """Return files with matches that were found since the previous call."""
+        result = []
+        while True:
+            try:
+                result.append(self._results.get_nowait())
+            except queue.Empty:
+                return result
+
+    def is_done(self) -> bool:
+        """Check whether all files have been searched or the search was cancelled.
+
+        Results found before this returned True may still be waiting
+        in :meth:`get_results`.
+        """
+        with self._lock:
+            return self._cancelled.is_set() or (self._listing_done and not self._pending)
+
+    def cancel(self) -> None:
+        """Stop searching as soon as possible. Results found so far are kept."""
+        with self._lock:
+            self._cancelled.set()
+            pending = self._pending.copy()
+        # Not holding the lock, because cancel() runs done callbacks right away
+        for future in pending:
+            future.cancel()
+
+
+class FindInProjectTab(tabs.Tab):
+    """A tab for searching the files of a project and showing the results."""
+
+    def __init__(self, manager: tabs.TabManager, project_root: Path) -> None:
+        super().__init__(manager)
+        self.project_root = project_root
+        self.title_choices = [f"Find in {project_root.name}", f"Find in {project_root}"]
+        self._search: Optional[ProjectSearch] = None
+        self._poll_id: Optional[str] = None
+        self._start_time = 0.0
+        self._match_count = 0
+        self._file_count = 0
+        # Values are (path, None) for file items
+        self._items: Dict[str, Tuple[Path, Optional[LineMatch]]] = {}
+
+        ttk.Label(self.top_frame, text="Find:").pack(side="left", padx=(5, 0))
+        self.find_entry = ttk.Entry(self.top_frame)
+        self.find_entry.pack(side="left", fill="x", expand=True, padx=5, pady=5)
+        self.find_entry.bind("<Return>", self.start_search, add=True)
+        self.find_entry.bind("<Escape>", self.stop_search, add=True)
+
+        self.full_words_var = tkinter.BooleanVar(value=False)
+        self.ignore_case_var = tkinter.BooleanVar(value=False)
+        self.regex_var = tkinter.BooleanVar(value=False)
+        for text, var in [
+            ("Full words only", self.full_words_var),
+            ("Ignore case", self.ignore_case_var),
+            ("Regex", self.regex_var),
+        ]:
+            ttk.Checkbutton(self.top_frame, text=text, variable=var).pack(side="left", padx=5)
+
+        self.find_button = ttk.Button(self.top_frame, text="Find", command=self.start_search)
+        self.find_button.pack(side="left", padx=5)
+        self.stop_button = ttk.Button(
+            self.top_frame, text="Stop", command=self.stop_search, state="disabled"
+        )
+        self.stop_button.pack(side="left", padx=(0, 5))
+        ttk.Button(
+            self.top_frame, text="Index...", command=(lambda: show_index_dialog(project_root))
+        ).pack(side="left", padx=(0, 5))
+
+        self.statuslabel = ttk.Label(self.bottom_frame)
+        self.statuslabel.pack(side="left", padx=5)
+
+        self.treeview = ttk.Treeview(self, show="tree", selectmode="browse")
+        self.treeview.pack(side="left", fill="both", expand=True)
+        self.treeview.column("#0", minwidth=500)  # allow scrolling sideways
+        self.treeview.bind("<ButtonRelease-1>", self._on_click, add=True)
+        self.treeview.bind("<Return>", self._open_selected, add=True)
+
+        scrollbar = ttk.Scrollbar(self, command=self.treeview.yview)
+        scrollbar.pack(side="left", fill="y")
+        self.treeview.config(yscrollcommand=scrollbar.set)
+
+        self.bind("<<TabSelected>>", (lambda event: self.find_entry.focus()), add=True)
+        self.bind("<Destroy>", self._on_destroy, add=True)
+
+    def equivalent(self, other: tabs.Tab) -> bool:  # override
+        return isinstance(other, FindInProjectTab) and other.project_root == self.project_root
+
+    def _get_regex(self) -> Pattern[str]:
+        looking4 = self.find_entry.get()  # type: ignore[no-untyped-call]
+        regex = looking4 if self.regex_var.get() else re.escape(looking4)
+        if self.full_words_var.get():
+            regex = r"\b(?:" + regex + r")\b"
+
+        flags = re.MULTILINE
+        if self.ignore_case_var.get():
+            flags |= re.IGNORECASE
+        return re.compile(regex, flags)
+
+    def _get_git_statuses(self) -> Optional[Dict[Path, str]]:
+        # The directory tree has usually ran git already
+        for widget in utils.get_children_recursively(get_paned_window()):
+            if isinstance(widget, directory_tree.DirectoryTree):
+                return widget.git_statuses.get(self.project_root)
+        return None
+
+    def start_search(self, junk: object = None) -> None:
+        """Cancel the current search, if any, and search for what is in the entry."""
+        self.stop_search()
+        if not self.find_entry.get():  # type: ignore[no-untyped-call]
+            self.statuslabel.config(text="Type something to find.")
+            return
+        try:
+            regex = self._get_regex()
+        except re.error as e:
+            self.statuslabel.config(text=f"Invalid regex: {e}")
+            return
+
+        self.treeview.delete(*self.treeview.get_children())  # type: ignore[no-untyped-call]
+        self._items.clear()
+        self._match_count = 0
+        self._file_count = 0
+        self._start_time = time.perf_counter()
+        index: Optional[_trigramindex.TrigramIndex] = None
+        if settings.get("find_in_files_index", bool):
+            index = _trigramindex.get_index(self.project_root)
+        self._search = ProjectSearch(
+            self.project_root,
+            regex,
+            git_statuses=self._get_git_statuses(),
+            index=index,
+            index_min_files=settings.get("find_in_files_index_min_files", int),
+        )
+        self.stop_button.config(state="normal")
+        self.statuslabel.config(text="Searching...")
+        self._poll()
+
+    def stop_search(self, junk: object = None) -> None:
+        """Stop searching, but keep the results found so far."""
+        if self._search is not None:
+            self._search.cancel()
+            self._show_results()
+            self._finish("Stopped")
+
+    def _finish(self, what_happened: str) -> None:
+        assert self._search is not None
+        if self._poll_id is not None:
+            self.after_cancel(self._poll_id)
+            self._poll_id = None
+        skipped_count = self._search.skipped_file_count
+        self._search = None
+        self.stop_button.config(state="disabled")
+
+        milliseconds = round((time.perf_counter() - self._start_time) * 1000)
+        if self._match_count == 0:
+            matches = "no matches"
+        elif self._match_count == 1:
+            matches = "1 match"
+        else:
+            matches = f"{self._match_count} matches"
+        files = "1 file" if self._file_count == 1 else f"{self._file_count} files"
+        text = f"{what_happened}: found {matches} in {files} in {milliseconds}ms."
+        if skipped_count == 1:
+            text += " The index ruled out 1 file."
+        elif skipped_count > 1:
+            text += f" The index ruled out {skipped_count} files."
+        self.statuslabel.config(text=text)
+
+    def _show_results(self) -> None:
+        assert self._search is not None
+        for path, matches in self._search.get_results():
+            if self._match_count >= MAX_MATCHES:
+                break
+            matches = matches[: MAX_MATCHES - self._match_count]
+            self._match_count += len(matches)
+            self._file_count += 1
+
+            file_id = self.treeview.insert(
+                "", "end", text=f"{path.relative_to(self.project_root)} ({len(matches)})", open=True
+            )
+            self._items[file_id] = (path, None)
+            for match in matches:
+                match_id = self.treeview.insert(
+                    file_id, "end", text=f"{match.lineno}: {match.text.strip()}"
+                )
+                self._items[match_id] = (path, match)
+
+    def _poll(self) -> None:
+        assert self._search is not None
+        self._poll_id = None
+        # Check before getting results, so that no results come after the check
+        done = self._search.is_done()
+        self._show_results()
+
+        if self._match_count >= MAX_MATCHES:
+            self._search.cancel()
+            self._finish(f"Stopped after {MAX_MATCHES} matches")
+        elif done:
+            self._finish("Done")
+        else:
+            self.statuslabel.config(
+                text=(
+                    f"Searching... {self._match_count} matches so far,"
+                    f" {self._search.file_count} files searched."
+                )
+            )
+            self._poll_id = self.after(50, self._poll)
+
+    def _on_click(self, event: tkinter.Event[ttk.Treeview]) -> None:
+        # Clicking the little arrow shows or hides the matches of a file
+        if self.treeview.identify_element(event.x, event.y) != "Treeitem.indicator":  # type: ignore[no-untyped-call]
+            self._open_selected()
+
+    def _open_selected(self, junk: object = None) -> None:
+        try:
+            [item_id] = self.treeview.selection()
+        except ValueError:
+            return
+        path, match = self._items[item_id]
+        open_result(path, match)
+
+    def _on_destroy(self, junk: object) -> None:
+        if self._poll_id is not None:
+            self.after_cancel(self._poll_id)
+            self._poll_id = None
+        if self._search is not None:
+            self._search.cancel()
+            self._search = None
+
+
+def open_result(path: Path, match: Optional[LineMatch]) -> None:
+    """Open a file, or select an existing tab of the file, and select the match in it."""
+    manager = get_tab_manager()
+    for tab in manager.tabs():
+        if isinstance(tab, tabs.FileTab) and tab.path == path:
+            manager.select(tab)
+            break
+    else:
+        try:
+            tab = manager.add_tab(tabs.FileTab.open_file(manager, path))
+        except (UnicodeError, OSError) as e:
+            log.exception(f"opening '{path}' failed")
+            utils.errordialog(type(e).__name__, "Opening failed!", traceback.format_exc())
+            return
+        assert isinstance(tab, tabs.FileTab)
+
+    if match is not None:
+        start = f"{match.lineno}.{match.column}"
+        end = f"{match.end_lineno}.{match.end_column}"
+        tab.textwidget.tag_remove("sel", "1.0", "end")
+        tab.textwidget.tag_add("sel", start, end)
+        tab.textwidget.mark_set("insert", start)
+        tab.textwidget.see(start)
+    tab.textwidget.focus()
+
+
+def _rebuild_index(index: _trigramindex.TrigramIndex) -> None:
+    ignored_paths = _get_ignored_paths(index.project_root, None)
+    files = []
+    for entry in _iter_files(index.project_root, ignored_paths):
+        try:
+            files.append((entry.path, entry.stat()))
+        except OSError:
+            pass  # file was deleted just now
+    index.delete()
+    index.update(files)
+    index.save()
+
+
+def _get_index_status_text(index: _trigramindex.TrigramIndex) -> str:
+    status = index.get_status()
+    min_files = settings.get("find_in_files_index_min_files", int)
+    if status.progress is not None:
+        done, total = status.progress
+        state = f"Indexing files: {done}/{total}"
+    elif not status.loaded:
+        state = "Loading..."
+    elif status.exists:
+        state = "Ready. Changed files are indexed again when searching."
+    elif not settings.get("find_in_files_index", bool):
+        state = "Not built. The index is disabled in Porcupine Settings."
+    else:
+        state = f"Not built. It's built when searching a project with at least {min_files} files."
+
+    return (
+        f"Project: {index.project_root}\n"
+        f"Status: {state}\n"
+        f"Indexed files: {status.file_count}\n"
+        f"Size on disk: {status.size_on_disk / 1024 / 1024:.1f} MB"
+    )
+
+
+def show_index_dialog(project_root: Path) -> None:
+    """Show the status of a project's search index, and let the user rebuild or delete it."""
+    index = _trigramindex.get_index(project_root)
+    threading.Thread(target=index.load, daemon=True).start()
+
+    dialog = tkinter.Toplevel()
+    dialog.title("Search Index")
+    dialog.transient(get_main_window())
+    content = ttk.Frame(dialog)
+    content.pack(fill="both", expand=True)
+
+    label = ttk.Label(content, justify="left")
+    label.pack(fill="both", expand=True, padx=10, pady=10)
+
+    def rebuild() -> None:
+        threading.Thread(target=_rebuild_index, args=[index], daemon=True).start()
+
+    buttonframe = ttk.Frame(content)
+    buttonframe.pack(fill="x", padx=10, pady=(0, 10))
+    ttk.Button(buttonframe, text="Rebuild", command=rebuild).pack(side="left", expand=True)
+    ttk.Button(buttonframe, text="Delete", command=index.delete).pack(side="left", expand=True)
+    ttk.Button(buttonframe, text="Close", command=dialog.destroy).pack(side="left", expand=True)
+
+    def update_label() -> None:
+        if dialog.winfo_exists():
+            label.config(text=_get_index_status_text(index))
+            dialog.after(200, update_label)
+
+    update_label()
+    dialog.wait_window()
+
+
+def _update_index_after_save(tab: tabs.FileTab, junk: object) -> None:
+    assert tab.path is not None
+    path = tab.path
+    for index in _trigramindex.get_loaded_indexes():
+        if index.project_root in path.parents and index.get_status().exists:
+            threading.Thread(
+                target=index.update, args=[[(str(path), path.stat())]], daemon=True
+            ).start()
+
+
+def _save_indexes(junk: object) -> None:
+    for index in _trigramindex.get_loaded_indexes():
+        index.save()
+
+
+def on_new_filetab(tab: tabs.FileTab) -> None:
+    tab.bind("<<AfterSave>>", partial(_update_index_after_save, tab), add=True)
+
+
+def find_in_project(tab: tabs.FileTab) -> None:
+    # New files that haven't been saved yet will probably go to the current directory
+    path = Path.cwd() / "new_file" if tab.path is None else tab.path
+    manager = get_tab_manager()
+    find_tab = manager.add_tab(FindInProjectTab(manager, utils.find_project_root(path)))
+    assert isinstance(find_tab, FindInProjectTab)
+
+    try:
+        selected_text = tab.textwidget.get("sel.first", "sel.last")
+    except tkinter.TclError:
+        selected_text = ""
+    if selected_text and "\n" not in selected_text:
+        find_tab.find_entry.delete(0, "end")
+        find_tab.find_entry.insert(0, selected_text)  # type: ignore[no-untyped-call]
+        find_tab.start_search()
+    find_tab.find_entry.focus()
+    find_tab.find_entry.selection_range(0, "end")  # type: ignore[no-untyped-call]
+
+
+def setup() -> None:
+    settings.add_option("find_in_files_index", True)
+    settings.add_option("find_in_files_index_min_files", 1000)
+    settings.add_checkbutton("find_in_files_index", text="Use an index to speed up Find in Project")
+    settings.add_spinbox(
+        "find_in_files_index_min_files",
+        "Index projects with at least this many files:",
+        from_=0,
+        to=1_000_000,
+    )
+
+    menubar.add_filetab_command("Edit/Find in Project", find_in_project)
+    get_tab_manager().add_filetab_callback(on_new_filetab)
+    # Changes from <<AfterSave>> are saved when Porcupine quits
+    get_main_window().bind("<<PorcupineQuit>>", _save_indexes, add=True)
@@ -1,247 +1,883 @@
 """Syntax highlighting."""
+from __future__ import annotations
 
-import itertools
+import abc
+import atexit
+import concurrent.futures
+import dataclasses
 import logging
 import time
 import tkinter
 from tkinter.font import Font
-from typing import Any, Callable, Dict, Generator, Iterator, List, Tuple, cast
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+    cast,
+)
 
 from pygments import styles, token  # type: ignore[import]
-from pygments.lexer import Lexer, LexerMeta, RegexLexer  # type: ignore[import]
+from pygments.lexer import ExtendedRegexLexer, Lexer, LexerMeta, RegexLexer  # type: ignore[import]
+
+from porcupine import (
+    _linetree,
+    _syntaxtree,
+    get_main_window,
+    get_tab_manager,
+    settings,
+    tabs,
+    textwidget,
+    utils,
+)
 
-from porcupine import get_tab_manager, settings, tabs, textwidget, utils
+log = logging.getLogger(__name__)
 
+# The part of the file that is not visible gets highlighted in small pieces
+# when Tk has nothing else to do, but not while the user is typing
+IDLE_HIGHLIGHT_SECONDS = 0.005
+TYPING_PAUSE_SECONDS = 0.5
+# Pygments regexes can look past the end of the view, e.g. to find where a
+# multiline comment ends, so the lexer gets this many lines after the view
+LEXER_LOOKAHEAD_LINES = 1000
+
+# One thread is enough, because Python code doesn't run in parallel anyway.
+# The point is to keep the GUI responsive while a slow lexer runs.
+_tokenizer_thread = concurrent.futures.ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="highlight"
+)
+
+
+# For comparing the two ways to highlight, see the log messages
+@dataclasses.dataclass
+class HighlightTimes:
+    count: int = 0
+    tokenize_seconds: float = 0
+    gui_blocked_seconds: float = 0
+
+
+highlight_times = {"main thread": HighlightTimes(), "separate thread": HighlightTimes()}
+
+
+# Stack of state names, e.g. ("root", "tdqs") inside a multiline Python string
+_LexerState = Tuple[str, ...]
+_ROOT_STATE: _LexerState = ("root",)
+
+
+# Returns the state that the lexer will be in after the token that was just
+# yielded, or None if it's not known.
+def _get_lexer_state(
+    lexer: Lexer, generator: Generator[Any, Any, Any], text: str, end_offset: int
+) -> Optional[_LexerState]:
+    # Only for subclasses of RegexLexer and ExtendedRegexLexer that don't
+    # override get_tokens_unprocessed
+    if type(lexer).get_tokens_unprocessed in (
+        RegexLexer.get_tokens_unprocessed,
+        ExtendedRegexLexer.get_tokens_unprocessed,
+    ):
+        # Use local variables inside the generator (ugly hack)
+        local_vars = generator.gi_frame.f_locals
+
+        # If new_state variable is not None, it will be used to change
+        # state after the yielding. The regex match can also continue after
+        # the token (e.g. bygroups).
+        match = local_vars.get("m")
+        if local_vars.get("new_state") is not None or match is None or match.end() != end_offset:
+            return None
+
+        if "ctx" in local_vars:
+            # ExtendedRegexLexer callbacks can change the stack after yielding
+            if not isinstance(local_vars["action"], token._TokenType):
+                return None
+            return tuple(local_vars["ctx"].stack)
+        return tuple(local_vars["statestack"])
+
+    # Start of line and not indentation or blank line
+    if text[end_offset : end_offset + 1].strip():
+        return _ROOT_STATE
+    return None
+
+
+def _count_root_states(lines: List[Optional[_LexerState]]) -> int:
+    return lines.count(_ROOT_STATE)
+
+
+# Each line has the lexer state at the start of the line, or None if it's not
+# known. They are called checkpoints here. Changing the text only needs to
+# update the changed lines.
+#
+# Highlighting restarts at a checkpoint in root state. Restarting in other
+# states would give wrong results, because pygments regexes can look past the
+# end of the line. For example, when adding ''' to the end of a Python
+# docstring, the opening ''' must be lexed again. Other checkpoints are used
+# for finding where highlighting can stop.
+class _CheckpointIndex:
+    def __init__(self, line_count: int) -> None:
+        lines: List[Optional[_LexerState]] = [None] * line_count
+        lines[0] = _ROOT_STATE  # Lexing always starts in root state
+        self._lines = _linetree.SummedLines(lines, _count_root_states)
+
+    def apply_change(self, change: textwidget.Change) -> None:
+        start_line = change.start[0]
+        end_line = change.end[0]
+        # Start of first line is not affected
+        new_lines: List[Optional[_LexerState]] = [self._lines[start_line - 1]]
+        new_lines += [None] * change.new_text.count("\n")
+        self._lines.replace_lines(start_line - 1, end_line, new_lines)
+
+    def find_root_state(self, lineno: int) -> int:
+        """Return the last line before or at the given line that starts in root state."""
+        chunk_index, chunk_start = self._lines.find_chunk(lineno - 1)
+        chunk = self._lines.chunks[chunk_index][: lineno - chunk_start]
+        while True:
+            for index in reversed(range(len(chunk))):
+                if chunk[index] == _ROOT_STATE:
+                    return chunk_start + index + 1
+
+            # Line 1 is always in root state, so there is always a previous chunk
+            root_states_before = self._lines.sum_before(chunk_index)
+            chunk_index, junk = self._lines.find_chunk_by_summary(root_states_before - 1)
+            chunk_start = self._lines.find_chunk_start(chunk_index)
+            chunk = self._lines.chunks[chunk_index]
+
+    def get_lines(self, start: int, end: int) -> Dict[int, _LexerState]:
+        """Return checkpoint lines between start and end (inclusive) and their states."""
+        result = {}
+        for lineno in range(start, min(end, len(self._lines)) + 1):
+            state = self._lines[lineno - 1]
+            if state is not None:
+                result[lineno] = state
+        return result
+
+    def set_lines(self, start: int, end: int, checkpoints: Dict[int, _LexerState]) -> None:
+        """Replace checkpoints after start line and until end line (inclusive)."""
+        end = min(end, len(self._lines))
+        if end > start:
+            new_lines = [checkpoints.get(lineno) for lineno in range(start + 1, end + 1)]
+            self._lines.replace_lines(start, end, new_lines)
+
+    def get_root_state_count(self) -> int:
+        return self._lines.get_summary()
+
+
+@dataclasses.dataclass
+class _HighlightResult:
+    end: Tuple[int, int]
+    tag_locations: Dict[str, List[str]]
+    checkpoints: Dict[int, _LexerState]
+    converged: bool  # True if the rest of the text didn't need highlighting
+    tokenize_seconds: float
+
+
+# Doesn't use tkinter, so that this can run in a separate thread
+@dataclasses.dataclass
+class _HighlightJob:
+    lexer: Lexer
+    text: str  # from start line to a bit after end of view
+    start_line: int  # starts in root state
+    first_possible_end: Tuple[int, int]
+    end_of_view: Tuple[int, int]
+    old_checkpoints: Dict[int, _LexerState]  # between first possible end and end of view
+    # Stop at the first line starting in root state after running this long
+    max_seconds: Optional[float] = None
+
+    def run(self) -> _HighlightResult:
+        start_time = time.perf_counter()
+        lineno = self.start_line
+        column = 0
+        locations_by_tokentype: Dict[Any, List[str]] = {}
+        checkpoints = {}
+
+        # Adjacent tokens of the same type are tagged all at once. Index
+        # strings are created only where the token type changes.
+        run_tokentype: Any = None
+        run_start = ""
+        converged = False
+
+        generator = self.lexer.get_tokens_unprocessed(self.text)
+        for position, tokentype, text in generator:
+            if tokentype is not run_tokentype:
+                token_start = f"{lineno}.{column}"
+                if run_tokentype is not None:
+                    locations_by_tokentype.setdefault(run_tokentype, []).extend(
+                        [run_start, token_start]
+                    )
+                run_tokentype = tokentype
+                run_start = token_start
 
-def _list_all_token_types(tokentype: Any) -> Iterator[Any]:
-    yield tokentype
-    for sub in map(_list_all_token_types, tokentype.subtypes):
-        yield from sub
+            newline_count = text.count("\n")
+            if newline_count != 0:
+                lineno += newline_count
+                column = len(text.rsplit("\n", 1)[-1])
+            else:
+                column += len(text)
 
+            if column == 0:
+                state = _get_lexer_state(self.lexer, generator, self.text, position + len(text))
+                if state is not None:
+                    checkpoints[lineno] = state
+                    # If the lexer was in the same state here before, the
+                    # rest is highlighted already
+                    old_state = self.old_checkpoints.get(lineno)
+                    if (lineno, column) >= self.first_possible_end and old_state == state:
+                        converged = True
+                        break
+
+                    # Next time, highlighting can start from this line
+                    if (
+                        self.max_seconds is not None
+                        and state == _ROOT_STATE
+                        and time.perf_counter() - start_time > self.max_seconds
+                    ):
+                        break
+
+            if (lineno, column) > self.end_of_view:
+                break
 
-all_token_tags = set(map(str, _list_all_token_types(token.Token)))
-log = logging.getLogger(__name__)
-ROOT_STATE_MARK_PREFIX = "highlight_root_"
-root_mark_names = (ROOT_STATE_MARK_PREFIX + str(n) for n in itertools.count())
+        if run_tokentype is not None:
+            locations_by_tokentype.setdefault(run_tokentype, []).extend(
+                [run_start, f"{lineno}.{column}"]
+            )
 
+        # str(tokentype) is slow, so it's done once for each token type
+        tag_locations = {
+            str(tokentype): places for tokentype, places in locations_by_tokentype.items()
+        }
+        return _HighlightResult(
+            (lineno, column),
+            tag_locations,
+            checkpoints,
+            converged,
+            time.perf_counter() - start_time,
+        )
 
-class Highlighter:
-    def __init__(self, text: tkinter.Text) -> None:
-        self.textwidget = text
-        self._lexer: Lexer | None = None
 
-        # the tags use fonts from here
-        self._fonts: Dict[Tuple[bool, bool], Font] = {}
+def _retag(
+    textwidget: tkinter.Text,
+    tags_to_remove: Iterable[str],
+    ranges: List[Tuple[str, str]],
+    tag_locations: Dict[str, List[str]],
+) -> None:
+    # Calling tag_add and tag_remove separately for each tag is slow, because
+    # every call goes from Python to Tcl. Token names and indexes contain only
+    # letters, numbers and dots, so they don't need quoting in the Tcl script.
+    widget = str(textwidget)
+    all_ranges = " ".join(f"{start} {end}" for start, end in ranges)
+    script = [f"{widget} tag remove {tag} {all_ranges}" for tag in tags_to_remove]
+    script.extend(
+        f"{widget} tag add {tag} {' '.join(places)}" for tag, places in tag_locations.items()
+    )
+    textwidget.tk.eval("\n".join(script))
+
+
+# All tabs use the same fonts and tag options. When the font changes, Tk
+# updates every tag that uses these fonts, and the options of each pygments
+# style are computed only once.
+_fonts: Dict[Tuple[bool, bool], Font] = {}
+_font_options: Dict[str, Any] = {}
+_style_scripts: Dict[str, str] = {}
+atexit.register(_fonts.clear)
+atexit.register(_style_scripts.clear)
+
+
+def _update_fonts() -> None:
+    font_options = cast(Dict[str, Any], Font(name="TkFixedFont", exists=True).actual())
+    del font_options["weight"]  # ignore boldness
+    del font_options["slant"]  # ignore italicness
+
+    if not _fonts:
         for bold in (True, False):
             for italic in (True, False):
-                # the fonts will be updated later, see _config_changed()
-                self._fonts[(bold, italic)] = Font(
+                _fonts[(bold, italic)] = Font(
                     weight=("bold" if bold else "normal"), slant=("italic" if italic else "roman")
                 )
+    elif font_options == _font_options:
+        # Already updated for another tab
+        return
+
+    _font_options.clear()
+    _font_options.update(font_options)
+    for font in _fonts.values():
+        font.configure(**font_options)
+
+
+# Returns a Tcl lambda that takes a text widget as an argument and configures
+# the token tags in it
+def _get_style_script(style_name: str) -> str:
+    if style_name in _style_scripts:
+        return _style_scripts[style_name]
+
+    if not _fonts:
+        _update_fonts()
+
+    # http://pygments.org/docs/formatterdevelopment/#styles
+    # all styles seem to yield all token types when iterated over,
+    # so we should always end up with the same tags configured
+    lines = []
+    for tokentype, infodict in styles.get_style_by_name(style_name):
+        # this doesn't use underline and border
+        # i don't like random underlines in my code and i don't know
+        # how to implement the border with tkinter
+        tag = str(tokentype)
+        font = _fonts[(infodict["bold"], infodict["italic"])]
+        # empty string resets foreground
+        foreground = "{}" if infodict["color"] is None else "#" + infodict["color"]
+        background = "{}" if infodict["bgcolor"] is None else "#" + infodict["bgcolor"]
+        lines.append(
+            f"$w tag configure {tag} -font {font} -foreground {foreground} -background {background}"
+        )
+        # make sure that the selection tag takes precedence over our token tag
+        lines.append(f"$w tag lower {tag} sel")
 
-        self.textwidget.bind("<<SettingChanged:font_family>>", self._font_changed, add=True)
-        self.textwidget.bind("<<SettingChanged:font_size>>", self._font_changed, add=True)
-        self.textwidget.bind("<<SettingChanged:pygments_style>>", self._style_changed, add=True)
-        self._font_changed()
-        self._style_changed()
-
-    def _font_changed(self, junk: object = None) -> None:
-        font_updates = cast(Dict[str, Any], Font(name="TkFixedFont", exists=True).actual())
-        del font_updates["weight"]  # ignore boldness
-        del font_updates["slant"]  # ignore italicness
-
-        for (bold, italic), font in self._fonts.items():
-            # fonts don't have an update() method
-            for key, value in font_updates.items():
-                font[key] = value
-
-    def _style_changed(self, junk: object = None) -> None:
-        # http://pygments.org/docs/formatterdevelopment/#styles
-        # all styles seem to yield all token types when iterated over,
-        # so we should always end up with the same tags configured
-        style = styles.get_style_by_name(settings.get("pygments_style", str))
-        for tokentype, infodict in style:
-            # this doesn't use underline and border
-            # i don't like random underlines in my code and i don't know
-            # how to implement the border with tkinter
-            self.textwidget.tag_config(
-                str(tokentype),
-                font=self._fonts[(infodict["bold"], infodict["italic"])],
-                # empty string resets foreground
-                foreground=("" if infodict["color"] is None else "#" + infodict["color"]),
-                background=("" if infodict["bgcolor"] is None else "#" + infodict["bgcolor"]),
-            )
+    script = "apply {w {\n" + "\n".join(lines) + "\n}}"
+    _style_scripts[style_name] = script
+    return script
 
-            # make sure that the selection tag takes precedence over our
-            # token tag
-            self.textwidget.tag_lower(str(tokentype), "sel")
 
-    # yields marks backwards, from end to start
-    def _get_root_marks(self, start: str = "1.0", end: str = "end") -> Iterator[str]:
-        mark = None
-        while True:
-            # When stepping backwards, end seems to be excluded. We want to include it.
-            mark = self.textwidget.mark_previous(mark or f"{end} + 1 char")
-            if mark is None or self.textwidget.compare(mark, "<", start):
-                break
-            if mark.startswith(ROOT_STATE_MARK_PREFIX):
-                yield mark
+class HighlighterBackend(abc.ABC):
+    """Base class for the different ways to highlight a text widget.
 
-    def _index_is_marked(self, index: str) -> bool:
-        try:
-            next(self._get_root_marks(index, index))
-        except StopIteration:
-            return False
-        return True
-
-    def _detect_root_state(self, generator: Generator[Any, Any, Any], end_location: str) -> bool:
-        # Only for subclasses of RegexLexer that don't override get_tokens_unprocessed
-        # TODO: support ExtendedRegexLexer's context thing
-        assert self._lexer is not None
-        if type(self._lexer).get_tokens_unprocessed == RegexLexer.get_tokens_unprocessed:
-            # Use local variables inside the generator (ugly hack)
-            local_vars = generator.gi_frame.f_locals
-
-            # If new_state variable is not None, it will be used to change
-            # state after the yielding, and this is not a suitable place for
-            # restarting the highlighting later.
-            return (
-                local_vars["statestack"] == ["root"] and local_vars.get("new_state", None) is None
-            )
+    The ``syntax_highlighter`` filetype option chooses the subclass that is
+    used. Subclasses must implement :meth:`set_lexer`, :meth:`on_change` and
+    :meth:`highlight_visible`.
+    """
 
-        # Start of line (column zero) and not indentation or blank line
-        return end_location.endswith(".0") and bool(self.textwidget.get(end_location).strip())
+    def __init__(self, text: tkinter.Text) -> None:
+        self.textwidget = text
+        # Token tags that may be somewhere in the text widget
+        self._added_tags: Set[str] = set()
+        # True when the tab is not selected. Changes are then only recorded,
+        # and they get highlighted when show() is called.
+        self.hidden = False
+        self.on_font_changed()
+        self.on_style_changed()
+
+    def on_font_changed(self) -> None:
+        _update_fonts()
+
+    def on_style_changed(self) -> None:
+        script = _get_style_script(settings.get("pygments_style", str))
+        self.textwidget.tk.eval(f"{script} {self.textwidget}")
+
+    def _retag(self, ranges: List[Tuple[str, str]], tag_locations: Dict[str, List[str]]) -> None:
+        _retag(self.textwidget, self._added_tags, ranges, tag_locations)
+        self._added_tags.update(tag_locations.keys())
+
+    def close(self) -> None:
+        """Remove all highlighting. Called before switching to another backend."""
+        self._retag([("1.0", "end")], {})
+        self._added_tags.clear()
+
+    @abc.abstractmethod
+    def set_lexer(self, lexer: Lexer) -> None:
+        pass
 
-    def highlight_range(self, last_possible_start: str, first_possible_end: str = "end") -> None:
-        start_time = time.perf_counter()
+    @abc.abstractmethod
+    def on_change(self, event: utils.EventWithData) -> None:
+        pass
 
-        assert self._lexer is not None
-        start = self.textwidget.index(next(self._get_root_marks(end=last_possible_start), "1.0"))
-        lineno, column = map(int, start.split("."))
+    @abc.abstractmethod
+    def highlight_visible(self) -> None:
+        pass
 
-        end_of_view = self.textwidget.index("@0,10000")
-        if self.textwidget.compare(first_possible_end, ">", end_of_view):
-            first_possible_end = end_of_view
+    def on_scroll(self) -> None:
+        self.highlight_visible()
 
-        tag_locations: Dict[str, List[str]] = {}
-        mark_locations = [start]
+    def show(self) -> None:
+        """Highlight the changes that happened while :attr:`hidden` was True."""
+        self.hidden = False
+        self.on_scroll()
 
-        # The one time where tk's magic trailing newline is helpful! See #436.
-        generator = self._lexer.get_tokens_unprocessed(self.textwidget.get(start, "end"))
-        for position, tokentype, text in generator:
-            token_start = f"{lineno}.{column}"
-            newline_count = text.count("\n")
-            if newline_count != 0:
-                lineno += newline_count
-                column = len(text.rsplit("\n", 1)[-1])
-            else:
-                column += len(text)
-            token_end = f"{lineno}.{column}"
-            tag_locations.setdefault(str(tokentype), []).extend([token_start, token_end])
-
-            # We place marks where highlighting may begin.
-            # You can't start highlighting anywhere, such as inside a multiline string or comment.
-            # The tokenizer is at root state when tokenizing starts.
-            # So it has to be in root state for placing a mark.
-            if self._detect_root_state(generator, token_end):
-                if lineno >= int(mark_locations[-1].split(".")[0]) + 10:
-                    mark_locations.append(token_end)
-                if self.textwidget.compare(
-                    f"{lineno}.{column}", ">=", first_possible_end
-                ) and self._index_is_marked(token_end):
-                    break
-
-            if self.textwidget.compare(token_end, ">", end_of_view):
-                break
 
-        end = f"{lineno}.{column}"
-        for tag in all_token_tags:
-            self.textwidget.tag_remove(tag, start, end)
-        for tag, places in tag_locations.items():
-            self.textwidget.tag_add(tag, *places)
+class Highlighter(HighlighterBackend):
+    """Highlights the visible part of the text with a pygments lexer.
 
-        marks_to_unset = []
-        for mark in self._get_root_marks(start, end):
-            try:
-                mark_locations.remove(self.textwidget.index(mark))
-            except ValueError:
-                marks_to_unset.append(mark)
-        self.textwidget.mark_unset(*marks_to_unset)
+    The rest of the text is highlighted in small pieces when Tk is idle.
+    """
+
+    def __init__(self, text: tkinter.Text) -> None:
+        super().__init__(text)
+        self._lexer: Lexer | None = None
+        self._closed = False
+
+        # Incremented when the text changes, so that results from the
+        # tokenizer thread can be ignored if they are outdated
+        self._version = 0
+        self._future: Optional[concurrent.futures.Future[_HighlightResult]] = None
+        self._future_version = 0
+        self._checkpoints = _CheckpointIndex(self._get_line_count())
+
+        # Text after this mark may be highlighted wrong or not at all
+        self.textwidget.mark_set("highlight_stale_start", "1.0")
+        self.textwidget.mark_gravity("highlight_stale_start", "left")
+        self._idle_highlighting_scheduled = False
+        self._last_change_time = 0.0
+
+    def _get_line_count(self) -> int:
+        return textwidget.get_mirror(self.textwidget).get_line_count()
+
+    def _parse_index(self, index: str) -> Tuple[int, int]:
+        lineno, column = map(int, self.textwidget.index(index).split("."))
+        return (lineno, column)
+
+    def _create_job(
+        self, last_possible_start: str, first_possible_end: str, end_of_view_index: str = "@0,10000"
+    ) -> _HighlightJob:
+        assert self._lexer is not None
+        start_line = self._checkpoints.find_root_state(self._parse_index(last_possible_start)[0])
+        end_of_view = self._parse_index(end_of_view_index)
+        first_possible_end_tuple = min(self._parse_index(first_possible_end), end_of_view)
+        old_checkpoints = self._checkpoints.get_lines(
+            first_possible_end_tuple[0], end_of_view[0] + 1
+        )
 
-        for mark_index in mark_locations:
-            self.textwidget.mark_set(next(root_mark_names), mark_index)
+        mirror = textwidget.get_mirror(self.textwidget)
+        line_count = mirror.get_line_count()
+        if end_of_view[0] > line_count:
+            # Highlighting until the end when idle. The text from get_all()
+            # is reused until the text changes.
+            text = mirror.get_all()[mirror.index_to_offset(start_line, 0) :]
+        else:
+            # Don't join all lines of a big file on every keystroke
+            last_line = min(end_of_view[0] + LEXER_LOOKAHEAD_LINES, line_count)
+            text = mirror.get((start_line, 0), (last_line, len(mirror.get_line(last_line))))
+        # The one time where tk's magic trailing newline is helpful! See #436.
+        text += "\n"
+        return _HighlightJob(
+            self._lexer, text, start_line, first_possible_end_tuple, end_of_view, old_checkpoints
+        )
+
+    def _apply_result(self, job: _HighlightJob, result: _HighlightResult) -> None:
+        start = f"{job.start_line}.0"
+        end = f"{result.end[0]}.{result.end[1]}"
+        self._retag([(start, end)], result.tag_locations)
+
+        self._checkpoints.set_lines(job.start_line, result.end[0], result.checkpoints)
+        log.debug(
+            f"Highlighted between {start} and {end},"
+            f" {self._checkpoints.get_root_state_count()} lines start in root state"
+        )
 
-        mark_count = len(list(self._get_root_marks("1.0", "end")))
+        stale_start = self._parse_index("highlight_stale_start")
+        if result.converged:
+            # Highlighting after the end didn't change
+            if (job.start_line, 0) <= stale_start < result.end:
+                self.textwidget.mark_set("highlight_stale_start", end)
+        else:
+            # Highlighting after the end may be wrong
+            if stale_start >= (job.start_line, 0):
+                self.textwidget.mark_set("highlight_stale_start", end)
+        self._schedule_idle_highlighting()
+
+    def _schedule_idle_highlighting(self, delay_ms: Optional[int] = None) -> None:
+        if self._idle_highlighting_scheduled or self.textwidget.compare(
+            "highlight_stale_start", ">=", "end - 1 char"
+        ):
+            return
+
+        self._idle_highlighting_scheduled = True
+        if delay_ms is None:
+            utils.run_when_idle(self.textwidget, self._highlight_when_idle)
+        else:
+            get_main_window().after(delay_ms, self._highlight_when_idle)
+
+    def _highlight_when_idle(self) -> None:
+        self._idle_highlighting_scheduled = False
+        if self._closed or self.hidden or not self.textwidget.winfo_exists() or self._lexer is None:
+            # show() schedules this again if needed
+            return
+
+        typing_pause_left = self._last_change_time + TYPING_PAUSE_SECONDS - time.monotonic()
+        if typing_pause_left > 0:
+            self._schedule_idle_highlighting(round(typing_pause_left * 1000))
+        elif self._future is not None:
+            # Wait until highlighting in thread is done
+            self._schedule_idle_highlighting(10)
+        else:
+            job = self._create_job("highlight_stale_start", "end", "end")
+            job.max_seconds = IDLE_HIGHLIGHT_SECONDS
+            self._apply_result(job, job.run())
+
+    def _log_times(self, mode: str, tokenize_seconds: float, gui_blocked_seconds: float) -> None:
+        times = highlight_times[mode]
+        times.count += 1
+        times.tokenize_seconds += tokenize_seconds
+        times.gui_blocked_seconds += gui_blocked_seconds
+
+        averages = ", ".join(
+            f"{mode}: {round(times.gui_blocked_seconds / times.count * 1000, 1)}ms"
+            for mode, times in highlight_times.items()
+            if times.count != 0
+        )
         log.debug(
-            f"Highlighted between {start} and {end} in"
-            f" {round((time.perf_counter() - start_time)*1000)}ms. Root state marks:"
-            f" {len(marks_to_unset)} deleted, {len(mark_locations)} added, {mark_count} total"
+            f"Tokenizing in {mode} took {round(tokenize_seconds * 1000)}ms,"
+            f" GUI was blocked for {round(gui_blocked_seconds * 1000)}ms."
+            f" Average GUI blocking time: {averages}"
         )
 
-    def highlight_visible(self, junk: object = None) -> None:
+    def highlight_range(self, last_possible_start: str, first_possible_end: str = "end") -> None:
+        if settings.get("highlight_in_thread", bool):
+            self._request_highlighting_in_thread(last_possible_start, first_possible_end)
+            return
+
+        start_time = time.perf_counter()
+        job = self._create_job(last_possible_start, first_possible_end)
+        result = job.run()
+        self._apply_result(job, result)
+        self._log_times("main thread", result.tokenize_seconds, time.perf_counter() - start_time)
+
+    # The requested range is stored in marks, so that it stays correct when
+    # the text changes while tokenizing
+    def _request_highlighting_in_thread(
+        self, last_possible_start: str, first_possible_end: str
+    ) -> None:
+        if "highlight_pending_start" in self.textwidget.mark_names():
+            if self.textwidget.compare(last_possible_start, "<", "highlight_pending_start"):
+                self.textwidget.mark_set("highlight_pending_start", last_possible_start)
+            if self.textwidget.compare(first_possible_end, ">", "highlight_pending_end"):
+                self.textwidget.mark_set("highlight_pending_end", first_possible_end)
+        else:
+            self.textwidget.mark_set("highlight_pending_start", last_possible_start)
+            self.textwidget.mark_set("highlight_pending_end", first_possible_end)
+            self.textwidget.mark_gravity("highlight_pending_start", "left")
+
+        if self._future is None:
+            self._start_thread_job()
+
+    def _start_thread_job(self) -> None:
+        start_time = time.perf_counter()
+        for name in ["start", "end"]:
+            self.textwidget.mark_set(f"highlight_running_{name}", f"highlight_pending_{name}")
+        self.textwidget.mark_gravity("highlight_running_start", "left")
+        self.textwidget.mark_unset("highlight_pending_start", "highlight_pending_end")
+
+        job = self._create_job("highlight_running_start", "highlight_running_end")
+        self._future = _tokenizer_thread.submit(job.run)
+        self._future_version = self._version
+        self._gui_blocked_seconds = time.perf_counter() - start_time
+        get_main_window().after(10, self._check_thread_job, job)
+
+    def _check_thread_job(self, job: _HighlightJob) -> None:
+        if self._closed or not self.textwidget.winfo_exists():
+            return
+
+        assert self._future is not None
+        if not self._future.done():
+            get_main_window().after(10, self._check_thread_job, job)
+            return
+
+        future = self._future
+        self._future = None
+        running_start = self.textwidget.index("highlight_running_start")
+        running_end = self.textwidget.index("highlight_running_end")
+        self.textwidget.mark_unset("highlight_running_start", "highlight_running_end")
+
+        if self._lexer is not job.lexer:
+            # set_lexer() was called, it highlights again
+            pass
+        elif self._version != self._future_version:
+            # Text changed while tokenizing, result is outdated
+            self._request_highlighting_in_thread(running_start, running_end)
+        else:
+            try:
+                result = future.result()
+            except Exception:
+                log.exception("highlighting failed")
+            else:
+                start_time = time.perf_counter()
+                self._apply_result(job, result)
+                self._log_times(
+                    "separate thread",
+                    result.tokenize_seconds,
+                    self._gui_blocked_seconds + time.perf_counter() - start_time,
+                )
+
+        if self._future is None and "highlight_pending_start" in self.textwidget.mark_names():
+            self._start_thread_job()
+
+    def close(self) -> None:
+        self._closed = True
+        for mark in self.textwidget.mark_names():
+            if mark.startswith("highlight_"):
+                self.textwidget.mark_unset(mark)
+        super().close()
+
+    def highlight_visible(self) -> None:
         self.highlight_range(self.textwidget.index("@0,0"))
 
+    def on_scroll(self) -> None:
+        # Usually the new view was highlighted already when Tk was idle
+        if self.textwidget.compare("@0,10000 lineend", ">=", "highlight_stale_start"):
+            self.highlight_visible()
+
     def set_lexer(self, lexer: Lexer) -> None:
-        self.textwidget.mark_unset(*self._get_root_marks("1.0", "end"))
+        self._checkpoints = _CheckpointIndex(self._get_line_count())
+        self.textwidget.mark_set("highlight_stale_start", "1.0")
         self._lexer = lexer
         self.highlight_visible()
 
     def on_change(self, event: utils.EventWithData) -> None:
+        self._version += 1
+        self._last_change_time = time.monotonic()
         change_list = event.data_class(textwidget.Changes).change_list
-        if len(change_list) == 1:
+        for change in change_list:
+            self._checkpoints.apply_change(change)
+        if len(change_list) == 1 and not self.hidden:
             [change] = change_list
             if len(change.new_text) <= 1:
                 # Optimization for typical key strokes (but not for reloading entire file):
                 # only highlight the area that might have changed
                 self.highlight_range(f"{change.start[0]}.0", f"{change.end[0]}.0 lineend")
                 return
-        self.highlight_visible()
 
+        # Changes outside the view get highlighted later
+        lineno, column = min(change.start for change in change_list)
+        if self.textwidget.compare(f"{lineno}.{column}", "<", "highlight_stale_start"):
+            self.textwidget.mark_set("highlight_stale_start", f"{lineno}.{column}")
+        if not self.hidden:
+            self.highlight_visible()
+
+    def show(self) -> None:
+        super().show()
+        self._schedule_idle_highlighting()
+
+
+# Converts offsets to Tk indexes. Much faster than calling offset_to_index()
+# for each offset, but the offsets must be given in increasing order.
+def _offset_converter(mirror: textwidget.TextMirror) -> Callable[[int], str]:
+    lineno = 0
+    line_start = 0
+    line_end = 0
+    lines: Iterator[Tuple[int, str]] = iter([])
+
+    def convert(offset: int) -> str:
+        nonlocal lineno, line_start, line_end, lines
+        # Going through lines one by one is faster, unless the offset is far away
+        if lineno == 0 or offset > line_end + 1000:
+            lineno, column = mirror.offset_to_index(offset)
+            line_start = offset - column
+            lines = mirror.iter_lines(lineno)
+            line_end = line_start + len(next(lines)[1])
+        while offset > line_end:
+            lineno, line = next(lines)
+            line_start = line_end + 1
+            line_end = line_start + len(line)
+        return f"{lineno}.{offset - line_start}"
+
+    return convert
+
+
+class IncrementalHighlighter(HighlighterBackend):
+    """Highlights the whole text with a parser from :mod:`porcupine._syntaxtree`.
+
+    When the text changes, only the changed part and the syntax tree nodes
+    around it are parsed again. Tags on the rest of the text are already
+    correct, because Tk moves them along with the text.
+    """
+
+    def __init__(self, text: tkinter.Text, parser_class: Type[_syntaxtree.Parser]) -> None:
+        super().__init__(text)
+        self.parser_class = parser_class
+        self._parser = parser_class()
+        self._char_count = 0
+        self._hidden_changes: List[textwidget.Change] = []
+        # True if the parser can't handle the text, see on_new_filetab()
+        self.failed = False
+
+    def _highlight(self, edit: Optional[_syntaxtree.Edit]) -> None:
+        start_time = time.perf_counter()
+        mirror = textwidget.get_mirror(self.textwidget)
+        text: Union[str, _syntaxtree.LazyText]
+        if edit is None:
+            text = mirror.get_all()
+        else:
+            # Usually only a small part of the text gets parsed again
+            text = _syntaxtree.LazyText(mirror.get_char_count(), mirror.get_by_offsets)
+        try:
+            result = self._parser.parse(text, edit)
+        except RecursionError:
+            # The parser recurses once for each level of nested brackets
+            log.warning("brackets nested too deeply, falling back to pygments highlighting")
+            self.failed = True
+            return
+        parse_seconds = time.perf_counter() - start_time
+
+        range_converter = _offset_converter(mirror)
+        ranges = [
+            (range_converter(start), range_converter(end)) for start, end in result.fresh_ranges
+        ]
+        token_converter = _offset_converter(mirror)
+        tag_locations: Dict[str, List[str]] = {}
+        for start, end, tokentype in result.tokens:
+            tag_locations.setdefault(tokentype, []).extend(
+                [token_converter(start), token_converter(end)]
+            )
+        self._retag(ranges, tag_locations)
+        self._char_count = mirror.get_char_count()
+
+        log.debug(
+            f"Parsed {sum(end - start for start, end in result.fresh_ranges)} characters"
+            f" of {self._char_count} in {round(parse_seconds * 1000)}ms,"
+            f" GUI was blocked for {round((time.perf_counter() - start_time) * 1000)}ms"
+        )
+
+    # The parser needs to know which part of the text changed
+    def _get_edit(self, change_list: List[textwidget.Change]) -> _syntaxtree.Edit:
+        mirror = textwidget.get_mirror(self.textwidget)
+        if len(change_list) == 1:
+            [change] = change_list
+            start = mirror.index_to_offset(*change.start)
+            return _syntaxtree.Edit(
+                start, start + change.old_text_len, start + len(change.new_text)
+            )
 
-# When scrolling, don't highlight too often. Makes scrolling smoother.
-def debounce(
-    any_widget: tkinter.Misc, function: Callable[[], None], ms_between_calls_min: int
-) -> Callable[[], None]:
-    timeout_scheduled = False
-    running_requested = False
-
-    def timeout_callback() -> None:
-        nonlocal timeout_scheduled, running_requested
-        assert timeout_scheduled
-        if running_requested:
-            function()
-            any_widget.after(ms_between_calls_min, timeout_callback)
-            running_requested = False
+        # Many changes at once, e.g. replace all. Find the lines before the
+        # first change and after the last change, and parse everything
+        # between them again.
+        first_changed_line = min(change.start[0] for change in change_list)
+        line_count = mirror.get_line_count()
+        unchanged_lines_at_end = line_count
+        for change in reversed(change_list):
+            # line_count is the number of lines right after this change
+            new_end_line = change.start[0] + change.new_text.count("\n")
+            unchanged_lines_at_end = min(unchanged_lines_at_end, line_count - new_end_line)
+            line_count -= new_end_line - change.end[0]
+
+        start = mirror.index_to_offset(first_changed_line, 0)
+        if unchanged_lines_at_end == 0:
+            new_end = mirror.get_char_count()
         else:
-            timeout_scheduled = False
+            new_end = mirror.index_to_offset(
+                mirror.get_line_count() - unchanged_lines_at_end + 1, 0
+            )
+        new_end = max(start, new_end)
+        old_end = max(start, self._char_count - (mirror.get_char_count() - new_end))
+        return _syntaxtree.Edit(start, old_end, new_end)
+
+    def set_lexer(self, lexer: Lexer) -> None:
+        # The lexer was used for choosing the parser, see on_new_filetab()
+        self._parser = self.parser_class()
+        self._hidden_changes.clear()
+        self._highlight(None)
 
-    def request_running() -> None:
-        nonlocal timeout_scheduled, running_requested
-        if timeout_scheduled:
-            running_requested = True
+    def on_change(self, event: utils.EventWithData) -> None:
+        change_list = event.data_class(textwidget.Changes).change_list
+        if self.hidden:
+            self._hidden_changes.extend(change_list)
         else:
-            assert not running_requested
-            function()
-            any_widget.after(ms_between_calls_min, timeout_callback)
-            timeout_scheduled = True
+            self._highlight(self._get_edit(change_list))
+
+    def show(self) -> None:
+        self.hidden = False
+        if self._hidden_changes:
+            self._highlight(self._get_edit(self._hidden_changes))
+            self._hidden_changes.clear()
 
-    return request_running
+    def highlight_visible(self) -> None:
+        pass  # everything is highlighted already
+
+    def on_scroll(self) -> None:
+        pass
+
+
+def _find_parser(lexer: Lexer) -> Optional[Type[_syntaxtree.Parser]]:
+    for alias in lexer.aliases:
+        if alias in _syntaxtree.PARSERS:
+            return _syntaxtree.PARSERS[alias]
+    return None
 
 
 def on_new_filetab(tab: tabs.FileTab) -> None:
-    # needed because pygments_lexer might change
-    def on_lexer_changed(junk: object = None) -> None:
-        highlighter.set_lexer(tab.settings.get("pygments_lexer", LexerMeta)())
-
-    highlighter = Highlighter(tab.textwidget)
-    tab.bind("<<TabSettingChanged:pygments_lexer>>", on_lexer_changed, add=True)
-    on_lexer_changed()
-    utils.bind_with_data(tab.textwidget, "<<ContentChanged>>", highlighter.on_change, add=True)
-    utils.add_scroll_command(
-        tab.textwidget, "yscrollcommand", debounce(tab, highlighter.highlight_visible, 100)
-    )
-    highlighter.highlight_visible()
+    tab.settings.add_option("syntax_highlighter", "pygments")
+    highlighter: Optional[HighlighterBackend] = None
+
+    # needed because pygments_lexer and syntax_highlighter might change
+    def on_lexer_changed() -> None:
+        nonlocal highlighter
+        lexer = tab.settings.get("pygments_lexer", LexerMeta)()
+        if tab.settings.get("syntax_highlighter", str) == "incremental":
+            parser_class = _find_parser(lexer)
+        else:
+            parser_class = None
+
+        if parser_class is None:
+            if not isinstance(highlighter, Highlighter):
+                if highlighter is not None:
+                    highlighter.close()
+                highlighter = Highlighter(tab.textwidget)
+        elif not (
+            isinstance(highlighter, IncrementalHighlighter)
+            and highlighter.parser_class is parser_class
+        ):
+            if highlighter is not None:
+                highlighter.close()
+            highlighter = IncrementalHighlighter(tab.textwidget, parser_class)
+        assert highlighter is not None
+        highlighter.hidden = False
+        highlighter.set_lexer(lexer)
+        fall_back_if_failed()
+
+    def fall_back_if_failed() -> None:
+        nonlocal highlighter
+        if isinstance(highlighter, IncrementalHighlighter) and highlighter.failed:
+            highlighter.close()
+            highlighter = Highlighter(tab.textwidget)
+            highlighter.set_lexer(tab.settings.get("pygments_lexer", LexerMeta)())
+
+    def show_changes() -> None:
+        if highlighter is not None:
+            highlighter.show()
+            fall_back_if_failed()
+
+    # Text changes in tabs that are not selected (e.g. reloading a file that
+    # was changed by git) get highlighted when the tab is selected
+    def on_change(event: utils.EventWithData) -> None:
+        if highlighter is not None:
+            if get_tab_manager().select() is not tab:
+                highlighter.hidden = True
+                tab.run_when_selected(show_changes)
+            highlighter.on_change(event)
+            fall_back_if_failed()
+
+    def on_font_changed(junk: object) -> None:
+        if highlighter is not None:
+            highlighter.on_font_changed()
+
+    def on_style_changed(junk: object) -> None:
+        if highlighter is not None:
+            highlighter.on_style_changed()
+
+    def on_scroll() -> None:
+        if highlighter is not None:
+            highlighter.on_scroll()
+
+    # When many tabs are opened at once, highlighting starts only when the
+    # tab is selected. Until then, the highlighter doesn't exist.
+    def lexer_changed_callback(junk: object) -> None:
+        tab.run_when_selected(on_lexer_changed)
+
+    tab.bind("<<TabSettingChanged:pygments_lexer>>", lexer_changed_callback, add=True)
+    tab.bind("<<TabSettingChanged:syntax_highlighter>>", lexer_changed_callback, add=True)
+    tab.run_when_selected(on_lexer_changed)
+    utils.bind_with_data(tab.textwidget, "<<ContentChanged>>", on_change, add=True)
+    tab.textwidget.bind("<<SettingChanged:font_family>>", on_font_changed, add=True)
+    tab.textwidget.bind("<<SettingChanged:font_size>>", on_font_changed, add=True)
+    tab.textwidget.bind("<<SettingChanged:pygments_style>>", on_style_changed, add=True)
+    # When scrolling, don't highlight too often. Makes scrolling smoother.
+    utils.add_scroll_command(tab.textwidget, "yscrollcommand", utils.throttle(tab, on_scroll, 100))
 
 
 def setup() -> None:
+    settings.add_option("highlight_in_thread", False)
+    settings.add_checkbutton(
+        "highlight_in_thread", text="Run syntax highlighting in a separate thread"
+    )
     get_tab_manager().add_filetab_callback(on_new_filetab)
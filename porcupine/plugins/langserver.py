@@ -395,7 +395,7 @@ class LangServer:
             lsp.TextDocumentItem(
                 uri=tab.path.as_uri(),
                 languageId=config.language_id,
-                text=tab.textwidget.get("1.0", "end - 1 char"),
+                text=textwidget.get_mirror(tab.textwidget).get_all(),
                 version=next(self._version_counter),
             )
         )
@@ -21,13 +21,9 @@ class LineNumbers(tkinter.Canvas):
 
         self._textwidget = textwidget_of_tab
         textwidget.use_pygments_theme(self, self._set_colors)
-        utils.add_scroll_command(textwidget_of_tab, "yscrollcommand", self.do_update)
+        utils.add_scroll_command(textwidget_of_tab, "yscrollcommand", self._schedule_update)
 
-        textwidget_of_tab.bind(
-            "<<ContentChanged>>",
-            lambda event: textwidget_of_tab.after_idle(self.do_update),
-            add=True,
-        )
+        textwidget_of_tab.bind("<<ContentChangedCoalesced>>", self._schedule_update, add=True)
         self.do_update()
 
         self.bind("<<SettingChanged:font_family>>", self._update_width, add=True)
@@ -44,6 +40,10 @@ class LineNumbers(tkinter.Canvas):
         self._text_color = fg
         self.itemconfig("all", fill=fg)
 
+    # Scrolling creates many events, but updating once is enough
+    def _schedule_update(self, junk: object = None) -> None:
+        utils.run_when_idle(self, self.do_update)
+
     def do_update(self, junk: object = None) -> None:
         self.delete("all")
 
@@ -25,45 +25,50 @@ def on_cursor_moved(event: tkinter.Event[tkinter.Text]) -> None:
     stack = [last_char]
 
     # Tkinter's .search() is slow when there are lots of tags from highlight plugin.
-    # See "PERFORMANCE ISSUES" in text widget manual page
+    # See "PERFORMANCE ISSUES" in text widget manual page. Getting all text
+    # before or after the cursor from Tcl would also be slow with big files.
+    mirror = textwidget.get_mirror(event.widget)
     if last_char in OPEN_TO_CLOSE.keys():
         backwards = False
-        text = event.widget.get("insert", "end - 1 char")
+        lines = mirror.iter_lines(cursor_line)
         regex = r"(?<!\\)[()\[\]{}]"
         mapping = CLOSE_TO_OPEN
     elif last_char in OPEN_TO_CLOSE.values():
         backwards = True
-        text = event.widget.get("1.0", "insert - 1 char")[::-1]
+        lines = mirror.iter_lines(cursor_line, backwards=True)
         regex = r"[()\[\]{}](?!\\)"
         mapping = OPEN_TO_CLOSE
     else:
         return
 
-    for match in re.finditer(regex, text):
-        char = match.group()
-        if char not in mapping:
-            assert char in mapping.values()
-            stack.append(char)
-            continue
-
-        if stack.pop() != mapping[char]:
-            return
-        if not stack:
+    for lineno, line in lines:
+        if lineno == cursor_line:
             if backwards:
-                lineno = 1 + text.count("\n", match.end())
-                if lineno == 1:
-                    column = len(text) - match.end()
-                else:
-                    column = text.index("\n", match.end()) - match.end()
+                line = line[: cursor_column - 1]
             else:
-                lineno = cursor_line + text.count("\n", 0, match.start())
-                if lineno == cursor_line:
+                line = line[cursor_column:]
+        if backwards:
+            line = line[::-1]
+
+        for match in re.finditer(regex, line):
+            char = match.group()
+            if char not in mapping:
+                assert char in mapping.values()
+                stack.append(char)
+                continue
+
+            if stack.pop() != mapping[char]:
+                return
+            if not stack:
+                if backwards:
+                    column = len(line) - match.end()
+                elif lineno == cursor_line:
                     column = cursor_column + match.start()
                 else:
-                    column = match.start() - text.rindex("\n", 0, match.start()) - 1
-            event.widget.tag_add("matching_paren", "insert - 1 char")
-            event.widget.tag_add("matching_paren", f"{lineno}.{column}")
-            break
+                    column = match.start()
+                event.widget.tag_add("matching_paren", "insert - 1 char")
+                event.widget.tag_add("matching_paren", f"{lineno}.{column}")
+                return
 
 
 def on_pygments_theme_changed(text: tkinter.Text, fg: str, bg: str) -> None:
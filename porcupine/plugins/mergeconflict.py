@@ -6,18 +6,17 @@ import tkinter
 import weakref
 from typing import Any, List, cast
 
-from porcupine import get_tab_manager, tabs, utils
+from porcupine import get_tab_manager, tabs, textwidget, utils
 from porcupine.plugins.linenumbers import LineNumbers
 
 setup_after = ["linenumbers"]
 
 
-def find_merge_conflicts(textwidget: tkinter.Text) -> List[List[int]]:
+def find_merge_conflicts(widget: tkinter.Text) -> List[List[int]]:
     result = []
     current_state = "outside"
 
-    for lineno in range(1, int(textwidget.index("end - 1 char").split(".")[0]) + 1):
-        line = textwidget.get(f"{lineno}.0", f"{lineno}.0 lineend")
+    for lineno, line in textwidget.get_mirror(widget).iter_lines():
         # Line might contain whitespace characters after '<<<<<<< '
         if line.startswith("<<<<<<< "):
             expected_current_state = "outside"
@@ -53,7 +53,11 @@ class MiniMap(tkinter.Text):
             "right": tkinter.Frame(self),
         }
 
-        utils.add_scroll_command(tab.textwidget, "yscrollcommand", self._scroll_callback)
+        utils.add_scroll_command(
+            tab.textwidget,
+            "yscrollcommand",
+            (lambda: utils.run_when_idle(self, self._scroll_callback)),
+        )
         self.bind("<Button-1>", self._on_click_and_drag, add=True)
         self.bind("<Button1-Motion>", self._on_click_and_drag, add=True)
 
@@ -186,9 +190,14 @@ class MiniMap(tkinter.Text):
 
 
 def on_new_filetab(tab: tabs.FileTab) -> None:
-    minimap = MiniMap(tab.right_frame, tab)
-    textwidget.use_pygments_theme(minimap, minimap.set_colors)
-    minimap.pack(fill="y", expand=True)
+    # Creating the peer widget copies all text and tags, so it's done only
+    # when the user looks at the tab
+    def create_minimap() -> None:
+        minimap = MiniMap(tab.right_frame, tab)
+        textwidget.use_pygments_theme(minimap, minimap.set_colors)
+        minimap.pack(fill="y", expand=True)
+
+    tab.run_when_selected(create_minimap)
 
 
 def setup() -> None:
@@ -1,24 +1,77 @@
 """Reload file from disk automatically."""
-from functools import partial
+from __future__ import annotations
 
-from porcupine import get_tab_manager, tabs
+import logging
+import pathlib
+import queue
+from typing import Dict, List, Set
 
+from porcupine import _filewatcher, get_main_window, get_tab_manager, tabs
 
-def reload_if_necessary(tab: tabs.FileTab, junk: object) -> None:
-    if tab.other_program_changed_file():
-        cursor_pos = tab.textwidget.index("insert")
-        scroll_fraction = tab.textwidget.yview()[0]  # type: ignore[no-untyped-call]
-        tab.reload()  # TODO: error handling?
-        tab.textwidget.mark_set("insert", cursor_pos)
-        tab.textwidget.yview_moveto(scroll_fraction)  # type: ignore[no-untyped-call]
+log = logging.getLogger(__name__)
 
+# Checking is done in the file watcher's thread, because it can involve
+# reading and hashing big files
+_tabs_by_path: Dict[pathlib.Path, List[tabs.FileTab]] = {}
+_changed_tabs: queue.Queue[tabs.FileTab] = queue.Queue()
 
-def on_new_filetab(tab: tabs.FileTab) -> None:
-    callback = partial(reload_if_necessary, tab)
-    tab.bind("<<TabSelected>>", callback, add=True)
-    tab.textwidget.bind("<FocusIn>", callback, add=True)
-    tab.textwidget.bind("<Button-1>", callback, add=True)
+
+def check_tabs(changed_paths: Set[pathlib.Path]) -> None:
+    for path in changed_paths:
+        for tab in _tabs_by_path.get(path, []):
+            if tab.other_program_changed_file():
+                _changed_tabs.put(tab)
+
+
+def _reload_tab(tab: tabs.FileTab) -> None:
+    # File was deleted or renamed, e.g. with 'git checkout'
+    if tab.path is None or not tab.path.exists():
+        return
+
+    cursor_pos = tab.textwidget.index("insert")
+    scroll_fraction = tab.textwidget.yview()[0]  # type: ignore[no-untyped-call]
+    try:
+        tab.reload()
+    except Exception:
+        log.exception(f"reloading '{tab.path}' failed")
+        return
+    tab.textwidget.mark_set("insert", cursor_pos)
+    tab.textwidget.yview_moveto(scroll_fraction)  # type: ignore[no-untyped-call]
+
+
+def reload_changed_tabs() -> None:
+    try:
+        while True:
+            try:
+                tab = _changed_tabs.get_nowait()
+            except queue.Empty:
+                break
+            if tab.winfo_exists():
+                _reload_tab(tab)
+    finally:
+        get_main_window().after(100, reload_changed_tabs)
+
+
+def update_watched_paths(watcher: _filewatcher.FileWatcher, junk: object = None) -> None:
+    global _tabs_by_path
+
+    tabs_by_path: Dict[pathlib.Path, List[tabs.FileTab]] = {}
+    for tab in get_tab_manager().tabs():
+        if isinstance(tab, tabs.FileTab) and tab.path is not None:
+            tabs_by_path.setdefault(tab.path, []).append(tab)
+
+    # Watcher thread only reads this, so it's enough to replace the whole dict
+    _tabs_by_path = tabs_by_path
+    watcher.set_paths(set(tabs_by_path.keys()))
 
 
 def setup() -> None:
+    watcher = _filewatcher.FileWatcher(check_tabs)
+
+    def on_new_filetab(tab: tabs.FileTab) -> None:
+        tab.bind("<<PathChanged>>", (lambda event: update_watched_paths(watcher)), add=True)
+        tab.bind("<Destroy>", (lambda event: update_watched_paths(watcher)), add=True)
+        update_watched_paths(watcher)
+
     get_tab_manager().add_filetab_callback(on_new_filetab)
+    reload_changed_tabs()
@@ -30,6 +30,8 @@ def setup() -> None:
     except FileNotFoundError:
         states = []
 
-    for tab_class, state in states:
+    # Selecting only the last tab means that other tabs don't highlight etc
+    # until the user selects them, see Tab.run_when_selected()
+    for index, (tab_class, state) in enumerate(states):
         tab = tab_class.from_state(get_tab_manager(), state)
-        get_tab_manager().add_tab(tab)
+        get_tab_manager().add_tab(tab, select=(index == len(states) - 1))
@@ -39,11 +39,15 @@ def _tag_spans_multiple_lines(textwidget: tkinter.Text, tag: str) -> bool:
 class _Underliner:
     def __init__(self, textwidget: tkinter.Text) -> None:
         self.textwidget = textwidget
-        self.textwidget.bind("<<CursorMoved>>", self._on_cursor_moved, add=True)
+        self.textwidget.bind("<<CursorMovedThrottled>>", self._on_cursor_moved, add=True)
         self.textwidget.bind("<<UnderlinerHidePopup>>", self._hide_message_label, add=True)
         self.textwidget.tag_bind("underline_common", "<Enter>", self._on_mouse_enter)
         self.textwidget.tag_bind("underline_common", "<Leave>", self._hide_message_label)
-        utils.add_scroll_command(textwidget, "yscrollcommand", self._hide_message_label)
+        utils.add_scroll_command(
+            textwidget,
+            "yscrollcommand",
+            (lambda: utils.run_when_idle(textwidget, self._hide_message_label)),
+        )
 
         self._message_label: Optional[tkinter.Label] = None
         self._message_tag: Optional[str] = None
@@ -75,8 +75,14 @@ def open_the_url(tab: tabs.FileTab, index: str, junk: object) -> utils.BreakOrNo
 
 
 def on_new_filetab(tab: tabs.FileTab) -> None:
-    tab.textwidget.bind("<<ContentChanged>>", partial(update_url_underlines, tab), add=True)
-    utils.add_scroll_command(tab.textwidget, "yscrollcommand", partial(update_url_underlines, tab))
+    # Many changes or scroll events in a row update only once
+    update = partial(update_url_underlines, tab)
+
+    def schedule_update(*junk: object) -> None:
+        utils.run_when_idle(tab.textwidget, update)
+
+    tab.textwidget.bind("<<ContentChangedCoalesced>>", schedule_update, add=True)
+    utils.add_scroll_command(tab.textwidget, "yscrollcommand", schedule_update)
     update_url_underlines(tab)
 
     tab.textwidget.tag_bind(
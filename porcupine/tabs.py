@@ -1,14 +1,19 @@
 r"""Tabs as in browser tabs, not \t characters."""
 from __future__ import annotations
 
-import collections
+import codecs
 import dataclasses
 import hashlib
 import importlib
+import io
 import itertools
 import logging
 import os
 import pathlib
+import queue
+import struct
+import threading
+import time
 import tkinter
 import traceback
 from tkinter import filedialog, messagebox, ttk
@@ -29,7 +34,7 @@ from typing import (
 from pygments.lexer import LexerMeta  # type: ignore[import]
 from pygments.lexers import TextLexer  # type: ignore[import]
 
-from porcupine import _state, settings, textwidget, utils
+from porcupine import _linetree, _mmapfile, _state, settings, textwidget, utils
 
 log = logging.getLogger(__name__)
 _flatten = itertools.chain.from_iterable
@@ -306,6 +311,9 @@ class Tab(ttk.Frame):
         self.left_frame.pack(side="left", fill="y")
         self.right_frame.pack(side="right", fill="y")
 
+        self._when_selected_callbacks: List[Callable[[], object]] = []
+        self.bind("<<TabSelected>>", self._run_when_selected_callbacks, add=True)
+
     @property
     def title_choices(self) -> Sequence[str]:
         return self._titles
@@ -317,6 +325,31 @@ class Tab(ttk.Frame):
         if self in self.master.tabs():
             self.master._update_tab_titles()
 
+    def run_when_selected(self, callback: Callable[[], object]) -> None:
+        """Run ``callback()`` now if the tab is selected, or later when it gets selected.
+
+        Use this for expensive things that are not needed before the user
+        looks at the tab, such as syntax highlighting. When many tabs are
+        opened at once (e.g. after restarting Porcupine), only the selected
+        tab does them right away.
+
+        If the same callback is passed in many times while the tab is not
+        selected, it runs only once when the tab gets selected.
+        """
+        if self.master.select() is self:
+            callback()
+        elif callback not in self._when_selected_callbacks:
+            self._when_selected_callbacks.append(callback)
+
+    def _run_when_selected_callbacks(self, junk: object) -> None:
+        callbacks = self._when_selected_callbacks
+        self._when_selected_callbacks = []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                log.exception("callback of run_when_selected() failed")
+
     def can_be_closed(self) -> bool:
         """
         This is usually called before the tab is closed. The tab
@@ -384,6 +417,273 @@ class _FileTabState(NamedTuple):
     cursor_pos: str
 
 
+# Lines are hashed with hash() and then combined into a polynomial hash: the
+# hash of n lines is sum(line_hashes[i] * BASE**(n-1-i)). Unlike md5 of the
+# whole text, this can be updated without looking at the lines that didn't
+# change, and it doesn't depend on how the lines are grouped into chunks.
+#
+# BASE is 2**64, so that the hash of a chunk can be calculated by packing 64-bit
+# line hashes into bytes and converting to int, without a slow Python loop.
+_HASH_MODULUS = 2 ** 61 - 1  # a prime
+
+
+def _hash_chunk(chunk: List[Optional[int]]) -> Tuple[int, int]:
+    packed = struct.pack(f">{len(chunk)}Q", *chunk)
+    return (int.from_bytes(packed, "big") % _HASH_MODULUS, pow(2, 64 * len(chunk), _HASH_MODULUS))
+
+
+def _combine_hashes(left: Tuple[int, int], right: Tuple[int, int]) -> Tuple[int, int]:
+    # (hash, BASE**line_count) pairs
+    left_hash, left_multiplier = left
+    right_hash, right_multiplier = right
+    return (
+        (left_hash * right_multiplier + right_hash) % _HASH_MODULUS,
+        (left_multiplier * right_multiplier) % _HASH_MODULUS,
+    )
+
+
+class _ContentHasher:
+    """Knows the hash of the text widget's content without getting all of it from Tcl.
+
+    This is fed with the changes of <<ContentChanged>> events, so it can be
+    out of date during a textwidget.change_batch().
+    """
+
+    def __init__(self, widget: tkinter.Text) -> None:
+        self._widget = widget
+        line_count = int(widget.index("end - 1 char").split(".")[0])
+        # None means that the line must be hashed again
+        self._lines: _linetree.ChunkedLines[
+            Optional[int], Tuple[int, int]
+        ] = _linetree.ChunkedLines([None] * line_count, _hash_chunk, _combine_hashes, (0, 1))
+        self._hash_changed_lines()
+
+    def _hash_changed_lines(self) -> None:
+        for chunk_index in self._lines.changed_chunks:
+            chunk = self._lines.chunks[chunk_index]
+            chunk_start = self._lines.find_chunk_start(chunk_index)
+
+            # Get consecutive lines from Tcl with one call
+            index = 0
+            while index < len(chunk):
+                if chunk[index] is not None:
+                    index += 1
+                    continue
+                end = index
+                while end < len(chunk) and chunk[end] is None:
+                    end += 1
+                text = self._widget.get(
+                    f"{chunk_start + index + 1}.0", f"{chunk_start + end}.0 lineend"
+                )
+                # Never zero, so that adding empty lines to beginning changes the hash
+                chunk[index:end] = [hash(line) % (2 ** 64 - 1) + 1 for line in text.split("\n")]
+                index = end
+
+        self._lines.update_summaries()
+
+    def apply_changes(self, changes: textwidget.Changes) -> None:
+        for change in changes.change_list:
+            new_line_count = change.new_text.count("\n") + 1
+            self._lines.replace_lines(change.start[0] - 1, change.end[0], [None] * new_line_count)
+        self._hash_changed_lines()
+
+    def get_hash(self) -> int:
+        return self._lines.get_summary()[0]
+
+
+# Strings are compared in blocks of this size, so that common parts of the old
+# and new content are skipped mostly in C code
+_DIFF_BLOCK_SIZE = 64 * 1024
+# If more lines than this were changed, reload() replaces everything between
+# the common prefix and suffix instead of figuring out what exactly changed
+_MAX_DIFF_EDITS = 500
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    result = 0
+    limit = min(len(a), len(b))
+    block_size = _DIFF_BLOCK_SIZE
+    while block_size >= 1 and result < limit:
+        end = min(result + block_size, limit)
+        if a[result:end] == b[result:end]:
+            result = end
+        else:
+            block_size //= 2
+    return result
+
+
+def _common_suffix_length(a: str, b: str, limit: int) -> int:
+    result = 0
+    block_size = _DIFF_BLOCK_SIZE
+    while block_size >= 1 and result < limit:
+        end = min(result + block_size, limit)
+        if a[len(a) - end : len(a) - result] == b[len(b) - end : len(b) - result]:
+            result = end
+        else:
+            block_size //= 2
+    return result
+
+
+# Myers' O(ND) diff algorithm. Returns (a_start, a_end, b_start, b_end) tuples
+# meaning that a[a_start:a_end] should be replaced with b[b_start:b_end], or
+# None if more than max_edits items would need to be deleted or inserted.
+def _diff_sequences(
+    a: Sequence[str], b: Sequence[str], max_edits: int
+) -> Optional[List[Tuple[int, int, int, int]]]:
+    # v[offset + k] is how far (in a) we got along diagonal k = x - y
+    offset = max_edits + 1
+    v = [0] * (2 * max_edits + 3)
+    trace = []
+
+    for d in range(max_edits + 1):
+        trace.append(v.copy())
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]  # insert from b
+            else:
+                x = v[offset + k - 1] + 1  # delete from a
+            y = x - k
+            while x < len(a) and y < len(b) and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= len(a) and y >= len(b):
+                return _backtrack_diff(trace, offset, len(a), len(b))
+    return None
+
+
+def _backtrack_diff(
+    trace: List[List[int]], offset: int, x: int, y: int
+) -> List[Tuple[int, int, int, int]]:
+    hunks: List[Tuple[int, int, int, int]] = []
+    for d in reversed(range(1, len(trace))):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+            x = v[offset + k + 1]
+            y = x - (k + 1)
+            edit = (x, x, y, y + 1)
+        else:
+            x = v[offset + k - 1]
+            y = x - (k - 1)
+            edit = (x, x + 1, y, y)
+
+        if hunks and hunks[-1][0] == edit[1] and hunks[-1][2] == edit[3]:
+            hunks[-1] = (edit[0], hunks[-1][1], edit[2], hunks[-1][3])
+        else:
+            hunks.append(edit)
+
+    hunks.reverse()
+    return hunks
+
+
+def _diff_text(old: str, new: str) -> List[Tuple[int, int, str]]:
+    """Return (start, end, new_text) tuples for replacing parts of old.
+
+    The start and end are character offsets into the old text. Lines that
+    didn't change are not touched, so that tags, marks and undo history
+    outside the changed parts stay as is.
+    """
+    if old == new:
+        return []
+
+    # Common prefix and suffix are usually most of the text, and they must
+    # consist of full lines
+    prefix = _common_prefix_length(old, new)
+    prefix = old.rfind("\n", 0, prefix) + 1
+    suffix = _common_suffix_length(old, new, min(len(old), len(new)) - prefix)
+    while suffix > 0 and not (
+        (len(old) == suffix or old[-suffix - 1] == "\n")
+        and (len(new) == suffix or new[-suffix - 1] == "\n")
+    ):
+        # Move start of suffix to start of next line
+        newline = old.find("\n", len(old) - suffix)
+        suffix = 0 if newline == -1 else len(old) - newline - 1
+
+    old_lines = old[prefix : len(old) - suffix].splitlines(keepends=True)
+    new_lines = new[prefix : len(new) - suffix].splitlines(keepends=True)
+
+    if old_lines and new_lines:
+        hunks = _diff_sequences(old_lines, new_lines, _MAX_DIFF_EDITS)
+    else:
+        hunks = None
+    if hunks is None:
+        hunks = [(0, len(old_lines), 0, len(new_lines))]
+
+    old_offsets = [prefix]
+    for line in old_lines:
+        old_offsets.append(old_offsets[-1] + len(line))
+    return [
+        (old_offsets[a_start], old_offsets[a_end], "".join(new_lines[b_start:b_end]))
+        for a_start, a_end, b_start, b_end in hunks
+    ]
+
+
+# Files bigger than this are read in a separate thread and shown while loading
+_STREAMING_THRESHOLD = 4 * 1024 * 1024
+_STREAMING_CHUNK_SIZE = 256 * 1024
+
+
+class _LoadedChunk(NamedTuple):
+    text: str
+    progress: float  # between 0 and 1
+
+
+class _LoadingDone(NamedTuple):
+    stat_result: os.stat_result
+    newlines: Union[None, str, Tuple[str, ...]]
+    md5_hash: str
+
+
+class _LoadingFailed(NamedTuple):
+    error: Exception
+    traceback: str
+
+
+_LoadingQueueItem = Union[_LoadedChunk, _LoadingDone, _LoadingFailed]
+
+
+# Runs in a separate thread
+def _read_file_in_chunks(
+    path: pathlib.Path,
+    encoding: str,
+    result_queue: queue.Queue[_LoadingQueueItem],
+    cancel_event: threading.Event,
+) -> None:
+    def put(item: _LoadingQueueItem) -> bool:
+        # Don't read the whole file to memory if the main thread is slower
+        while not cancel_event.is_set():
+            try:
+                result_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        # Same newline handling as in reading the file in text mode
+        decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder(encoding)(), translate=True
+        )
+        md5 = hashlib.md5()
+        with path.open("rb") as f:
+            stat_result = os.fstat(f.fileno())
+            bytes_read = 0
+            while True:
+                data = f.read(_STREAMING_CHUNK_SIZE)
+                bytes_read += len(data)
+                text = decoder.decode(data, final=(not data))
+                md5.update(text.encode("utf-8"))
+                progress = bytes_read / max(stat_result.st_size, 1)
+                if text and not put(_LoadedChunk(text, min(progress, 1))):
+                    return
+                if not data:
+                    break
+        put(_LoadingDone(stat_result, decoder.newlines, md5.hexdigest()))
+    except (OSError, UnicodeError) as e:
+        put(_LoadingFailed(e, traceback.format_exc()))
+
+
 def _import_lexer_class(name: str) -> LexerMeta:
     modulename, classname = name.rsplit(".", 1)
     module = importlib.import_module(modulename)
@@ -519,6 +819,19 @@ bers.py>` use this attribute.
         if content:
             self.textwidget.insert("1.0", content)
             self.textwidget.edit_reset()  # reset undo/redo
+
+        # Hashing the whole content on every key press would be too slow for big files
+        self._content_hasher = _ContentHasher(self.textwidget)
+        utils.bind_with_data(
+            self.textwidget,
+            "<<ContentChanged>>",
+            (
+                lambda event: self._content_hasher.apply_changes(
+                    event.data_class(textwidget.Changes)
+                )
+            ),
+            add=True,
+        )
         self._set_saved_state(None)
 
         self.bind("<<TabSelected>>", (lambda event: self.textwidget.focus()), add=True)
@@ -528,7 +841,11 @@ bers.py>` use this attribute.
         self.textwidget.config(yscrollcommand=self.scrollbar.set)
         self.scrollbar.config(command=self.textwidget.yview)
 
-        self.textwidget.bind("<<ContentChanged>>", self._update_titles, add=True)
+        # None when not loading a big file, see open_file()
+        self._loading_progress: Optional[float] = None
+        self._after_loading: List[Callable[[], None]] = []
+
+        self.textwidget.bind("<<ContentChangedCoalesced>>", self._update_titles, add=True)
         self._update_titles()
 
     @classmethod
@@ -540,13 +857,87 @@ bers.py>` use this attribute.
 
         :exc:`UnicodeError` or :exc:`OSError` is raised if reading the
         file fails.
+
+        Big files are read in a separate thread, and this method returns
+        before the whole file has been read. The tab shows the beginning of
+        the file while the rest of it loads, and it can't be edited or saved
+        until loading is done. Then the :virtevt:`Reloaded` event runs. If
+        reading fails, an error dialog is shown and the tab is closed.
         """
         tab = cls(manager, path=path)
-        tab.reload()
-        tab.textwidget.mark_set("insert", "1.0")
-        tab.textwidget.edit_reset()
+        if path.stat().st_size >= _STREAMING_THRESHOLD:
+            tab._start_loading()
+        else:
+            tab.reload()
+            tab.textwidget.mark_set("insert", "1.0")
+            tab.textwidget.edit_reset()
         return tab
 
+    def _start_loading(self) -> None:
+        assert self.path is not None
+        self._loading_progress = 0.0
+        self._loading_queue: queue.Queue[_LoadingQueueItem] = queue.Queue(maxsize=4)
+        cancel_event = threading.Event()
+        self.bind("<Destroy>", (lambda event: cancel_event.set()), add=True)
+        threading.Thread(
+            target=_read_file_in_chunks,
+            args=[self.path, self.settings.get("encoding", str), self._loading_queue, cancel_event],
+            daemon=True,
+        ).start()
+
+        # Text is added to the end, cursor should stay where it is
+        self.textwidget.mark_gravity("insert", "left")
+        # Undo history would be reset after loading anyway
+        self.textwidget.config(state="disabled", undo=False)
+        self._update_titles()
+        _state.get_main_window().after(10, self._add_loaded_chunks)
+
+    def _add_loaded_chunks(self) -> None:
+        if not self.winfo_exists():
+            # Tab closed while loading
+            return
+
+        # Keep the GUI responsive while loading
+        end_time = time.perf_counter() + 0.02
+        while time.perf_counter() < end_time:
+            try:
+                item = self._loading_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if isinstance(item, _LoadingDone):
+                self._finish_loading(item)
+                return
+
+            if isinstance(item, _LoadingFailed):
+                log.error(f"reading '{self.path}' failed", exc_info=item.error)
+                utils.errordialog(type(item.error).__name__, "Opening failed!", item.traceback)
+                self.master.close_tab(self)
+                return
+
+            self.textwidget.config(state="normal")
+            self.textwidget.insert("end - 1 char", item.text)
+            self.textwidget.config(state="disabled")
+            self._loading_progress = item.progress
+
+        self._update_titles()
+        _state.get_main_window().after(10, self._add_loaded_chunks)
+
+    def _finish_loading(self, done: _LoadingDone) -> None:
+        self._loading_progress = None
+        self.textwidget.config(state="normal", undo=True)
+        self.textwidget.mark_gravity("insert", "right")
+        self.textwidget.edit_reset()
+        self._set_line_ending(done.newlines)
+        self._set_saved_state(done.stat_result, done.md5_hash)
+
+        callbacks = self._after_loading
+        self._after_loading = []
+        for callback in callbacks:
+            callback()
+
+        self.event_generate("<<Reloaded>>", data=ReloadInfo(was_modified=False))
+
     def _get_char_count(self) -> int:
         return textwidget.count(self.textwidget, "1.0", "end - 1 char")
 
@@ -555,8 +946,13 @@ bers.py>` use this attribute.
             string = self.textwidget.get("1.0", "end - 1 char")
         return hashlib.md5(string.encode("utf-8")).hexdigest()
 
-    def _set_saved_state(self, stat_result: Optional[os.stat_result]) -> None:
-        self._saved_state = (stat_result, self._get_char_count(), self._get_hash())
+    def _set_saved_state(
+        self, stat_result: Optional[os.stat_result], md5_hash: Optional[str] = None
+    ) -> None:
+        if md5_hash is None:
+            md5_hash = self._get_hash()
+        self._saved_state = (stat_result, self._get_char_count(), md5_hash)
+        self._saved_content_hash: Optional[int] = self._content_hasher.get_hash()
         self._update_titles()
 
     def is_modified(self) -> bool:
@@ -564,10 +960,24 @@ bers.py>` use this attribute.
 
         This is set to False automagically when the content is modified.
         Use :meth:`mark_saved` to set this to True.
+        This is always False while a big file is loading.
         """
+        if self._loading_progress is not None:
+            return False
+
         stat_result, char_count, save_hash = self._saved_state
-        # Don't call _get_hash() if not necessary
-        return self._get_char_count() != char_count or self._get_hash() != save_hash
+        if self._get_char_count() != char_count:
+            return True
+
+        if self._saved_content_hash is None:
+            # Saved state comes from another Porcupine process (restart plugin), and
+            # _ContentHasher's hashes are different in each process
+            if self._get_hash() != save_hash:
+                return True
+            self._saved_content_hash = self._content_hasher.get_hash()
+            return False
+
+        return self._content_hasher.get_hash() != self._saved_content_hash
 
     def reload(self) -> None:
         """Read the contents of the file from disk.
@@ -575,59 +985,51 @@ bers.py>` use this attribute.
         .. seealso:: :meth:`open_file`, :meth:`other_program_changed_file`
         """
         assert self.path is not None
+        if self._loading_progress is not None:
+            # The file is being read anyway
+            return
+
         with self.path.open("r", encoding=self.settings.get("encoding", str)) as f:
             stat_result = os.fstat(f.fileno())
             content = f.read()
-
-        if isinstance(f.newlines, tuple):
-            # TODO: show a message box to user?
-            log.warning(f"file '{self.path}' contains mixed line endings: {f.newlines}")
-        elif f.newlines is not None:
-            assert isinstance(f.newlines, str)
-            self.settings.set("line_ending", settings.LineEnding(f.newlines))
-
-        # Find changed part in O(n) time where n = max(len(old_lines), len(new_lines))
-        old_lines = collections.deque(
-            self.textwidget.get("1.0", "end - 1 char").splitlines(keepends=True)
-        )
-        new_lines = collections.deque(content.splitlines(keepends=True))
-        start_line = 1
-        start_column = 0
-        end_line, end_column = map(int, self.textwidget.index("end - 1 char").split("."))
-        while old_lines and new_lines and old_lines[-1] == new_lines[-1]:
-            popped = old_lines.pop()
-            popped2 = new_lines.pop()
-            assert popped == popped2
-            if popped.endswith("\n"):
-                assert end_column == 0
-                end_line -= 1
-            else:
-                end_column = 0
-        while old_lines and new_lines and old_lines[0] == new_lines[0]:
-            old_lines.popleft()
-            new_lines.popleft()
-            start_line += 1
-
+        self._set_line_ending(f.newlines)
         modified_before = self.is_modified()
 
+        # Replace only the changed parts, starting from the end so that
+        # offsets of other parts stay valid
+        mirror = textwidget.get_mirror(self.textwidget)
         with textwidget.change_batch(self.textwidget):
-            self.textwidget.replace(
-                f"{start_line}.{start_column}", f"{end_line}.{end_column}", "".join(new_lines)
-            )
+            for start, end, new_text in reversed(_diff_text(mirror.get_all(), content)):
+                start_line, start_column = mirror.offset_to_index(start)
+                end_line, end_column = mirror.offset_to_index(end)
+                self.textwidget.replace(
+                    f"{start_line}.{start_column}", f"{end_line}.{end_column}", new_text
+                )
 
         self._set_saved_state(stat_result)
 
         # TODO: document this
         self.event_generate("<<Reloaded>>", data=ReloadInfo(was_modified=modified_before))
 
+    def _set_line_ending(self, newlines: Union[None, str, Tuple[str, ...]]) -> None:
+        if isinstance(newlines, tuple):
+            # TODO: show a message box to user?
+            log.warning(f"file '{self.path}' contains mixed line endings: {newlines}")
+        elif newlines is not None:
+            self.settings.set("line_ending", settings.LineEnding(newlines))
+
     def other_program_changed_file(self) -> bool:
         """Check whether some other program has changed the file.
 
         Programs like ``git`` often change the file while it's open in an
         editor. After they do that, this method will return True until the file
         is e.g. saved or reloaded.
+
+        This method doesn't use Tk, so it can be called from other threads.
+        That's useful, because it sometimes needs to read the whole file.
         """
-        save_stat, save_char_count, save_hash = self._saved_state
+        saved_state = self._saved_state
+        save_stat, save_char_count, save_hash = saved_state
         if self.path is None or save_stat is None:
             return False
 
@@ -647,8 +1049,9 @@ bers.py>` use this attribute.
             if actual_hash != save_hash:
                 return True
 
-            # Avoid reading file contents again soon
-            self._saved_state = (actual_stat, save_char_count, save_hash)
+            # Avoid reading file contents again soon, unless saved meanwhile
+            if self._saved_state is saved_state:
+                self._saved_state = (actual_stat, save_char_count, save_hash)
             return False
 
         except (OSError, UnicodeError):
@@ -691,7 +1094,10 @@ bers.py>` use this attribute.
         else:
             titles = _short_ways_to_display_path(self.path)
 
-        if self.is_modified():
+        if self._loading_progress is not None:
+            percent = round(self._loading_progress * 100)
+            titles = [f"{title} (loading {percent}%)" for title in titles]
+        elif self.is_modified():
             titles = [f"*{title}*" for title in titles]
 
         self.title_choices = titles
@@ -715,6 +1121,14 @@ bers.py>` use this attribute.
         return True
 
     def _do_the_save(self, path: pathlib.Path) -> bool:
+        if self._loading_progress is not None:
+            messagebox.showerror(
+                "Saving failed",
+                "The file hasn't been fully loaded yet. Please try again when it's done.",
+                parent=self.winfo_toplevel(),
+            )
+            return False
+
         self.event_generate("<<BeforeSave>>")
 
         encoding = self.settings.get("encoding", str)
@@ -821,8 +1235,256 @@ bers.py>` use this attribute.
 
         # title depends on _saved_state
         self._saved_state = state.saved_state
+        self._saved_content_hash = None
         self._update_titles()
 
-        self.textwidget.mark_set("insert", state.cursor_pos)
-        self.textwidget.see("insert linestart")
+        def restore_cursor() -> None:
+            self.textwidget.mark_set("insert", state.cursor_pos)
+            self.textwidget.see("insert linestart")
+
+        if self._loading_progress is None:
+            restore_cursor()
+        else:
+            self._after_loading.append(restore_cursor)
+        return self
+
+
+# Files bigger than this are opened in a BigFileTab by open_path()
+_BIG_FILE_THRESHOLD = 256 * 1024 * 1024
+_BigFileTabT = TypeVar("_BigFileTabT", bound="BigFileTab")
+
+
+class _BigFileTabState(NamedTuple):
+    path: pathlib.Path
+    offset: int
+
+
+class BigFileTab(Tab):
+    """A read-only tab for viewing files that are too big for :class:`FileTab`.
+
+    The file is memory-mapped, and only the lines that fit on the screen are
+    added to :attr:`textwidget`. Lines are counted in a separate thread, and
+    going to a line number works only for the part of the file that has been
+    counted so far.
+
+    .. attribute:: textwidget
+        :type: tkinter.Text
+
+        The text widget that shows the visible lines. Its line numbers are
+        not line numbers of the file.
+
+    .. attribute:: path
+        :type: pathlib.Path
+
+        The file shown in the tab, as an absolute path.
+    """
+
+    def __init__(self, manager: TabManager, path: pathlib.Path) -> None:
+        super().__init__(manager)
+        self.path = path.resolve()
+        self.title_choices = _short_ways_to_display_path(self.path)
+
+        self._lines = _mmapfile.MappedLines(self.path)
+        self._offset = 0  # start of first visible line
+        self._end_offset = 0  # end of last visible line
+        self._find_start = 0
+
+        cancel_event = threading.Event()
+        threading.Thread(target=self._lines.build_index, args=[cancel_event], daemon=True).start()
+        self.bind("<Destroy>", (lambda event: cancel_event.set()), add=True)
+        self.bind("<Destroy>", (lambda event: self._lines.close()), add=True)
+
+        toolbar = ttk.Frame(self)
+        toolbar.pack(side="top", fill="x")
+        ttk.Label(toolbar, text="Go to line:").pack(side="left", padx=(5, 0))
+        self._lineno_entry = ttk.Entry(toolbar, width=12)
+        self._lineno_entry.pack(side="left", padx=5)
+        self._lineno_entry.bind("<Return>", self._on_goto_line, add=True)
+        ttk.Label(toolbar, text="Find:").pack(side="left", padx=(5, 0))
+        self._find_entry = ttk.Entry(toolbar, width=30)
+        self._find_entry.pack(side="left", padx=5)
+        self._find_entry.bind("<Return>", self._on_find, add=True)
+        self._status_label = ttk.Label(toolbar)
+        self._status_label.pack(side="right", padx=5)
+
+        self.textwidget = tkinter.Text(
+            self, width=1, height=1, wrap="none", state="disabled", padx=3
+        )
+        self.textwidget.pack(side="left", fill="both", expand=True)
+        textwidget.use_pygments_theme(self.textwidget)
+        self.textwidget.bind("<Configure>", self._update_view, add=True)
+
+        if self.textwidget.tk.call("tk", "windowingsystem") == "x11":
+            self.textwidget.bind("<Button-4>", (lambda event: self._scroll_and_break(-3)), add=True)
+            self.textwidget.bind("<Button-5>", (lambda event: self._scroll_and_break(3)), add=True)
+        else:
+            self.textwidget.bind(
+                "<MouseWheel>",
+                (lambda event: self._scroll_and_break(-3 if event.delta > 0 else 3)),
+                add=True,
+            )
+        self.textwidget.bind(
+            "<Prior>",
+            (lambda event: self._scroll_and_break(-self._get_visible_line_count())),
+            add=True,
+        )
+        self.textwidget.bind(
+            "<Next>",
+            (lambda event: self._scroll_and_break(self._get_visible_line_count())),
+            add=True,
+        )
+
+        self.scrollbar = ttk.Scrollbar(self.right_frame, command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.bind("<<TabSelected>>", (lambda event: self.textwidget.focus()), add=True)
+        self._update_view()
+        self._update_status_while_indexing()
+
+    def _get_visible_line_count(self) -> int:
+        linespace = int(
+            self.textwidget.tk.call("font", "metrics", self.textwidget["font"], "-linespace")
+        )
+        return max(1, self.textwidget.winfo_height() // linespace)
+
+    def _update_view(self, junk: object = None) -> None:
+        lines = []
+        offset: Optional[int] = self._offset
+        for i in range(self._get_visible_line_count()):
+            if offset is None:
+                break
+            line = self._lines.get_line(offset)
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            lines.append(line.decode("utf-8", errors="replace"))
+            offset = self._lines.next_line(offset)
+        self._end_offset = self._lines.size if offset is None else offset
+
+        self.textwidget.config(state="normal")
+        self.textwidget.delete("1.0", "end")
+        self.textwidget.insert("1.0", "\n".join(lines))
+        self.textwidget.config(state="disabled")
+
+        size = max(self._lines.size, 1)
+        self.scrollbar.set(self._offset / size, self._end_offset / size)  # type: ignore[no-untyped-call]
+        self._update_status()
+
+    def _update_status(self) -> None:
+        lineno = self._lines.get_lineno(self._offset)
+        if self._lines.line_count is not None:
+            self._status_label.config(text=f"Line {lineno} of {self._lines.line_count}")
+        else:
+            percent = round(self._lines.get_index_progress() * 100)
+            line_text = "" if lineno is None else f"Line {lineno}, "
+            self._status_label.config(text=f"{line_text}counting lines ({percent}%)")
+
+    def _update_status_while_indexing(self) -> None:
+        if self.winfo_exists():
+            self._update_status()
+            if self._lines.line_count is None:
+                _state.get_main_window().after(200, self._update_status_while_indexing)
+
+    def scroll_to_offset(self, offset: int) -> None:
+        """Show the line that contains the given byte offset at top of the view."""
+        self._offset = self._lines.line_start(min(max(offset, 0), self._lines.size))
+        self._find_start = self._offset
+        self._update_view()
+
+    def scroll_lines(self, line_count: int) -> None:
+        """Scroll down by the given number of lines, or up if it's negative."""
+        offset = self._offset
+        for i in range(abs(line_count)):
+            if line_count > 0:
+                new_offset = self._lines.next_line(offset)
+            else:
+                new_offset = self._lines.previous_line(offset)
+            if new_offset is None:
+                break
+            offset = new_offset
+        self.scroll_to_offset(offset)
+
+    # The text widget must not scroll, it contains only the visible lines
+    def _scroll_and_break(self, line_count: int) -> str:
+        self.scroll_lines(line_count)
+        return "break"
+
+    def _on_scrollbar(self, action: str, *args: str) -> None:
+        if action == "moveto":
+            self.scroll_to_offset(int(float(args[0]) * self._lines.size))
+        elif args[1] == "units":
+            self.scroll_lines(int(args[0]))
+        else:
+            self.scroll_lines(int(args[0]) * self._get_visible_line_count())
+
+    def goto_line(self, lineno: int) -> bool:
+        """Scroll to the given line (1-based).
+
+        Returns False if the line doesn't exist or it hasn't been counted yet.
+        """
+        offset = self._lines.find_lineno(lineno)
+        if offset is None:
+            return False
+        self.scroll_to_offset(offset)
+        return True
+
+    def find(self, text: str) -> bool:
+        """Scroll to the next occurrence of *text* and select it.
+
+        Each call finds the next occurrence after the previous one, wrapping
+        around at the end of the file. Returns False if *text* was not found.
+        """
+        needle = text.encode("utf-8")
+        match_offset = self._lines.find(needle, self._find_start)
+        if not needle or match_offset == -1:
+            return False
+
+        self.scroll_to_offset(match_offset)
+        self._find_start = match_offset + 1
+        column = len(
+            self._lines.get_line(self._offset)[: match_offset - self._offset].decode(
+                "utf-8", errors="replace"
+            )
+        )
+        self.textwidget.tag_add("sel", f"1.{column}", f"1.{column + len(text)}")
+        return True
+
+    def _on_goto_line(self, junk: object) -> None:
+        try:
+            lineno = int(self._lineno_entry.get())  # type: ignore[no-untyped-call]
+        except ValueError:
+            self.bell()
+            return
+
+        if not self.goto_line(lineno):
+            self.bell()
+            if self._lines.line_count is None:
+                self._status_label.config(text="Lines haven't been counted that far yet")
+
+    def _on_find(self, junk: object) -> None:
+        if not self.find(self._find_entry.get()):  # type: ignore[no-untyped-call]
+            self.bell()
+            self._status_label.config(text="Not found")
+
+    def equivalent(self, other: Tab) -> bool:  # override
+        return isinstance(other, BigFileTab) and self.path.samefile(other.path)
+
+    def get_state(self) -> _BigFileTabState:
+        return _BigFileTabState(self.path, self._offset)
+
+    @classmethod
+    def from_state(
+        cls: Type[_BigFileTabT], manager: TabManager, state: _BigFileTabState
+    ) -> _BigFileTabT:
+        self = cls(manager, state.path)
+        self.scroll_to_offset(state.offset)
         return self
+
+
+def open_path(manager: TabManager, path: pathlib.Path) -> Union[FileTab, BigFileTab]:
+    """Open a file in a new :class:`FileTab`, or in a :class:`BigFileTab` if it's huge.
+
+    Errors are raised like in :meth:`FileTab.open_file`.
+    """
+    if path.stat().st_size >= _BIG_FILE_THRESHOLD:
+        return BigFileTab(manager, path)
+    return FileTab.open_file(manager, path)
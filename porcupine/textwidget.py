@@ -2,14 +2,14 @@ from __future__ import annotations
 
 import contextlib
 import dataclasses
+import itertools
 import tkinter
 import weakref
-from functools import partial
 from typing import TYPE_CHECKING, Any, Callable, Iterator, List, Optional, Tuple, overload
 
 from pygments import styles  # type: ignore[import]
 
-from porcupine import settings, utils
+from porcupine import _linetree, settings, utils
 
 if TYPE_CHECKING:
     from porcupine import tabs
@@ -88,26 +88,442 @@ def count(widget: tkinter.Text, start: str, end: str, *, option: str = "-chars")
     return widget.tk.call(widget, "count", option, start, end)
 
 
+def _text_end(start: Tuple[int, int], text: str) -> Tuple[int, int]:
+    line, column = start
+    newline_count = text.count("\n")
+    if newline_count == 0:
+        return (line, column + len(text))
+    return (line + newline_count, len(text) - text.rindex("\n") - 1)
+
+
+# position must be between text_start and _text_end(text_start, text)
+def _offset_in_text(text_start: Tuple[int, int], text: str, position: Tuple[int, int]) -> int:
+    line, column = position
+    if line == text_start[0]:
+        return column - text_start[1]
+
+    newline_index = -1
+    for junk in range(line - text_start[0]):
+        newline_index = text.index("\n", newline_index + 1)
+    return newline_index + 1 + column
+
+
+def _merge_changes(first: Change, second: Change) -> Optional[Change]:
+    """Return a change that does the same as applying first and then second.
+
+    This only works when the second change touches the text inserted by the
+    first change. Otherwise this returns None.
+    """
+    first_start = (first.start[0], first.start[1])
+    first_end = (first.end[0], first.end[1])
+    first_new_end = _text_end(first_start, first.new_text)
+    second_start = (second.start[0], second.start[1])
+    second_end = (second.end[0], second.end[1])
+    if second_end < first_start or second_start > first_new_end:
+        return None
+
+    # Which part of first.new_text gets replaced
+    if second_start > first_start:
+        cut_start = _offset_in_text(first_start, first.new_text, second_start)
+    else:
+        cut_start = 0
+    if second_end < first_new_end:
+        cut_end = _offset_in_text(first_start, first.new_text, second_end)
+    else:
+        cut_end = len(first.new_text)
+
+    # Convert second_end to where it was before the first change
+    if second_end <= first_new_end:
+        end = first_end
+    elif second_end[0] == first_new_end[0]:
+        end = (first_end[0], first_end[1] + second_end[1] - first_new_end[1])
+    else:
+        end = (second_end[0] - first_new_end[0] + first_end[0], second_end[1])
+
+    return Change(
+        start=list(min(first_start, second_start)),
+        end=list(end),
+        old_text_len=first.old_text_len + second.old_text_len - (cut_end - cut_start),
+        new_text=first.new_text[:cut_start] + second.new_text + first.new_text[cut_end:],
+    )
+
+
+def _count_chars(lines: List[str]) -> int:
+    # Count a newline after every line, even the last line of the text
+    return sum(map(len, lines)) + len(lines)
+
+
+class TextMirror:
+    """A copy of a text widget's content, stored in Python.
+
+    Use :func:`get_mirror` to get one. Getting text from Tcl is slow,
+    especially when the text is long, and this class avoids it.
+
+    Lines are numbered starting at 1 and columns starting at 0, just like in
+    text widget indexes. Like in :class:`Change`, embedded windows are not
+    counted, so ``(1, 0)`` is where the text on line 1 starts. Character
+    offsets start at 0 and count newline characters.
+
+    Looking up a line or converting between line-column pairs and offsets is
+    O(log n), where n is the number of lines. Methods that return text don't
+    copy the whole text, except :meth:`get_all`.
+    """
+
+    def __init__(self, text: str) -> None:
+        self._lines = _linetree.SummedLines(text.split("\n"), _count_chars)
+        self._all_text: Optional[str] = text
+
+    def _apply_change(self, change: Change) -> None:
+        start_line, start_column = change.start
+        end_line, end_column = change.end
+        new_text = (
+            self._lines[start_line - 1][:start_column]
+            + change.new_text
+            + self._lines[end_line - 1][end_column:]
+        )
+        self._lines.replace_lines(start_line - 1, end_line, new_text.split("\n"))
+        self._all_text = None
+
+    def get_line_count(self) -> int:
+        """Return the number of lines. This is always at least 1."""
+        return len(self._lines)
+
+    def get_char_count(self) -> int:
+        """Return the number of characters in the text."""
+        # Last line doesn't end with newline
+        return self._lines.get_summary() - 1
+
+    def get_line(self, lineno: int) -> str:
+        """Return a line without the trailing newline character."""
+        if not 1 <= lineno <= len(self._lines):
+            raise ValueError(f"line number out of range: {lineno}")
+        return self._lines[lineno - 1]
+
+    def iter_lines(
+        self, start_lineno: int = 1, *, backwards: bool = False
+    ) -> Iterator[Tuple[int, str]]:
+        """Return an iterator of ``(lineno, line)`` tuples, starting at the given line.
+
+        By default, this goes towards the end of the text. With
+        ``backwards=True``, this goes towards line 1 instead.
+        """
+        if not 1 <= start_lineno <= len(self._lines):
+            raise ValueError(f"line number out of range: {start_lineno}")
+
+        chunk_index, chunk_start = self._lines.find_chunk(start_lineno - 1)
+        index_in_chunk = start_lineno - 1 - chunk_start
+        chunks = self._lines.chunks
+
+        # Slicing the list of chunks doesn't copy lines
+        lines: Iterator[str]
+        if backwards:
+            first_chunk = chunks[chunk_index][: index_in_chunk + 1]
+            lines = itertools.chain.from_iterable(
+                map(reversed, [first_chunk] + chunks[:chunk_index][::-1])
+            )
+            return zip(itertools.count(start_lineno, -1), lines)
+        else:
+            first_chunk = chunks[chunk_index][index_in_chunk:]
+            lines = itertools.chain.from_iterable([first_chunk] + chunks[chunk_index + 1 :])
+            return zip(itertools.count(start_lineno), lines)
+
+    def index_to_offset(self, lineno: int, column: int) -> int:
+        """Convert a line number and column to a character offset."""
+        line = self.get_line(lineno)
+        if not 0 <= column <= len(line):
+            raise ValueError(f"column out of range: {column}")
+
+        chunk_index, chunk_start = self._lines.find_chunk(lineno - 1)
+        chunk = self._lines.chunks[chunk_index]
+        return (
+            self._lines.sum_before(chunk_index)
+            + _count_chars(chunk[: lineno - 1 - chunk_start])
+            + column
+        )
+
+    def offset_to_index(self, offset: int) -> Tuple[int, int]:
+        """Convert a character offset to a ``(lineno, column)`` tuple."""
+        if not 0 <= offset <= self.get_char_count():
+            raise ValueError(f"offset out of range: {offset}")
+
+        chunk_index, chunk_offset = self._lines.find_chunk_by_summary(offset)
+        lineno = self._lines.find_chunk_start(chunk_index) + 1
+        for line in self._lines.chunks[chunk_index]:
+            if offset - chunk_offset <= len(line):
+                break
+            chunk_offset += len(line) + 1
+            lineno += 1
+        return (lineno, offset - chunk_offset)
+
+    def get(self, start: Tuple[int, int], end: Tuple[int, int]) -> str:
+        """Return the text between two ``(lineno, column)`` tuples.
+
+        Unlike the ``get()`` method of text widgets, this doesn't accept
+        strings like ``"1.0"`` or ``"end"``.
+        """
+        start_line, start_column = start
+        end_line, end_column = end
+        self.get_line(end_line)  # check that it exists
+        if start_line == end_line:
+            return self.get_line(start_line)[start_column:end_column]
+
+        lines = []
+        for lineno, line in self.iter_lines(start_line):
+            lines.append(line)
+            if lineno == end_line:
+                break
+        lines[-1] = lines[-1][:end_column]
+        lines[0] = lines[0][start_column:]
+        return "\n".join(lines)
+
+    def get_by_offsets(self, start: int, end: int) -> str:
+        """Return the text between two character offsets.
+
+        This is faster than converting the offsets with
+        :meth:`offset_to_index` and then calling :meth:`get`.
+        """
+        if not 0 <= start <= end <= self.get_char_count():
+            raise ValueError(f"offsets out of range: {start}, {end}")
+
+        # Joining a few hundred lines too many in C is faster than finding
+        # the exact lines in Python
+        chunk_index, chunk_offset = self._lines.find_chunk_by_summary(start)
+        texts = []
+        texts_end = chunk_offset
+        while texts_end <= end:
+            texts.append("\n".join(self._lines.chunks[chunk_index]))
+            texts_end += len(texts[-1]) + 1
+            chunk_index += 1
+        return "\n".join(texts)[start - chunk_offset : end - chunk_offset]
+
+    def get_all(self) -> str:
+        """Return all text, like ``textwidget.get("1.0", "end - 1 char")``.
+
+        The string is reused until the text changes, so calling this many
+        times is fast.
+        """
+        if self._all_text is None:
+            self._all_text = "\n".join(itertools.chain.from_iterable(self._lines.chunks))
+        return self._all_text
+
+
+@dataclasses.dataclass
+class CursorEventStats:
+    """How many times :virtevt:`~porcupine.textwidget.CursorMovedThrottled` was
+    generated, and how many cursor movements didn't get their own event.
+    """
+
+    generated: int = 0
+    dropped: int = 0
+
+
+class _CursorEventThrottler:
+    def __init__(self, widget: tkinter.Text) -> None:
+        self._widget = widget
+        self.interval_ms = 20
+        self.stats = CursorEventStats()
+        self._timer_pending = False
+        self._moved_during_timer = False
+
+    def cursor_moved(self) -> None:
+        if self._timer_pending:
+            # Only the latest position matters
+            if self._moved_during_timer:
+                self.stats.dropped += 1
+            self._moved_during_timer = True
+        else:
+            self._generate_event()
+
+    def _generate_event(self) -> None:
+        self.stats.generated += 1
+        self._timer_pending = True
+        self._moved_during_timer = False
+        self._widget.event_generate("<<CursorMovedThrottled>>")
+        self._widget.after(self.interval_ms, self._timer_done)
+
+    def _timer_done(self) -> None:
+        self._timer_pending = False
+        if self._moved_during_timer and self._widget.winfo_exists():
+            self._generate_event()
+
+
+_cursor_event_throttlers: weakref.WeakKeyDictionary[
+    tkinter.Text, _CursorEventThrottler
+] = weakref.WeakKeyDictionary()
+
+
+# Figuring out what changes is done in Tcl, because doing it in Python would
+# need many calls from Python to Tcl on every key press.
+#
+# porcupine_get_text_changes takes the actual text widget command and the
+# arguments of delete, insert or replace, with indexes already cleaned up to
+# LINE.COLUMN format. It returns a flat list with 6 items for each change:
+# start line, start column, end line, end column, old_text_len, new_text.
+_GET_TEXT_CHANGES_TCL = r"""
+proc porcupine_text_change {widget start end new_text} {
+    set start_line [lindex [split $start .] 0]
+    set end_line [lindex [split $end .] 0]
+    return [list \
+        $start_line [$widget count -chars $start_line.0 $start] \
+        $end_line [$widget count -chars $end_line.0 $end] \
+        [$widget count -chars $start $end] $new_text]
+}
+
+proc porcupine_get_text_changes {widget subcommand args} {
+    # Indexes are compared with eq, because == compares 1.1 and 1.10 as numbers
+    #
+    # tk has a funny abstraction of an invisible newline character at the end
+    # of file, it's always there but nothing else uses it, so let's ignore it
+    set end_index [$widget index end]
+    set last_index [$widget index "end - 1 char"]
+    set changes {}
+
+    # search for 'pathName delete' in text(3tk)... it's a wall of text, and
+    # this thing has to implement every detail of that wall
+    if {$subcommand == "delete"} {
+        set indexes {}
+        foreach index $args {
+            if {$index eq $end_index} {
+                set index $last_index
+            }
+            lappend indexes $index
+        }
+
+        # "If index2 is not specified then the single character at index1 is
+        # deleted." and later: "If more indices are given, multiple ranges of
+        # text will be deleted." but no mention about combining these
+        # features, this works like the text widget actually behaves
+        if {[llength $indexes] % 2 == 1} {
+            lappend indexes [$widget index "[lindex $indexes end] + 1 char"]
+        }
+
+        # "If index2 does not specify a position later in the text than
+        # index1 then no characters are deleted."
+        set pairs {}
+        foreach {start end} $indexes {
+            if {[$widget compare $start < $end]} {
+                lappend pairs [list $start $end]
+            }
+        }
+
+        # "They [index pairs, aka ranges] are sorted [...]."
+        # -dictionary compares the numbers in LINE.COLUMN as integers
+        set pairs [lsort -dictionary -index 0 $pairs]
+
+        # "If multiple ranges with the same start index are given, then the
+        # longest range is used. If overlapping ranges are given, then they
+        # will be merged into spans that do not cause deletion of text
+        # outside the given ranges due to text shifted during deletion."
+        for {set i [expr {[llength $pairs] - 2}]} {$i >= 0} {incr i -1} {
+            lassign [lindex $pairs $i] start1 end1
+            lassign [lindex $pairs [expr {$i + 1}]] start2 end2
+            if {[$widget compare $end1 >= $start2]} {
+                # they overlap
+                set start $start2
+                if {[$widget compare $start1 < $start2]} {
+                    set start $start1
+                }
+                set end $end2
+                if {[$widget compare $end1 > $end2]} {
+                    set end $end1
+                }
+                set pairs [lreplace $pairs $i [expr {$i + 1}] [list $start $end]]
+            }
+        }
+
+        # "[...] and the text is removed from the last range to the first
+        # range so deleted text does not cause an undesired index shifting
+        # side-effects."
+        foreach pair [lreverse $pairs] {
+            lappend changes {*}[porcupine_text_change $widget {*}$pair ""]
+        }
+
+    # the man page's inserting section is also kind of a wall of text, but not
+    # as bad as the delete
+    } elseif {$subcommand == "insert"} {
+        set index [lindex $args 0]
+
+        # "If index refers to the end of the text (the character after the
+        # last newline) then the new text is inserted just before the last
+        # newline instead."
+        if {$index eq $end_index} {
+            set index $last_index
+        }
+
+        # we don't care about the tagList arguments to insert, but we need to
+        # handle the other arguments nicely anyway: "If multiple chars-tagList
+        # argument pairs are present, they produce the same effect as if a
+        # separate pathName insert widget command had been issued for each
+        # pair, in order. The last tagList argument may be omitted." i'm not
+        # sure what "in order" means here, but i tried it, and
+        # 'textwidget.insert('1.0', 'asd', [], 'toot', [])' inserts 'asdtoot',
+        # not 'tootasd'
+        set new_text ""
+        foreach {chars tag_list} [lrange $args 1 end] {
+            append new_text $chars
+        }
+        set changes [porcupine_text_change $widget $index $index $new_text]
+
+    # an even smaller wall of text that mostly refers to insert and replace
+    } elseif {$subcommand == "replace"} {
+        lassign $args start end
+        set new_text ""
+        foreach {chars tag_list} [lrange $args 2 end] {
+            append new_text $chars
+        }
+
+        # more invisible newline garbage
+        if {$start eq $end_index} {
+            set start $last_index
+        }
+        if {$end eq $end_index} {
+            set end $last_index
+        }
+
+        # didn't find in docs, but tcl throws an error for this
+        if {[$widget compare $start > $end]} {
+            error "replace start index $start is after end index $end"
+        }
+        set changes [porcupine_text_change $widget $start $end $new_text]
+
+    } else {
+        error "unexpected subcommand: $subcommand"
+    }
+
+    # remove changes that don't actually do anything
+    set result {}
+    foreach {start_line start_column end_line end_column old_text_len new_text} $changes {
+        if {$start_line != $end_line || $start_column != $end_column
+                || $old_text_len != 0 || $new_text ne ""} {
+            lappend result $start_line $start_column $end_line $end_column $old_text_len $new_text
+        }
+    }
+    return $result
+}
+"""
+
+
 class _ChangeTracker:
 
     # event_receiver_widget will receive the change events
     def __init__(self, event_receiver_widget: tkinter.Text) -> None:
         self._event_receiver_widget = event_receiver_widget
         self._change_batch: Optional[List[Change]] = None
+        self.mirror: Optional[TextMirror] = None
+        self._coalesced_changes: List[Change] = []
+        self._coalesced_event_pending = False
+
+        # Many plugins bind to <<ContentChanged>>, and they all would parse
+        # JSON on every key press without this
+        self._event_data_ring = utils.EventDataRing()
 
     def setup(self, widget: tkinter.Text) -> None:
-        old_cursor_pos = widget.index("insert")  # must be widget specific
+        throttler = _CursorEventThrottler(widget)
+        _cursor_event_throttlers[widget] = throttler
 
         def cursor_pos_changed() -> None:
-            nonlocal old_cursor_pos
-
-            new_pos = widget.index("insert")
-            if new_pos == widget.index("end"):
-                new_pos = widget.index("end - 1 char")
-
-            if new_pos != old_cursor_pos:
-                old_cursor_pos = new_pos
-                widget.event_generate("<<CursorMoved>>")
+            widget.event_generate("<<CursorMoved>>")
+            throttler.cursor_moved()
 
         #       /\
         #      /  \  WARNING: serious tkinter magic coming up
@@ -142,9 +558,15 @@ class _ChangeTracker:
         # tcl command named str(widget), and replacing that with a custom
         # command is a very powerful way to do magic; for example, moving the
         # cursor with arrow keys calls the 'mark set' widget command :D
+        # must be widget specific
+        old_cursor_pos_var = f"::porcupine_cursor_pos({widget})"
+        widget.tk.call("set", old_cursor_pos_var, widget.index("insert"))
+
         actual_widget_command = str(widget) + "_actual_widget"
         widget.tk.call("rename", str(widget), actual_widget_command)
 
+        widget.tk.eval(_GET_TEXT_CHANGES_TCL)
+
         # this part is tcl because i couldn't get a python callback to work
         widget.tk.eval(
             """
@@ -172,8 +594,11 @@ class _ChangeTracker:
             }
 
             # only these subcommands can change the text, but they can also
-            # move the cursor by changing the text before the cursor
-            if {$subcommand == "delete" || $subcommand == "insert" || $subcommand == "replace"} {
+            # move the cursor by changing the text before the cursor. Tk
+            # ignores them silently when the widget is disabled, and then the
+            # mirror must not change either.
+            if {($subcommand eq "delete" || $subcommand eq "insert" || $subcommand eq "replace")
+                    && [%(actual_widget)s cget -state] ne "disabled"} {
                 # Validate and clean up indexes here so that any problems
                 # result in Tcl error
                 if {$subcommand == "delete"} {
@@ -188,7 +613,12 @@ class _ChangeTracker:
                     lset args 1 [%(actual_widget)s index [lindex $args 1]]
                     lset args 2 [%(actual_widget)s index [lindex $args 2]]
                 }
-                set prepared_event [%(change_event_from_command)s {*}$args]
+                set changes [porcupine_get_text_changes %(actual_widget)s {*}$args]
+                if {[llength $changes] == 0} {
+                    set prepared_event ""
+                } else {
+                    set prepared_event [%(change_event_from_tcl)s $changes]
+                }
             } else {
                 set prepared_event ""
             }
@@ -212,8 +642,19 @@ class _ChangeTracker:
             #
             # [*] i lied, hehe >:D MUHAHAHA ... inserting text before the
             # cursor also changes it
+            #
+            # The old cursor position is stored in Tcl so that Python runs only
+            # when the cursor actually moves.
             if {[lrange $args 0 2] == {mark set insert} || $prepared_event != ""} {
-                %(cursor_moved_callback)s
+                set new_pos [%(actual_widget)s index insert]
+                if {$new_pos eq [%(actual_widget)s index end]} {
+                    set new_pos [%(actual_widget)s index "end - 1 char"]
+                }
+                # Not != because it compares 1.1 and 1.10 as equal numbers
+                if {$new_pos ne $%(old_cursor_pos)s} {
+                    set %(old_cursor_pos)s $new_pos
+                    %(cursor_moved_callback)s
+                }
             }
 
             return $result
@@ -222,142 +663,68 @@ class _ChangeTracker:
             % {
                 "fake_widget": str(widget),
                 "actual_widget": actual_widget_command,
-                "change_event_from_command": widget.register(
-                    partial(self._change_event_from_command, widget)
-                ),
+                "change_event_from_tcl": widget.register(self._change_event_from_tcl),
                 "event_receiver": self._event_receiver_widget,
                 "cursor_moved_callback": widget.register(cursor_pos_changed),
+                "old_cursor_pos": old_cursor_pos_var,
             }
         )
 
-    def _create_change(self, widget: tkinter.Text, start: str, end: str, new_text: str) -> Change:
-        start_line = int(start.split(".")[0])
-        end_line = int(end.split(".")[0])
-        return Change(
-            start=[start_line, count(widget, f"{start_line}.0", start)],
-            end=[end_line, count(widget, f"{end_line}.0", end)],
-            old_text_len=len(widget.get(start, end)),
-            new_text=new_text,
-        )
-
     # Must be called before widget content actually changes
-    def _change_event_from_command(
-        self, widget: tkinter.Text, subcommand: str, *args_tuple: str
-    ) -> str:
-        changes: List[Change] = []
-
-        # search for 'pathName delete' in text(3tk)... it's a wall of text,
-        # and this thing has to implement every detail of that wall
-        if subcommand == "delete":
-            # tk has a funny abstraction of an invisible newline character at
-            # the end of file, it's always there but nothing else uses it, so
-            # let's ignore it
-            args = list(args_tuple)
-            for index, old_arg in enumerate(args):
-                if old_arg == widget.index("end"):
-                    args[index] = widget.index("end - 1 char")
-
-            # "If index2 is not specified then the single character at index1
-            # is deleted." and later: "If more indices are given, multiple
-            # ranges of text will be deleted." but no mention about combining
-            # these features, this works like the text widget actually behaves
-            if len(args) % 2 == 1:
-                args.append(widget.index(f"{args[-1]} + 1 char"))
-            assert len(args) % 2 == 0
-            pairs = list(zip(args[0::2], args[1::2]))
-
-            # "If index2 does not specify a position later in the text than
-            # index1 then no characters are deleted."
-            pairs = [(start, end) for (start, end) in pairs if widget.compare(start, "<", end)]
-
-            # "They [index pairs, aka ranges] are sorted [...]."
-            # (line, column) tuples sort nicely
-            def get_range_beginning_as_tuple(start_and_end: Tuple[str, str]) -> Tuple[int, int]:
-                line, column = map(int, start_and_end[0].split("."))
-                return (line, column)
-
-            pairs.sort(key=get_range_beginning_as_tuple)
-
-            # "If multiple ranges with the same start index are given, then the
-            # longest range is used. If overlapping ranges are given, then they
-            # will be merged into spans that do not cause deletion of text
-            # outside the given ranges due to text shifted during deletion."
-            def merge_index_ranges(
-                start1: str, end1: str, start2: str, end2: str
-            ) -> Tuple[str, str]:
-                start = start1 if widget.compare(start1, "<", start2) else start2
-                end = end1 if widget.compare(end1, ">", end2) else end2
-                return (start, end)
-
-            # loop through pairs of pairs
-            for i in range(len(pairs) - 2, -1, -1):
-                (start1, end1), (start2, end2) = pairs[i : i + 2]
-                if widget.compare(end1, ">=", start2):
-                    # they overlap
-                    new_pair = merge_index_ranges(start1, end1, start2, end2)
-                    pairs[i : i + 2] = [new_pair]
-
-            # "[...] and the text is removed from the last range to the first
-            # range so deleted text does not cause an undesired index shifting
-            # side-effects."
-            for start, end in reversed(pairs):
-                changes.append(self._create_change(widget, start, end, ""))
-
-        # the man page's inserting section is also kind of a wall of
-        # text, but not as bad as the delete
-        elif subcommand == "insert":
-            text_index, *other_args = args_tuple
-
-            # "If index refers to the end of the text (the character after the
-            # last newline) then the new text is inserted just before the last
-            # newline instead."
-            if text_index == widget.index("end"):
-                text_index = widget.index("end - 1 char")
-
-            # we don't care about the tagList arguments to insert, but we need
-            # to handle the other arguments nicely anyway: "If multiple
-            # chars-tagList argument pairs are present, they produce the same
-            # effect as if a separate pathName insert widget command had been
-            # issued for each pair, in order. The last tagList argument may be
-            # omitted." i'm not sure what "in order" means here, but i tried
-            # it, and 'textwidget.insert('1.0', 'asd', [], 'toot', [])' inserts
-            # 'asdtoot', not 'tootasd'
-            new_text = "".join(other_args[::2])
-
-            changes.append(self._create_change(widget, text_index, text_index, new_text))
-
-        # an even smaller wall of text that mostly refers to insert and replace
-        elif subcommand == "replace":
-            start, end, *other_args = args_tuple
-            new_text = "".join(other_args[::2])
-
-            # more invisible newline garbage
-            if start == widget.index("end"):
-                start = widget.index("end - 1 char")
-            if end == widget.index("end"):
-                end = widget.index("end - 1 char")
-
-            # didn't find in docs, but tcl throws an error for this
-            assert widget.compare(start, "<=", end)
-
-            changes.append(self._create_change(widget, start, end, new_text))
-
-        else:  # pragma: no cover
-            raise ValueError(f"unexpected subcommand: {subcommand}")
-
-        # remove changes that don't actually do anything
+    def _change_event_from_tcl(self, flat_change_list: str) -> str:
+        items = self._event_receiver_widget.tk.splitlist(flat_change_list)
         changes = [
-            change
-            for change in changes
-            if change.start != change.end or change.old_text_len != 0 or change.new_text
+            Change(
+                start=[int(start_line), int(start_column)],
+                end=[int(end_line), int(end_column)],
+                old_text_len=int(old_text_len),
+                new_text=new_text,
+            )
+            for start_line, start_column, end_line, end_column, old_text_len, new_text in zip(
+                *[iter(items)] * 6
+            )
         ]
 
+        if self.mirror is not None:
+            for change in changes:
+                self.mirror._apply_change(change)
+
         if self._change_batch is None:
-            return str(Changes(changes)) if changes else ""
+            if not changes:
+                return ""
+            self._add_coalesced_changes(changes)
+            return self._event_data_ring.add(Changes(changes))
         else:
             self._change_batch.extend(changes)
             return ""  # don't generate event
 
+    def _add_coalesced_changes(self, changes: List[Change]) -> None:
+        for change in changes:
+            if self._coalesced_changes:
+                merged = _merge_changes(self._coalesced_changes[-1], change)
+                if merged is not None:
+                    self._coalesced_changes[-1] = merged
+                    continue
+            self._coalesced_changes.append(change)
+
+        if not self._coalesced_event_pending:
+            self._coalesced_event_pending = True
+            self._event_receiver_widget.after_idle(self._generate_coalesced_event)
+
+    def _generate_coalesced_event(self) -> None:
+        self._coalesced_event_pending = False
+        changes = [
+            change
+            for change in self._coalesced_changes
+            if change.start != change.end or change.old_text_len != 0 or change.new_text
+        ]
+        self._coalesced_changes = []
+
+        if changes and self._event_receiver_widget.winfo_exists():
+            self._event_receiver_widget.event_generate(
+                "<<ContentChangedCoalesced>>", data=self._event_data_ring.add(Changes(changes))
+            )
+
     def begin_batch(self) -> None:
         if self._change_batch is not None:
             raise RuntimeError("nested calls to change_batch")
@@ -367,8 +734,10 @@ class _ChangeTracker:
         assert self._change_batch is not None
         try:
             if self._change_batch:
+                self._add_coalesced_changes(self._change_batch)
                 self._event_receiver_widget.event_generate(
-                    "<<ContentChanged>>", data=Changes(self._change_batch)
+                    "<<ContentChanged>>",
+                    data=self._event_data_ring.add(Changes(self._change_batch)),
                 )
         finally:
             self._change_batch = None
@@ -424,12 +793,46 @@ def track_changes(widget: tkinter.Text) -> None:
         widget has already changed. Also, sometimes many changes are applied
         at once and ``change_list`` contains more than one item.
 
+        The :class:`Changes` object is created only once and
+        ``.data_class(Changes)`` returns the same object in every callback (see
+        :class:`porcupine.utils.EventDataRing`), so please don't modify it.
+
+    .. virtualevent:: ContentChangedCoalesced
+
+        This is like :virtevt:`ContentChanged`, but it runs later, when Tk
+        has nothing else to do (see ``after_idle`` in :mod:`tkinter`), and
+        it comes only once for all changes made before that. Changes that
+        touch each other are merged, so typing ``hello`` one character at a
+        time gives one :class:`Change` that inserts ``'hello'``.
+
+        Use this when you don't need to do something immediately after each
+        change. For example, a paste, undoing a big change, or a plugin
+        that doesn't use :func:`change_batch` can cause hundreds of
+        :virtevt:`ContentChanged` events, and each of them runs all
+        :virtevt:`ContentChanged` callbacks.
+
     .. virtualevent:: CursorMoved
 
         This event is generated every time the user moves the cursor or
         it's moved with a method of the text widget. Use
         ``textwidget.index('insert')`` to find the current cursor
         position.
+
+    .. virtualevent:: CursorMovedThrottled
+
+        This is like :virtevt:`CursorMoved`, but when the cursor moves many
+        times quickly (e.g. the user holds down an arrow key or drags to
+        select text), this event is generated at most once per 20
+        milliseconds. The last cursor movement always gets an event, so
+        ``textwidget.index('insert')`` is never left outdated.
+
+        Use this for things that are too slow to do dozens of times per
+        second. See :func:`set_cursor_event_interval` and
+        :func:`get_cursor_event_stats`.
+
+    Unlike :virtevt:`ContentChanged`, the cursor events are generated on
+    the widget whose cursor moved, so each peer widget (see
+    :func:`create_peer_widget`) gets its own cursor events.
     """
     if widget in _change_trackers:
         raise RuntimeError("track_changes() called twice for same text widget")
@@ -441,6 +844,45 @@ def track_changes(widget: tkinter.Text) -> None:
     _change_trackers[widget] = tracker
 
 
+def get_mirror(widget: tkinter.Text) -> TextMirror:
+    """Return a :class:`TextMirror` that always has the same text as *widget*.
+
+    The first call creates the mirror and gets all text from the text widget.
+    After that, the mirror is updated on every change, before
+    ``<<ContentChanged>>`` callbacks run, and also inside :func:`change_batch`.
+    Later calls return the same mirror.
+
+    The mirror uses memory for a copy of the whole text, so don't call this
+    unless you actually need it. You get a :class:`RuntimeError` if
+    :func:`track_changes` hasn't been called for *widget*.
+    """
+    try:
+        tracker = _change_trackers[widget]
+    except KeyError:
+        raise RuntimeError("track_changes() wasn't called for the text widget") from None
+
+    if tracker.mirror is None:
+        tracker.mirror = TextMirror(widget.get("1.0", "end - 1 char"))
+    return tracker.mirror
+
+
+def set_cursor_event_interval(widget: tkinter.Text, milliseconds: int) -> None:
+    """Change how often :virtevt:`CursorMovedThrottled` can be generated.
+
+    The *widget* must be a widget passed to :func:`track_changes` or a peer
+    of it.
+    """
+    _cursor_event_throttlers[widget].interval_ms = milliseconds
+
+
+def get_cursor_event_stats(widget: tkinter.Text) -> CursorEventStats:
+    """Return counts of :virtevt:`CursorMovedThrottled` events for a widget.
+
+    The returned object is updated as the cursor moves.
+    """
+    return _cursor_event_throttlers[widget].stats
+
+
 @contextlib.contextmanager
 def change_batch(widget: tkinter.Text) -> Iterator[None]:
     """A context manager to optimize doing many changes to a text widget.
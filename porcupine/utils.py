@@ -4,7 +4,9 @@ from __future__ import annotations
 import collections
 import contextlib
 import dataclasses
+import enum
 import functools
+import itertools
 import json
 import logging
 import os
@@ -15,8 +17,10 @@ import shutil
 import subprocess
 import sys
 import threading
+import time
 import tkinter
 import traceback
+import weakref
 from tkinter import ttk
 from typing import (
     TYPE_CHECKING,
@@ -24,9 +28,12 @@ from typing import (
     Callable,
     Deque,
     Dict,
+    Generator,
     Iterator,
+    List,
     Optional,
     TextIO,
+    Tuple,
     Type,
     TypeVar,
     Union,
@@ -417,6 +424,58 @@ class EventDataclass:
         return type(self).__name__ + json.dumps(dataclasses.asdict(self))
 
 
+_event_data_rings: weakref.WeakValueDictionary[int, EventDataRing] = weakref.WeakValueDictionary()
+_event_data_ring_ids = itertools.count()
+
+
+class EventDataRing:
+    """A ring buffer for passing :class:`EventDataclass` objects to many callbacks quickly.
+
+    Passing ``data=some_event_dataclass`` to ``event_generate()`` converts
+    the object to JSON, and every :func:`bind_with_data` callback then parses
+    the JSON again in :meth:`EventWithData.data_class`. That's slow for events
+    that happen often and have many callbacks, such as
+    :virtevt:`~porcupine.textwidget.ContentChanged`. If you instead do this...
+    ::
+
+        ring = utils.EventDataRing()
+        some_widget.event_generate('<<Thingy>>', data=ring.add(Bar(foos)))
+
+    ...then the data string only contains a sequence number, and
+    ``event.data_class(Bar)`` returns the object passed to :meth:`add`
+    without any JSON. All callbacks get the same object, so don't modify it.
+
+    Only the *size* most recently added objects are kept. Old enough objects
+    are forgotten, and :meth:`EventWithData.data_class` raises
+    :class:`LookupError` for them.
+    """
+
+    def __init__(self, size: int = 100) -> None:
+        self._id = next(_event_data_ring_ids)
+        self._last_sequence_number = 0
+        self._items: Deque[Tuple[int, EventDataclass]] = collections.deque(maxlen=size)
+        _event_data_rings[self._id] = self
+
+    def add(self, data: EventDataclass) -> str:
+        """Store *data* in the ring buffer and return a data string for ``event_generate()``."""
+        self._last_sequence_number += 1
+        self._items.append((self._last_sequence_number, data))
+        # The # character can't appear in the name of a class, so this
+        # doesn't look like 'Foo{"a": 1, "b": 2}' JSON
+        return f"{type(data).__name__}#{self._id}:{self._last_sequence_number}"
+
+    def get(self, sequence_number: int) -> Optional[EventDataclass]:
+        # Sequence numbers in the deque are consecutive
+        if not self._items:
+            return None
+        index = sequence_number - self._items[0][0]
+        if not 0 <= index < len(self._items):
+            return None
+        found_number, data = self._items[index]
+        assert found_number == sequence_number
+        return data
+
+
 if TYPE_CHECKING:
     _Event = tkinter.Event[tkinter.Misc]
 else:
@@ -437,7 +496,19 @@ class EventWithData(_Event):
         raises an error.
 
         ``T`` must be a dataclass that inherits from :class:`EventDataclass`.
+
+        If the data string came from :meth:`EventDataRing.add`, then this
+        returns the object stored in the ring buffer instead of a copy.
         """
+        if self.data_string.startswith(T.__name__ + "#"):
+            ring_id, sequence_number = map(int, self.data_string[len(T.__name__) + 1 :].split(":"))
+            ring = _event_data_rings.get(ring_id)
+            data = None if ring is None else ring.get(sequence_number)
+            if data is None:
+                raise LookupError(f"event data is no longer available: {self.data_string}")
+            assert isinstance(data, T)
+            return data
+
         assert self.data_string.startswith(T.__name__ + "{")
         result = dacite.from_dict(T, json.loads(self.data_string[len(T.__name__) :]))
         assert isinstance(result, T)
@@ -532,6 +603,257 @@ def add_scroll_command(
     widget[option] = widget.register(callback) + "\n" + tcl_code
 
 
+@dataclasses.dataclass
+class CallbackStats:
+    """How often a callback scheduled with :func:`throttle` or
+    :func:`run_when_idle` ran, and how long it took in total.
+
+    ``skipped`` counts requests to run the callback that didn't cause a
+    separate run, because the callback was already going to run.
+    """
+
+    run_count: int = 0
+    skipped: int = 0
+    total_seconds: float = 0
+
+
+_callback_stats: collections.defaultdict[str, CallbackStats] = collections.defaultdict(
+    CallbackStats
+)
+_idle_queues: Dict[tkinter.Misc, List[Callable[[], None]]] = {}
+
+
+def _get_callback_name(callback: Callable[[], None]) -> str:
+    # For functools.partial, use the name of the partialled function
+    function = getattr(callback, "func", callback)
+    module = getattr(function, "__module__", None)
+    name = getattr(function, "__qualname__", None) or repr(function)
+    return name if module is None else f"{module}.{name}"
+
+
+def _run_scheduled_callback(widget: tkinter.Misc, callback: Callable[[], None]) -> None:
+    if not widget.winfo_exists():
+        return
+
+    stats = _callback_stats[_get_callback_name(callback)]
+    start_time = time.perf_counter()
+    try:
+        callback()
+    finally:
+        stats.run_count += 1
+        stats.total_seconds += time.perf_counter() - start_time
+
+
+def get_callback_stats() -> Dict[str, CallbackStats]:
+    """Return stats of scheduled callbacks, keyed by the names of the callback functions.
+
+    Callbacks with the same name are counted together, e.g. a method of
+    every tab's text widget.
+    """
+    return dict(_callback_stats)
+
+
+def throttle(
+    widget: tkinter.Misc, callback: Callable[[], None], interval_ms: int
+) -> Callable[[], None]:
+    """Return a function that runs ``callback()`` at most once in *interval_ms*.
+
+    The first call runs the callback right away. If more calls happen during
+    the next *interval_ms* milliseconds, the callback runs once more when the
+    time is up. This is good for things like scrolling, where the callback
+    should run often but not for every event.
+    """
+    timeout_scheduled = False
+    running_requested = False
+
+    def timeout_callback() -> None:
+        nonlocal timeout_scheduled, running_requested
+        assert timeout_scheduled
+        if running_requested:
+            _run_scheduled_callback(widget, callback)
+            widget.after(interval_ms, timeout_callback)
+            running_requested = False
+        else:
+            timeout_scheduled = False
+
+    def request_running() -> None:
+        nonlocal timeout_scheduled, running_requested
+        if timeout_scheduled:
+            if running_requested:
+                _callback_stats[_get_callback_name(callback)].skipped += 1
+            running_requested = True
+        else:
+            assert not running_requested
+            _run_scheduled_callback(widget, callback)
+            widget.after(interval_ms, timeout_callback)
+            timeout_scheduled = True
+
+    return request_running
+
+
+def _run_idle_queue(widget: tkinter.Misc) -> None:
+    # An error in one callback must not prevent the others from running
+    for callback in _idle_queues.pop(widget):
+        try:
+            _run_scheduled_callback(widget, callback)
+        except Exception:
+            log.exception(f"idle callback {_get_callback_name(callback)} failed")
+
+
+def run_when_idle(widget: tkinter.Misc, callback: Callable[[], None]) -> None:
+    """Run ``callback()`` when Tk has nothing else to do.
+
+    Callbacks are queued separately for each widget, and they run in the
+    order they were added. If the same callback is already in the queue of
+    the widget, it isn't added again, so e.g. updating something on every
+    scroll event runs the update only once for many events. The callbacks
+    don't run if *widget* gets destroyed.
+    """
+    if widget in _idle_queues:
+        queue = _idle_queues[widget]
+        if callback in queue:
+            _callback_stats[_get_callback_name(callback)].skipped += 1
+        else:
+            queue.append(callback)
+    else:
+        _idle_queues[widget] = [callback]
+        # Not widget.after_idle(), because then the queue would never be
+        # removed from _idle_queues if the widget gets destroyed
+        porcupine.get_main_window().after_idle(_run_idle_queue, widget)
+
+
+class JobPriority(enum.IntEnum):
+    """Priorities of jobs started with :func:`start_job`.
+
+    Jobs with a smaller priority run first. Use ``INPUT`` for jobs that show
+    the result of something the user just did, such as typing into an entry
+    or opening a folder, and ``BACKGROUND`` for refreshing things that the
+    user didn't ask for.
+    """
+
+    INPUT = 0
+    NORMAL = 1
+    BACKGROUND = 2
+
+
+@dataclasses.dataclass
+class Job:
+    """A job started with :func:`start_job`.
+
+    The ``step_count`` and ``total_seconds`` attributes tell how many times
+    the job has been advanced with ``next()`` and how long it took in total.
+    """
+
+    key: str
+    priority: JobPriority
+    widget: tkinter.Misc = dataclasses.field(repr=False)
+    generator: Generator[None, None, None] = dataclasses.field(repr=False)
+    step_count: int = 0
+    total_seconds: float = 0
+
+
+# Leaves about half of a 60fps frame for Tk to handle events and redraw
+_JOB_SLICE_SECONDS = 0.008
+
+_jobs: Dict[str, Job] = {}
+_job_slice_scheduled = False
+_job_slice_running = False
+
+
+def _run_job_slice() -> None:
+    global _job_slice_running
+    deadline = time.perf_counter() + _JOB_SLICE_SECONDS
+    _job_slice_running = True
+    try:
+        while _jobs and time.perf_counter() < deadline:
+            job = min(_jobs.values(), key=(lambda job: job.priority))
+            if not job.widget.winfo_exists():
+                del _jobs[job.key]
+                continue
+
+            while _jobs.get(job.key) is job and time.perf_counter() < deadline:
+                start_time = time.perf_counter()
+                try:
+                    next(job.generator)
+                except StopIteration:
+                    finished = True
+                except Exception:
+                    log.exception(f"job {job.key!r} failed")
+                    finished = True
+                else:
+                    finished = False
+                job.step_count += 1
+                job.total_seconds += time.perf_counter() - start_time
+
+                if finished:
+                    # Check needed because the job may have started a new job with the same key
+                    if _jobs.get(job.key) is job:
+                        del _jobs[job.key]
+                    break
+    finally:
+        _job_slice_running = False
+
+
+def _run_job_slice_when_idle() -> None:
+    global _job_slice_scheduled
+    _job_slice_scheduled = False
+    _run_job_slice()
+    _schedule_job_slice()
+
+
+def _schedule_job_slice() -> None:
+    global _job_slice_scheduled
+    if _jobs and not _job_slice_scheduled:
+        porcupine.get_main_window().after_idle(_run_job_slice_when_idle)
+        _job_slice_scheduled = True
+
+
+def start_job(
+    widget: tkinter.Misc,
+    key: str,
+    job: Generator[None, None, None],
+    priority: JobPriority = JobPriority.NORMAL,
+) -> None:
+    """Run a generator in small pieces, so that Porcupine doesn't freeze.
+
+    The generator should do a small amount of work between its ``yield``
+    statements. Pieces of many jobs run when Tk is idle, until about 8
+    milliseconds have passed. After that, Tk gets to handle events and
+    redraw before the next pieces run. Jobs with a higher priority
+    (see :class:`JobPriority`) run first.
+
+    If a job with the same *key* is already running, it is cancelled.
+    The job is cancelled also if *widget* is destroyed.
+
+    The first pieces run right away, so a job that doesn't take long is
+    done when this function returns.
+    """
+    cancel_job(key)
+    _jobs[key] = Job(key, priority, widget, job)
+    if not _job_slice_running:
+        _run_job_slice()
+    _schedule_job_slice()
+
+
+def cancel_job(key: str) -> bool:
+    """Stop running a job started with :func:`start_job`.
+
+    Returns True if the job was running, and False if there was no job with
+    the given key (e.g. it's already done).
+    """
+    job = _jobs.pop(key, None)
+    if job is None:
+        return False
+    if not job.generator.gi_running:  # can't close a job that is cancelling itself
+        job.generator.close()
+    return True
+
+
+def get_jobs() -> List[Job]:
+    """Return the jobs that haven't finished yet, in the order they will run."""
+    return sorted(_jobs.values(), key=(lambda job: job.priority))
+
+
 class TemporaryBind:
     """Bind and unbind a callback.
 
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Measure how much passing a <<ContentChanged>> event to its callbacks costs.
+
+This compares the old way (JSON in the event data string) to
+utils.EventDataRing. No Tk window is needed, because this only does what
+bind_with_data() callbacks would do with the data string.
+"""
+
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).absolute().parent.parent))
+
+from porcupine import utils  # noqa: E402
+from porcupine.textwidget import Change, Changes  # noqa: E402
+
+
+def make_event(data_string: str) -> utils.EventWithData:
+    event = utils.EventWithData()
+    event.data_string = data_string
+    return event
+
+
+def keystroke_with_json(changes: Changes, callback_count: int) -> None:
+    event = make_event(str(changes))
+    for i in range(callback_count):
+        event.data_class(Changes)
+
+
+def keystroke_with_ring(ring: utils.EventDataRing, changes: Changes, callback_count: int) -> None:
+    event = make_event(ring.add(changes))
+    for i in range(callback_count):
+        event.data_class(Changes)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--callbacks", type=int, default=10, help="number of callbacks per event")
+    parser.add_argument("--repeat", type=int, default=10000, help="number of keystrokes")
+    args = parser.parse_args()
+
+    keystroke = Changes([Change(start=[123, 4], end=[123, 4], old_text_len=0, new_text="x")])
+    paste = Changes(
+        [Change(start=[1, 0], end=[1, 0], old_text_len=0, new_text="print('hello')\n" * 1000)]
+    )
+    ring = utils.EventDataRing()
+
+    for description, changes in [("typing one character", keystroke), ("big paste", paste)]:
+        json_time = timeit.timeit(
+            lambda: keystroke_with_json(changes, args.callbacks), number=args.repeat
+        )
+        ring_time = timeit.timeit(
+            lambda: keystroke_with_ring(ring, changes, args.callbacks), number=args.repeat
+        )
+        print(f"{description}, {args.callbacks} callbacks:")
+        print(f"  JSON:           {json_time / args.repeat * 1e6:8.1f} microseconds per event")
+        print(f"  EventDataRing:  {ring_time / args.repeat * 1e6:8.1f} microseconds per event")
+
+
+main()
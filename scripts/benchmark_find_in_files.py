@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""Measure how long it takes to find text in all files of a big project.
+
+This creates a synthetic project with 20k files (by default) in a temporary
+directory. Some of the files are binary, and some are in a directory that is
+treated as ignored by git. The search runs with different executors, and
+this shows how long it takes to get the first results, all results, and to
+stop after cancelling. Files are in the operating system's cache after the
+first run, so the first line is slower than it would be otherwise.
+
+Then the same searches run with a trigram index, which rules out files
+without reading them.
+"""
+
+import argparse
+import concurrent.futures
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).absolute().parent.parent))
+
+from porcupine import _trigramindex  # noqa: E402
+from porcupine.plugins import find_in_files  # noqa: E402
+
+FILES_PER_DIRECTORY = 100
+
+
+def make_project(root: Path, file_count: int) -> Dict[Path, str]:
+    source_lines = (
+        Path(__file__).absolute().parent.parent.joinpath("porcupine", "tabs.py").read_text()
+    ).splitlines(keepends=True)
+    rng = random.Random(1)
+
+    for index in range(file_count):
+        directory = root / f"dir{index // FILES_PER_DIRECTORY}"
+        if index % FILES_PER_DIRECTORY == 0:
+            directory.mkdir()
+        if index % 50 == 0:
+            (directory / f"file{index}.bin").write_bytes(
+                bytes(rng.randrange(256) for i in range(4000))
+            )
+        else:
+            start = rng.randrange(len(source_lines) - 100)
+            text = "".join(source_lines[start : start + 100])
+            if index % 100 == 1:
+                text += "needle\n"
+            (directory / f"file{index}.py").write_text(text)
+
+    # Pretend that git ignores a tenth of the directories
+    return {
+        root / f"dir{index}": "git_ignored"
+        for index in range(0, file_count // FILES_PER_DIRECTORY, 10)
+    }
+
+
+def run_search(
+    root: Path,
+    regex: "re.Pattern[str]",
+    git_statuses: Dict[Path, str],
+    executor: concurrent.futures.Executor,
+    cancel_after: float = float("inf"),
+    index: Optional[_trigramindex.TrigramIndex] = None,
+) -> None:
+    start = time.perf_counter()
+    first_result_time = None
+    match_count = 0
+    search = find_in_files.ProjectSearch(
+        root, regex, git_statuses=git_statuses, executor=executor, index=index
+    )
+
+    while True:
+        done = search.is_done()
+        results = search.get_results()
+        if results and first_result_time is None:
+            first_result_time = time.perf_counter() - start
+        match_count += sum(len(matches) for path, matches in results)
+        if done:
+            break
+        if time.perf_counter() - start > cancel_after:
+            cancel_time = time.perf_counter()
+            search.cancel()
+            # Wait for the batches that were already running
+            executor.shutdown(wait=True)
+            print(f"    stopping after cancel {(time.perf_counter() - cancel_time) * 1000:7.1f} ms")
+            return
+        time.sleep(0.001)
+
+    total_time = time.perf_counter() - start
+    assert first_result_time is not None
+    print(
+        f"    first result {first_result_time * 1000:7.1f} ms,"
+        f"  all {match_count} matches in {search.file_count} files {total_time * 1000:7.1f} ms"
+    )
+    if index is not None:
+        print(f"    {search.skipped_file_count} files ruled out by the index")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=20000, help="number of files in the project")
+    args = parser.parse_args()
+
+    cpu_count = os.cpu_count() or 1
+    executors: List[Callable[[], concurrent.futures.Executor]] = [
+        lambda: concurrent.futures.ThreadPoolExecutor(1),
+        lambda: concurrent.futures.ThreadPoolExecutor(),
+        lambda: concurrent.futures.ProcessPoolExecutor(),
+    ]
+    descriptions = [
+        "1 thread",
+        "thread pool (default size, as in Porcupine)",
+        f"process pool ({cpu_count} processes)",
+    ]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(temp_dir) / "project"
+        root.mkdir()
+        print(f"Creating {args.files} files...")
+        git_statuses = make_project(root, args.files)
+        regex_strings = ["needle", r"def \w+\(self\)"]
+
+        for regex_string in regex_strings:
+            regex = re.compile(regex_string, re.MULTILINE)
+            print(f"Searching for {regex_string!r}:")
+            for description, make_executor in zip(descriptions, executors):
+                print(f"  {description}:")
+                with make_executor() as executor:
+                    executor.submit(int).result()  # start threads or processes
+                    run_search(root, regex, git_statuses, executor)
+                    # This shuts down the executor, so it must be last
+                    run_search(root, regex, git_statuses, executor, cancel_after=0.01)
+
+        index = _trigramindex.TrigramIndex(root)
+        index.cache_path = Path(temp_dir) / "index.pickle"
+        ignored_paths = find_in_files._get_ignored_paths(root, git_statuses)
+        files = [
+            (entry.path, entry.stat()) for entry in find_in_files._iter_files(root, ignored_paths)
+        ]
+        start = time.perf_counter()
+        index.update(files)
+        index.save()
+        print(f"Building the index took {time.perf_counter() - start:.1f} seconds")
+        print(f"  size on disk {index.get_status().size_on_disk / 1024 / 1024:.1f} MB")
+
+        start = time.perf_counter()
+        index = _trigramindex.TrigramIndex(root)
+        index.cache_path = Path(temp_dir) / "index.pickle"
+        index.load()
+        print(f"  loading {(time.perf_counter() - start) * 1000:7.1f} ms")
+
+        for regex_string in regex_strings:
+            print(f"Searching for {regex_string!r} with the index and the default thread pool:")
+            with concurrent.futures.ThreadPoolExecutor() as executor:
+                run_search(
+                    root,
+                    re.compile(regex_string, re.MULTILINE),
+                    git_statuses,
+                    executor,
+                    index=index,
+                )
+
+
+main()
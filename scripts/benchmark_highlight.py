@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Measure how long it takes to apply syntax highlighting tags to a text widget.
+
+This compares the old way (tag_remove for every token type and tag_add for
+each tag separately) to one batched Tcl script per highlighting pass. The
+text is a 10k-line Python file made by repeating Porcupine's own code.
+"""
+
+import argparse
+import sys
+import timeit
+import tkinter
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List
+
+sys.path.insert(0, str(Path(__file__).absolute().parent.parent))
+
+from pygments import token  # type: ignore[import]  # noqa: E402
+from pygments.lexers import PythonLexer  # type: ignore[import]  # noqa: E402
+
+from porcupine.plugins import highlight  # noqa: E402
+
+
+def list_all_token_types(tokentype: Any) -> Iterator[Any]:
+    yield tokentype
+    for subtype in tokentype.subtypes:
+        yield from list_all_token_types(subtype)
+
+
+ALL_TOKEN_TAGS = set(map(str, list_all_token_types(token.Token)))
+
+
+def make_code(line_count: int) -> str:
+    source_lines = (
+        Path(__file__).absolute().parent.parent.joinpath("porcupine", "tabs.py").read_text()
+    ).splitlines(keepends=True)
+    lines = source_lines * (line_count // len(source_lines) + 1)
+    return "".join(lines[:line_count])
+
+
+def tokenize_old_way(code: str) -> Dict[str, List[str]]:
+    lineno = 1
+    column = 0
+    tag_locations: Dict[str, List[str]] = {}
+    for position, tokentype, text in PythonLexer().get_tokens_unprocessed(code):
+        token_start = f"{lineno}.{column}"
+        newline_count = text.count("\n")
+        if newline_count != 0:
+            lineno += newline_count
+            column = len(text.rsplit("\n", 1)[-1])
+        else:
+            column += len(text)
+        token_end = f"{lineno}.{column}"
+        tag_locations.setdefault(str(tokentype), []).extend([token_start, token_end])
+    return tag_locations
+
+
+def tokenize_new_way(code: str) -> Dict[str, List[str]]:
+    line_count = code.count("\n") + 1
+    job = highlight._HighlightJob(
+        PythonLexer(), code, 1, (line_count + 1, 0), (line_count + 1, 0), {}
+    )
+    return job.run().tag_locations
+
+
+def apply_old_way(
+    textwidget: tkinter.Text,
+    used_tags: Iterable[str],
+    start: str,
+    end: str,
+    tag_locations: Dict[str, List[str]],
+) -> None:
+    for tag in ALL_TOKEN_TAGS:
+        textwidget.tag_remove(tag, start, end)
+    for tag, places in tag_locations.items():
+        textwidget.tag_add(tag, *places)
+
+
+def apply_new_way(
+    textwidget: tkinter.Text,
+    used_tags: Iterable[str],
+    start: str,
+    end: str,
+    tag_locations: Dict[str, List[str]],
+) -> None:
+    highlight._retag(textwidget, used_tags, [(start, end)], tag_locations)
+
+
+def move_down(tag_locations: Dict[str, List[str]], line_count: int) -> Dict[str, List[str]]:
+    result = {}
+    for tag, places in tag_locations.items():
+        result[tag] = []
+        for place in places:
+            lineno, column = place.split(".")
+            result[tag].append(f"{int(lineno) + line_count}.{column}")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=10000, help="number of lines in the file")
+    parser.add_argument("--repeat", type=int, default=5, help="number of highlighting passes")
+    args = parser.parse_args()
+
+    code = make_code(args.lines)
+    root = tkinter.Tk()
+    root.withdraw()
+    textwidget = tkinter.Text(root)
+    textwidget.insert("1.0", code)
+
+    ways = [
+        ("old way", tokenize_old_way, apply_old_way),
+        ("batched", tokenize_new_way, apply_new_way),
+    ]
+    used_tags = tokenize_new_way(code).keys()
+
+    print(f"Highlighting all of a {args.lines}-line Python file:")
+    for description, tokenize, apply in ways:
+        tag_locations = tokenize(code)
+        apply_time = (
+            timeit.timeit(
+                lambda: apply(textwidget, used_tags, "1.0", "end", tag_locations),
+                number=args.repeat,
+            )
+            / args.repeat
+        )
+        print(f"  {description:8s}  applying tags {apply_time * 1000:8.1f} milliseconds")
+
+    # Typing one character highlights a line or two
+    line = code.splitlines()[100] + "\n"
+    keystroke_repeat = args.repeat * 100
+    print("Highlighting one line (typical keystroke):")
+    for description, tokenize, apply in ways:
+        tag_locations = move_down(tokenize(line), 100)
+        apply_time = (
+            timeit.timeit(
+                lambda: apply(textwidget, used_tags, "101.0", "102.0", tag_locations),
+                number=keystroke_repeat,
+            )
+            / keystroke_repeat
+        )
+        print(f"  {description:8s}  applying tags {apply_time * 1e6:8.1f} microseconds")
+
+    root.destroy()
+
+
+main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Measure how long it takes to highlight again after typing one character.
+
+This compares the two values of the syntax_highlighter filetype option on big
+Python and JSON files. The "pygments" backend lexes from a line that starts
+in the root state until the lexer state matches what it was before. The
+"incremental" backend parses again the part of the syntax tree that changed.
+Applying the tags to a text widget takes about the same time in both, and
+it's not measured, so that this runs without Tk.
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+sys.path.insert(0, str(Path(__file__).absolute().parent.parent))
+
+from pygments.lexer import Lexer  # type: ignore[import]  # noqa: E402
+from pygments.lexers import JsonLexer, Python3Lexer  # type: ignore[import]  # noqa: E402
+
+from porcupine import _syntaxtree  # noqa: E402
+from porcupine.plugins import highlight  # noqa: E402
+from porcupine.textwidget import Change, TextMirror  # noqa: E402
+
+# Number of lines visible on the screen
+VIEW_HEIGHT = 40
+
+
+def make_python_code(line_count: int) -> str:
+    source_lines = (
+        Path(__file__).absolute().parent.parent.joinpath("porcupine", "tabs.py").read_text()
+    ).splitlines(keepends=True)
+    lines = source_lines * (line_count // len(source_lines) + 1)
+    return "".join(lines[:line_count])
+
+
+def make_json(line_count: int) -> str:
+    item = {"name": "foo", "size": 123, "ratio": 0.5, "tags": ["a", "b"], "parent": None}
+    items_per_line = len(json.dumps(item, indent=2).splitlines())
+    return json.dumps([item] * (line_count // items_per_line), indent=2)
+
+
+def make_keystrokes(code: str, count: int) -> List[Change]:
+    # Type a character at the start of a line, after indentation
+    lines = code.split("\n")
+    rng = random.Random(1)
+    result = []
+    for junk in range(count):
+        lineno = rng.randint(1, len(lines))
+        column = len(lines[lineno - 1]) - len(lines[lineno - 1].lstrip())
+        result.append(
+            Change(start=[lineno, column], end=[lineno, column], old_text_len=0, new_text="x")
+        )
+    return result
+
+
+def pygments_backend(lexer: Lexer, code: str) -> Callable[[Change], None]:
+    mirror = TextMirror(code)
+    checkpoints = highlight._CheckpointIndex(mirror.get_line_count())
+    end = (mirror.get_line_count() + 1, 0)
+    result = highlight._HighlightJob(lexer, code + "\n", 1, end, end, {}).run()
+    checkpoints.set_lines(1, result.end[0], result.checkpoints)
+
+    # Does the same as Highlighter.on_change() for a keystroke
+    def on_keystroke(change: Change) -> None:
+        mirror._apply_change(change)
+        checkpoints.apply_change(change)
+        lineno = change.start[0]
+        start_line = checkpoints.find_root_state(lineno)
+        end_of_view = (lineno + VIEW_HEIGHT, 0)
+        first_possible_end = min((lineno, len(mirror.get_line(lineno))), end_of_view)
+        old_checkpoints = checkpoints.get_lines(first_possible_end[0], end_of_view[0] + 1)
+        text = mirror.get_all()[mirror.index_to_offset(start_line, 0) :] + "\n"
+        job = highlight._HighlightJob(
+            lexer, text, start_line, first_possible_end, end_of_view, old_checkpoints
+        )
+        result = job.run()
+        checkpoints.set_lines(start_line, result.end[0], result.checkpoints)
+
+    return on_keystroke
+
+
+def incremental_backend(lexer: Lexer, code: str) -> Callable[[Change], None]:
+    mirror = TextMirror(code)
+    parser_class = highlight._find_parser(lexer)
+    assert parser_class is not None
+    parser = parser_class()
+    parser.parse(code)
+
+    def on_keystroke(change: Change) -> None:
+        mirror._apply_change(change)
+        start = mirror.index_to_offset(*change.start)
+        edit = _syntaxtree.Edit(start, start, start + len(change.new_text))
+        parser.parse(_syntaxtree.LazyText(mirror.get_char_count(), mirror.get_by_offsets), edit)
+
+    return on_keystroke
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=10000, help="number of lines in each file")
+    parser.add_argument("--repeat", type=int, default=200, help="number of keystrokes")
+    args = parser.parse_args()
+
+    files = [
+        ("Python", Python3Lexer(), make_python_code(args.lines)),
+        ("JSON", JsonLexer(), make_json(args.lines)),
+    ]
+    for language, lexer, code in files:
+        print(f"Typing in a {code.count(chr(10)) + 1}-line {language} file:")
+        keystrokes = make_keystrokes(code, args.repeat)
+        for description, make_backend in [
+            ("pygments", pygments_backend),
+            ("incremental", incremental_backend),
+        ]:
+            start = time.perf_counter()
+            on_keystroke = make_backend(lexer, code)
+            setup_time = time.perf_counter() - start
+
+            times = []
+            for change in keystrokes:
+                start = time.perf_counter()
+                on_keystroke(change)
+                times.append(time.perf_counter() - start)
+            times.sort()
+            print(
+                f"  {description:11s}  first highlight {setup_time * 1000:6.0f} milliseconds,"
+                f"  keystroke median {times[len(times) // 2] * 1000:6.2f} ms,"
+                f"  worst {times[-1] * 1000:6.2f} ms"
+            )
+
+
+main()
@@ -0,0 +1,180 @@
+import re
+import shutil
+import subprocess
+import time
+
+import pytest
+
+from porcupine import _trigramindex, get_tab_manager, tabs
+from porcupine.plugins.find_in_files import FindInProjectTab, LineMatch, ProjectSearch
+
+
+def wait_for_results(search):
+    results = []
+    end_time = time.monotonic() + 5
+    while not search.is_done():
+        assert time.monotonic() < end_time
+        time.sleep(0.01)
+    results.extend(search.get_results())
+    return sorted(results)
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git not found")
+def test_skipping_ignored_and_binary_files(tmp_path):
+    subprocess.check_call(["git", "init", "--quiet"], cwd=tmp_path)
+    (tmp_path / ".gitignore").write_text("build/\n*.log\n")
+    (tmp_path / "build").mkdir()
+    (tmp_path / "build" / "a.py").write_text("hello")
+    (tmp_path / "b.log").write_text("hello")
+    (tmp_path / "c.bin").write_bytes(b"hello\0world")
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "d.py").write_text("foo\nsay hello\nhello hello\n")
+
+    search = ProjectSearch(tmp_path, re.compile("hello"))
+    assert wait_for_results(search) == [
+        (
+            tmp_path / "src" / "d.py",
+            [
+                LineMatch(2, 4, 2, 9, "say hello"),
+                LineMatch(3, 0, 3, 5, "hello hello"),
+                LineMatch(3, 6, 3, 11, "hello hello"),
+            ],
+        )
+    ]
+    assert search.file_count == 3  # .gitignore, c.bin, d.py
+
+
+def test_multiline_and_long_lines(tmp_path):
+    (tmp_path / "a.txt").write_text("foo\nbar\n" + "x" * 1000 + "foo")
+    search = ProjectSearch(tmp_path, re.compile(r"foo\nbar|foo$"), git_statuses={})
+    [(path, matches)] = wait_for_results(search)
+    assert matches[0] == LineMatch(1, 0, 2, 3, "foo")
+    assert matches[1][:4] == (3, 1000, 3, 1003)
+    assert matches[1].text.startswith("...x") and matches[1].text.endswith("xfoo")
+    assert len(matches[1].text) < 100
+
+
+def test_cancel(tmp_path):
+    for index in range(1000):
+        (tmp_path / f"file{index}.txt").write_text("hello\n" * 100)
+
+    search = ProjectSearch(tmp_path, re.compile("hello"), git_statuses={})
+    search.cancel()
+    assert search.is_done()
+    time.sleep(0.5)
+    assert len(search.get_results()) < 1000
+
+
+def required_trigrams(regex, flags=0):
+    trigrams = _trigramindex.get_required_trigrams(re.compile(regex, flags))
+    return sorted(bytes(trigram).decode() for trigram in trigrams)
+
+
+def test_required_trigrams():
+    assert required_trigrams(re.escape("foo.py")) == [".py", "foo", "o.p", "oo."]
+    assert required_trigrams(r"\b(?:Hello)\b") == ["ell", "hel", "llo"]
+    assert required_trigrams(r"def \w+\(self\)") == ["(se", "def", "ef ", "elf", "lf)", "sel"]
+    assert required_trigrams(r"ab(cde)?fgh") == ["fgh"]
+    assert required_trigrams(r"x(abc)+y") == ["abc"]
+    assert required_trigrams(r"abc|def") == []
+    # With ignore case, k matches the Kelvin sign and s matches long s
+    assert required_trigrams("Xkcd", re.IGNORECASE) == []
+    assert required_trigrams("Abcd", re.IGNORECASE) == ["abc", "bcd"]
+
+
+def test_index(tmp_path):
+    project = tmp_path / "project"
+    project.mkdir()
+    for number in range(50):
+        content = "needle\n" if number % 10 == 0 else "haystack\n"
+        (project / f"file{number}.txt").write_text(content)
+    index = _trigramindex.TrigramIndex(project)
+
+    def search():
+        search = ProjectSearch(
+            project, re.compile("needle"), git_statuses={}, index=index, index_min_files=10
+        )
+        results = wait_for_results(search)
+        # Index is updated after searching is done
+        end_time = time.monotonic() + 5
+        while index.get_status().progress is not None or not index.get_status().exists:
+            assert time.monotonic() < end_time
+            time.sleep(0.01)
+        return (len(results), search.file_count, search.skipped_file_count)
+
+    assert search() == (5, 50, 0)
+    assert search() == (5, 5, 45)
+
+    time.sleep(0.01)  # make sure that modification time changes
+    (project / "file3.txt").write_text("needle needle")
+    (project / "file4.txt").unlink()
+    assert search() == (6, 6, 43)
+    end_time = time.monotonic() + 5
+    while index.get_status().file_count != 49:
+        assert time.monotonic() < end_time
+        time.sleep(0.01)
+
+    # Loading from disk
+    index = _trigramindex.TrigramIndex(project)
+    assert search() == (6, 6, 43)
+
+
+def test_small_project_not_indexed(tmp_path):
+    (tmp_path / "a.txt").write_text("hello")
+    index = _trigramindex.TrigramIndex(tmp_path)
+    search = ProjectSearch(
+        tmp_path, re.compile("hello"), git_statuses={}, index=index, index_min_files=10
+    )
+    assert len(wait_for_results(search)) == 1
+    time.sleep(0.1)
+    assert not index.get_status().exists
+    assert index.get_status().file_count == 0
+
+
+def test_results_tab(tabmanager, tmp_path):
+    (tmp_path / "foo.py").write_text("x = 1\nprint(x)\n")
+    (tmp_path / "bar.py").write_text("y = 2\n")
+
+    find_tab = FindInProjectTab(tabmanager, tmp_path)
+    tabmanager.add_tab(find_tab)
+    find_tab.find_entry.insert(0, "x")
+    find_tab.full_words_var.set(True)
+    find_tab.start_search()
+
+    end_time = time.monotonic() + 5
+    while find_tab._search is not None:
+        assert time.monotonic() < end_time
+        find_tab.update()
+    assert re.fullmatch(r"Done: found 2 matches in 1 file in \d+ms\.", find_tab.statuslabel["text"])
+
+    [file_id] = find_tab.treeview.get_children()
+    assert find_tab.treeview.item(file_id, "text") == "foo.py (2)"
+    match_ids = find_tab.treeview.get_children(file_id)
+    assert [find_tab.treeview.item(id, "text") for id in match_ids] == ["1: x = 1", "2: print(x)"]
+
+    find_tab.treeview.selection_set(match_ids[1])
+    find_tab._open_selected()
+    filetab = get_tab_manager().select()
+    assert isinstance(filetab, tabs.FileTab)
+    assert filetab.path == tmp_path / "foo.py"
+    assert filetab.textwidget.index("insert") == "2.6"
+    assert filetab.textwidget.get("sel.first", "sel.last") == "x"
+
+    # Opening again uses the same tab
+    find_tab.treeview.selection_set(match_ids[0])
+    find_tab._open_selected()
+    assert get_tab_manager().select() is filetab
+    assert filetab.textwidget.index("insert") == "1.0"
+
+    tabmanager.close_tab(filetab)
+    tabmanager.close_tab(find_tab)
+
+
+def test_invalid_regex(tabmanager, tmp_path):
+    find_tab = FindInProjectTab(tabmanager, tmp_path)
+    tabmanager.add_tab(find_tab)
+    find_tab.find_entry.insert(0, "(")
+    find_tab.regex_var.set(True)
+    find_tab.start_search()
+    assert find_tab.statuslabel["text"].startswith("Invalid regex: ")
+    tabmanager.close_tab(find_tab)
@@ -1,12 +1,11 @@
-# TODO: test overlapping matches
-
 import itertools
 import random
+import re
 import sys
 
 import pytest
 
-from porcupine import get_main_window
+from porcupine import get_main_window, utils
 from porcupine.plugins import find
 
 
@@ -318,7 +317,7 @@ def test_replace_all(filetab_and_finder):
     assert str(finder.previous_button["state"]) == "disabled"
     assert str(finder.next_button["state"]) == "disabled"
     assert str(finder.replace_all_button["state"]) == "disabled"
-    assert finder.statuslabel["text"] == "Replaced 2 matches."
+    assert re.fullmatch(r"Replaced 2 matches in \d+ms\.", finder.statuslabel["text"])
     assert finder.get_match_ranges() == []
     assert filetab.textwidget.get("1.0", "end - 1 char") == "asda asda asda"
 
@@ -328,7 +327,7 @@ def test_replace_all(filetab_and_finder):
     assert str(finder.replace_all_button["state"]) == "normal"
     finder.replace_all_button.invoke()
     assert filetab.textwidget.get("1.0", "end - 1 char") == "asda"
-    assert finder.statuslabel["text"] == "Replaced 1 match."
+    assert re.fullmatch(r"Replaced 1 match in \d+ms\.", finder.statuslabel["text"])
 
 
 def test_selecting_messing_up_button_disableds(filetab_and_finder):
@@ -431,3 +430,160 @@ def test_replace_this_greyed_out(filetab_and_finder):
 
     finder.replace_entry.insert("end", "baz")
     assert str(finder.replace_this_button["state"]) == "disabled"
+
+
+def test_highlighting_many_matches(filetab_and_finder):
+    filetab, finder = filetab_and_finder
+    filetab.textwidget.insert("1.0", "foo bar\n" * 20000)
+    finder.find_entry.insert(0, "bar")
+    assert len(finder.get_match_ranges()) < find.MAX_MATCHES  # not frozen until done
+
+    filetab.update()
+    assert len(finder.get_match_ranges()) == find.MAX_MATCHES
+    assert finder.statuslabel["text"] == f"Found {find.MAX_MATCHES}+ matches."
+
+
+def test_editing_while_finding(filetab_and_finder):
+    filetab, finder = filetab_and_finder
+    filetab.textwidget.insert("1.0", "foo bar\nbar baz\n")
+    finder.find_entry.insert(0, "bar")
+    assert finder.get_match_ranges() == [("1.4", "1.7"), ("2.0", "2.3")]
+
+    filetab.textwidget.insert("1.0", "bar\n")
+    assert finder.get_match_ranges() == [("1.0", "1.3"), ("2.4", "2.7"), ("3.0", "3.3")]
+    assert finder.statuslabel["text"] == "Found 3 matches."
+
+    filetab.textwidget.insert("2.5", "x")  # bxar
+    assert finder.get_match_ranges() == [("1.0", "1.3"), ("3.0", "3.3")]
+    filetab.textwidget.delete("3.1")  # br baz
+    assert finder.get_match_ranges() == [("1.0", "1.3")]
+    assert finder.statuslabel["text"] == "Found 1 match."
+
+    # Text around the match doesn't get highlighted
+    filetab.textwidget.insert("1.3", "bar")
+    filetab.textwidget.insert("1.0", "foo")
+    assert finder.get_match_ranges() == [("1.3", "1.6"), ("1.6", "1.9")]
+    assert finder.statuslabel["text"] == "Found 2 matches."
+
+
+def test_matches_next_to_each_other(filetab_and_finder):
+    filetab, finder = filetab_and_finder
+    filetab.textwidget.insert("1.0", "asasasasa")
+    filetab.textwidget.mark_set("insert", "1.0")
+    finder.find_entry.insert(0, "as")
+    assert finder.get_match_ranges() == [
+        ("1.0", "1.2"),
+        ("1.2", "1.4"),
+        ("1.4", "1.6"),
+        ("1.6", "1.8"),
+    ]
+
+    finder.next_button.invoke()
+    assert filetab.textwidget.get("sel.first", "sel.last") == "as"
+    assert str(finder.replace_this_button["state"]) == "normal"
+
+    # Matches don't overlap
+    finder.find_entry.delete(0, "end")
+    finder.find_entry.insert(0, "asa")
+    assert finder.get_match_ranges() == [("1.0", "1.3"), ("1.4", "1.7")]
+
+    finder.replace_entry.insert(0, "x")
+    finder.replace_all_button.invoke()
+    assert filetab.textwidget.get("1.0", "end - 1 char") == "xsxsa"
+
+
+def test_regex(filetab_and_finder):
+    filetab, finder = filetab_and_finder
+    filetab.textwidget.insert("1.0", "foo = 1\nbar = 23\n")
+    finder.regex_var.set(True)
+
+    finder.find_entry.insert(0, "(")
+    assert finder.statuslabel["text"].startswith("Invalid regex: ")
+    assert str(finder.next_button["state"]) == "disabled"
+
+    finder.find_entry.delete(0, "end")
+    finder.find_entry.insert(0, r"^(\w+) = (\d+)$")
+    assert finder.get_match_ranges() == [("1.0", "1.7"), ("2.0", "2.8")]
+
+    finder.replace_entry.insert(0, r"\2 = \g<1>")
+    finder.replace_all_button.invoke()
+    assert filetab.textwidget.get("1.0", "end - 1 char") == "1 = foo\n23 = bar\n"
+    assert re.fullmatch(r"Replaced 2 matches in \d+ms\.", finder.statuslabel["text"])
+
+    finder.replace_entry.delete(0, "end")
+    finder.replace_entry.insert(0, r"\3")
+    finder.find_entry.delete(0, "end")
+    finder.find_entry.insert(0, r"(\d+)")
+    finder.replace_all_button.invoke()
+    assert finder.statuslabel["text"].startswith("Can't replace: ")
+    assert filetab.textwidget.get("1.0", "end - 1 char") == "1 = foo\n23 = bar\n"
+
+
+def test_multiline_matches(filetab_and_finder):
+    filetab, finder = filetab_and_finder
+    finder.hide()
+    filetab.textwidget.insert("1.0", "foo\nbar\nfoo\nbar\nfoo\n")
+    filetab.textwidget.tag_add("sel", "1.0", "2.3")
+
+    finder.show()
+    assert finder.regex_var.get()
+    assert finder.find_entry.get() == r"foo\nbar"
+    assert finder.get_match_ranges() == [("1.0", "2.3"), ("3.0", "4.3")]
+
+    filetab.textwidget.insert("5.3", "\nbar")
+    assert finder.get_match_ranges() == [("1.0", "2.3"), ("3.0", "4.3"), ("5.0", "6.3")]
+
+    filetab.textwidget.mark_set("insert", "1.0")
+    finder.next_button.invoke()
+    finder.replace_entry.insert(0, "x")
+    finder.replace_this_button.invoke()
+    assert filetab.textwidget.get("1.0", "end - 1 char") == "foo\nbar\nx\nfoo\nbar\n"
+    assert finder.get_match_ranges() == [("1.0", "2.3"), ("4.0", "5.3")]
+
+
+def test_replace_all_many_matches(filetab_and_finder):
+    filetab, finder = filetab_and_finder
+    original = "foo foo\n" * 3 + "\n\nbar\n" + "foo\n" * 20000
+    filetab.textwidget.insert("1.0", original)
+    finder.find_entry.insert(0, "foo")
+    finder.replace_entry.insert(0, "x")
+    filetab.update()
+
+    finder.replace_all_button.invoke()
+    assert filetab.textwidget.get("1.0", "end - 1 char") == original.replace("foo", "x")
+    assert re.fullmatch(r"Replaced 20006 matches in \d+ms\.", finder.statuslabel["text"])
+
+    filetab.textwidget.edit_undo()
+    assert filetab.textwidget.get("1.0", "end - 1 char") == original
+
+
+def test_replace_all_while_finding(filetab_and_finder):
+    filetab, finder = filetab_and_finder
+    original = "foofoo\n" * 4900
+    filetab.textwidget.insert("1.0", original)
+    finder.find_entry.insert(0, "foo")
+    finder.replace_entry.insert(0, "x")
+    assert f"find_highlight:{finder}" in [job.key for job in utils.get_jobs()]
+
+    finder.replace_all_button.invoke()
+    assert filetab.textwidget.get("1.0", "end - 1 char") == original.replace("foo", "x")
+    assert re.fullmatch(r"Replaced 9800 matches in \d+ms\.", finder.statuslabel["text"])
+
+    # Highlights are still updated when the text changes
+    filetab.textwidget.insert("1.0", "foo")
+    assert finder.get_match_ranges() == [("1.0", "1.3")]
+
+
+def test_replace_all_after_editing_past_max_matches(filetab_and_finder, monkeypatch):
+    filetab, finder = filetab_and_finder
+    monkeypatch.setattr(find, "MAX_MATCHES", 3)
+    filetab.textwidget.insert("1.0", "x\nx\nx\nx\nx\nq\n")
+    finder.find_entry.insert(0, "x")
+    filetab.update()
+    assert finder.statuslabel["text"] == "Found 3+ matches."
+
+    filetab.textwidget.insert("6.0", "x")
+    finder.replace_entry.insert(0, "y")
+    finder.replace_all_button.invoke()
+    assert filetab.textwidget.get("1.0", "end - 1 char") == "y\ny\ny\ny\ny\nyq\n"
+    assert re.fullmatch(r"Replaced 6 matches in \d+ms\.", finder.statuslabel["text"])
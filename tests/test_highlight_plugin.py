@@ -1,5 +1,11 @@
+import time
+
+import pytest
 from pygments.lexers import PythonLexer
 
+from porcupine import _syntaxtree, settings, tabs, textwidget
+from porcupine.plugins import highlight
+
 
 def test_deleting_bug(filetab):
     def tag_ranges(tag):
@@ -50,3 +56,251 @@ def test_last_line_bug(filetab, tmp_path):
     filetab.textwidget.insert("1.0", "# This is a comment")
     filetab.update()
     assert filetab.textwidget.tag_names("1.5") == ("Token.Comment.Single",)
+
+
+def test_highlighting_in_thread(filetab, tmp_path):
+    settings.set_("highlight_in_thread", True)
+    try:
+        filetab.path = tmp_path / "foo.py"
+        filetab.save()
+        filetab.textwidget.insert("1.0", "return None")
+        filetab.textwidget.insert("1.0", '"')  # Text changes while tokenizing in thread
+
+        end_time = time.monotonic() + 5
+        while not filetab.textwidget.tag_ranges("Token.Literal.String.Double"):
+            assert time.monotonic() < end_time
+            filetab.update()
+        assert list(map(str, filetab.textwidget.tag_ranges("Token.Keyword"))) == []
+        assert highlight.highlight_times["separate thread"].count > 0
+    finally:
+        settings.set_("highlight_in_thread", False)
+
+
+def test_checkpoints_move_with_text(filetab, tmp_path):
+    filetab.path = tmp_path / "foo.py"
+    filetab.save()
+    filetab.textwidget.insert("1.0", "x = 1\n" * 1000)
+    filetab.textwidget.see("end")
+    filetab.update()
+
+    # Lines inside the string must not be used as checkpoints
+    filetab.textwidget.insert("990.0", "y = '''\n")
+    filetab.textwidget.insert("995.0", "'''\n")
+    filetab.update()
+    assert filetab.textwidget.tag_names("993.0") == ("Token.Literal.String.Single",)
+    assert filetab.textwidget.tag_names("997.0") == ("Token.Name",)
+
+    filetab.textwidget.delete("995.0", "996.0")
+    filetab.update()
+    assert filetab.textwidget.tag_names("997.0") == ("Token.Literal.String.Single",)
+
+
+def test_editing_inside_multiline_string(filetab, tmp_path):
+    filetab.path = tmp_path / "foo.py"
+    filetab.save()
+    filetab.textwidget.insert("1.0", "x = '''\n" + "a\n" * 20 + "'''\ny = 1\n")
+    filetab.update()
+    assert filetab.textwidget.tag_names("10.0") == ("Token.Literal.String.Single",)
+    assert filetab.textwidget.tag_names("23.0") == ("Token.Name",)
+
+    filetab.textwidget.insert("10.1", "b")
+    filetab.update()
+    assert filetab.textwidget.tag_names("10.1") == ("Token.Literal.String.Single",)
+    assert filetab.textwidget.tag_names("23.0") == ("Token.Name",)
+
+    # Ending the string earlier changes how the rest is highlighted
+    filetab.textwidget.insert("10.0", "'''")
+    filetab.update()
+    assert filetab.textwidget.tag_names("11.0") == ("Token.Name",)
+    assert filetab.textwidget.tag_names("23.0") == ("Token.Literal.String.Single",)
+
+
+def test_highlighting_when_idle(filetab, tmp_path):
+    filetab.path = tmp_path / "foo.py"
+    filetab.save()
+    filetab.textwidget.insert("1.0", "x = 1\n" * 3000)
+    filetab.textwidget.see("1.0")
+    filetab.update()
+
+    # Not visible, but gets highlighted when the user doesn't type for a while
+    end_time = time.monotonic() + 5
+    while filetab.textwidget.tag_names("2900.0") != ("Token.Name",):
+        assert time.monotonic() < end_time
+        filetab.update()
+
+    # Changing something that is not visible
+    filetab.textwidget.replace("2800.0", "2800.0 lineend", "y = '''")
+    while filetab.textwidget.tag_names("2900.0") != ("Token.Literal.String.Single",):
+        assert time.monotonic() < end_time + 5
+        filetab.update()
+
+
+@pytest.mark.parametrize("syntax_highlighter", ["pygments", "incremental"])
+def test_typing_doesnt_join_all_lines(filetab, tmp_path, monkeypatch, syntax_highlighter):
+    filetab.path = tmp_path / "foo.py"
+    filetab.save()
+    filetab.settings.set("syntax_highlighter", syntax_highlighter)
+    filetab.textwidget.insert("1.0", "x = 1\n" * 3000)
+    filetab.textwidget.see("1.0")
+    filetab.update()
+
+    mirror = textwidget.get_mirror(filetab.textwidget)
+    monkeypatch.setattr(mirror, "get_all", (lambda: pytest.fail("get_all() was called")))
+    filetab.textwidget.insert("1.0", "return ")
+    filetab.update()
+    assert filetab.textwidget.tag_names("1.0") == ("Token.Keyword",)
+
+
+def _paint(token_types, tokens):
+    for start, end, tokentype in tokens:
+        token_types[start:end] = [tokentype] * (end - start)
+
+
+def test_incremental_parsing_matches_full_parse():
+    code = "def foo(x, y=[1, 2]):\n    '''doc'''\n    return {'a': x}\n" * 200
+    parser = _syntaxtree.PythonParser()
+    token_types = [None] * len(code)
+    _paint(token_types, parser.parse(code).tokens)
+
+    edits = [(500, 500, "x"), (510, 510, "'''"), (4000, 4010, ""), (30, 30, "\n"), (520, 523, "")]
+    for start, old_end, new_text in edits:
+        code = code[:start] + new_text + code[old_end:]
+        result = parser.parse(code, _syntaxtree.Edit(start, old_end, start + len(new_text)))
+        if new_text == "x":
+            assert sum(end - start for start, end in result.fresh_ranges) < 100
+
+        # Like tags in the text widget, token types outside fresh ranges stay as is
+        token_types[start:old_end] = [None] * len(new_text)
+        for fresh_start, fresh_end in result.fresh_ranges:
+            token_types[fresh_start:fresh_end] = [None] * (fresh_end - fresh_start)
+        _paint(token_types, result.tokens)
+
+        expected = [None] * len(code)
+        _paint(expected, _syntaxtree.PythonParser().parse(code).tokens)
+        assert token_types == expected
+
+
+def test_parsing_lazy_text(monkeypatch):
+    # Small windows, so that matches often continue after the end of the window
+    monkeypatch.setattr(_syntaxtree, "_WINDOW_SIZE", 1)
+    requests = []
+
+    def get_text(start, end):
+        requests.append((start, end))
+        return code[start:end]
+
+    for parser_class, code in [
+        (_syntaxtree.PythonParser, "x = '" + "a" * 1000 + "'\n" + "y = [True, 1.5]\n" * 1000),
+        (
+            _syntaxtree.JsonParser,
+            '[{"a": "' + "a" * 1000 + '"},\n' + "[true, 1.5],\n" * 1000 + "[]]",
+        ),
+    ]:
+        parser = parser_class()
+        result = parser.parse(_syntaxtree.LazyText(len(code), get_text))
+        assert result == parser_class().parse(code)
+
+        # Typing a character gets only a small part of the text
+        code = code[:1500] + "z" + code[1500:]
+        requests.clear()
+        result = parser.parse(
+            _syntaxtree.LazyText(len(code), get_text), _syntaxtree.Edit(1500, 1500, 1501)
+        )
+        looked_at = set().union(*(range(start, end) for start, end in requests))
+        assert len(looked_at) < len(code) / 3
+        assert result.tokens == [
+            (start, end, tokentype)
+            for start, end, tokentype in parser_class().parse(code).tokens
+            if any(
+                fresh_start <= start < fresh_end for fresh_start, fresh_end in result.fresh_ranges
+            )
+        ]
+
+
+def test_backslash_at_end_of_string():
+    for code in ["x = '\\", '"\\', "'''abc\\", 'x = """\\']:
+        [*junk, (start, end, tokentype)] = _syntaxtree.PythonParser().parse(code).tokens
+        assert end == len(code)
+        assert tokentype.startswith("Token.Literal.String")
+
+    # Deleting the end of the text so that a string ends with a backslash
+    parser = _syntaxtree.PythonParser()
+    old_code = "x = 'a\\b'\ny = 1\n"
+    parser.parse(old_code)
+    code = old_code[:7]
+    result = parser.parse(code, _syntaxtree.Edit(7, len(old_code), 7))
+    assert result.tokens == _syntaxtree.PythonParser().parse(code).tokens
+    assert result.tokens[-1] == (4, 7, "Token.Literal.String.Single")
+
+
+def test_incremental_highlighter(filetab, tmp_path):
+    filetab.path = tmp_path / "foo.json"
+    filetab.save()
+    filetab.settings.set("syntax_highlighter", "incremental")
+    filetab.textwidget.insert("1.0", '{"a": [1, true, "b"]}\n' * 100)
+    filetab.update()
+    assert filetab.textwidget.tag_names("50.2") == ("Token.Name.Tag",)
+    assert filetab.textwidget.tag_names("50.10") == ("Token.Keyword.Constant",)
+
+    filetab.textwidget.insert("50.0", '"')
+    filetab.update()
+    assert filetab.textwidget.tag_names("50.10") == ("Token.Literal.String.Double",)
+    assert filetab.textwidget.tag_names("51.10") == ("Token.Keyword.Constant",)
+
+    # Going back to pygments removes the tags of the other backend
+    filetab.settings.set("syntax_highlighter", "pygments")
+    filetab.update()
+    assert filetab.textwidget.tag_names("1.2") == ("Token.Name.Tag",)
+
+
+def test_deeply_nested_brackets(filetab, tmp_path):
+    for parser_class in [_syntaxtree.JsonParser, _syntaxtree.PythonParser]:
+        with pytest.raises(RecursionError):
+            parser_class().parse("[" * 1000 + "]" * 1000)
+
+    filetab.path = tmp_path / "foo.json"
+    filetab.save()
+    filetab.settings.set("syntax_highlighter", "incremental")
+    filetab.textwidget.insert("1.0", '[1, "a"]\n')
+    filetab.update()
+    assert filetab.textwidget.tag_names("1.5") == ("Token.Literal.String.Double",)
+
+    # Falls back to pygments instead of failing on every change
+    filetab.textwidget.insert("1.0", "[" * 1000 + "]" * 1000 + "\n")
+    filetab.update()
+    assert filetab.textwidget.tag_names("2.5") == ("Token.Literal.String.Double",)
+    filetab.textwidget.insert("2.0", "[")
+    filetab.update()
+    assert filetab.textwidget.tag_names("2.6") == ("Token.Literal.String.Double",)
+
+
+def test_tabs_share_fonts_and_styles(filetab, tabmanager):
+    other_tab = tabs.FileTab(tabmanager)
+    tabmanager.add_tab(other_tab)
+    old_style = settings.get("pygments_style", str)
+    try:
+        settings.set_("pygments_style", "monokai")
+        for tab in [filetab, other_tab]:
+            assert tab.textwidget.tag_cget("Token.Keyword", "foreground") == "#66d9ef"
+        assert filetab.textwidget.tag_cget(
+            "Token.Keyword", "font"
+        ) == other_tab.textwidget.tag_cget("Token.Keyword", "font")
+        assert len(highlight._fonts) == 4
+    finally:
+        settings.set_("pygments_style", old_style)
+
+
+def test_changes_in_background_tab(filetab, tabmanager, tmp_path):
+    filetab.path = tmp_path / "foo.py"
+    filetab.save()
+    filetab.textwidget.insert("1.0", "x = 1\ny = 2\n")
+    filetab.update()
+
+    tabmanager.add_tab(tabs.FileTab(tabmanager))
+    filetab.textwidget.insert("1.0", "'''")
+    filetab.update()
+    assert filetab.textwidget.tag_names("2.0") == ("Token.Name",)  # not highlighted yet
+
+    tabmanager.select(filetab)
+    filetab.update()
+    assert filetab.textwidget.tag_names("2.0") == ("Token.Literal.String.Single",)
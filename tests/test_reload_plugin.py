@@ -1,9 +1,15 @@
+import time
+
 from porcupine import tabs
 
 
-def trigger_reload(tab):
-    tab.textwidget.event_generate("<Button-1>")
-    tab.update()
+def wait_for_reload(tab):
+    old_content = tab.textwidget.get("1.0", "end - 1 char")
+    end_time = time.monotonic() + 5
+    while tab.textwidget.get("1.0", "end - 1 char") == old_content:
+        assert time.monotonic() < end_time, "file wasn't reloaded"
+        time.sleep(0.01)
+        tab.update()
 
 
 def test_reload_basic(tabmanager, tmp_path):
@@ -13,7 +19,7 @@ def test_reload_basic(tabmanager, tmp_path):
     assert tab.textwidget.get("1.0", "end - 1 char") == "hello"
 
     (tmp_path / "foo.py").write_text("lol")
-    trigger_reload(tab)
+    wait_for_reload(tab)
     assert tab.textwidget.get("1.0", "end - 1 char") == "lol"
 
     # It should be possible to undo a reload
@@ -27,15 +33,15 @@ def test_many_lines(tabmanager, tmp_path):
     tabmanager.add_tab(tab, select=True)
 
     (tmp_path / "foo.py").write_text("hello")
-    trigger_reload(tab)
+    wait_for_reload(tab)
     assert tab.textwidget.get("1.0", "end - 1 char") == "hello"
 
     (tmp_path / "foo.py").write_text("hello\nhello\nhello")
-    trigger_reload(tab)
+    wait_for_reload(tab)
     assert tab.textwidget.get("1.0", "end - 1 char") == "hello\nhello\nhello"
 
 
-def test_tab_switch_triggers_reload(tabmanager, tmp_path):
+def test_tab_in_background_gets_reloaded(tabmanager, tmp_path):
     (tmp_path / "a.py").write_text("hello")
     (tmp_path / "b.py").write_text("world")
     tab_a = tabs.FileTab.open_file(tabmanager, tmp_path / "a.py")
@@ -44,6 +50,25 @@ def test_tab_switch_triggers_reload(tabmanager, tmp_path):
     tabmanager.add_tab(tab_b, select=True)
 
     (tmp_path / "a.py").write_text("new text")
-    tabmanager.select(tab_a)
-    tabmanager.update()
+    wait_for_reload(tab_a)
     assert tab_a.textwidget.get("1.0", "end - 1 char") == "new text"
+
+
+def test_deleting_file_doesnt_stop_reloading(tabmanager, tmp_path):
+    (tmp_path / "a.py").write_text("hello")
+    (tmp_path / "b.py").write_text("world")
+    tab_a = tabs.FileTab.open_file(tabmanager, tmp_path / "a.py")
+    tab_b = tabs.FileTab.open_file(tabmanager, tmp_path / "b.py")
+    tabmanager.add_tab(tab_a, select=True)
+    tabmanager.add_tab(tab_b, select=True)
+
+    (tmp_path / "a.py").unlink()
+    end_time = time.monotonic() + 1
+    while time.monotonic() < end_time:
+        time.sleep(0.01)
+        tab_a.update()
+    assert tab_a.textwidget.get("1.0", "end - 1 char") == "hello"
+
+    (tmp_path / "b.py").write_text("new text")
+    wait_for_reload(tab_b)
+    assert tab_b.textwidget.get("1.0", "end - 1 char") == "new text"
@@ -1,6 +1,6 @@
 import os
 
-from porcupine import tabs
+from porcupine import _mmapfile, settings, tabs, textwidget
 
 
 def test_filetab_path_gets_resolved(tmp_path, tabmanager):
@@ -134,3 +134,117 @@ def test_initial_cursor_pos(tabmanager, tmp_path):
         assert tab.textwidget.index("insert") == "1.0"
     finally:
         tab.destroy()
+
+
+def test_is_modified_with_same_char_count(filetab, tmp_path):
+    filetab.textwidget.insert("1.0", "hello\nworld\n" * 1000)
+    filetab.save_as(tmp_path / "foo.txt")
+    assert not filetab.is_modified()
+
+    filetab.textwidget.replace("500.0", "500.0 lineend", "wurld")
+    assert filetab.is_modified()
+    filetab.textwidget.replace("500.0", "500.0 lineend", "world")
+    assert not filetab.is_modified()
+
+    # Swapping lines doesn't change the set of lines or the char count
+    filetab.textwidget.replace("1.0", "3.0", "world\nhello\n")
+    assert filetab.is_modified()
+    filetab.textwidget.replace("1.0", "3.0", "hello\nworld\n")
+    assert not filetab.is_modified()
+
+    with textwidget.change_batch(filetab.textwidget):
+        filetab.textwidget.insert("1.0", "\n")
+        filetab.textwidget.delete("end - 2 chars")
+    assert filetab.is_modified()
+    filetab.textwidget.edit_undo()
+    assert not filetab.is_modified()
+
+
+def test_loading_big_file(tabmanager, tmp_path, monkeypatch):
+    monkeypatch.setattr(tabs, "_STREAMING_THRESHOLD", 1000)
+    monkeypatch.setattr(tabs, "_STREAMING_CHUNK_SIZE", 100)
+    content = "".join(f"line {n}\r\n" for n in range(1000))
+    (tmp_path / "big.txt").write_bytes(content.encode("utf-8"))
+
+    tab = tabs.FileTab.open_file(tabmanager, tmp_path / "big.txt")
+    tabmanager.add_tab(tab)
+    assert not tab.is_modified()
+    assert "loading" in tab.title_choices[0]
+
+    while tab._loading_progress is not None:
+        tab.update()
+
+    assert tab.textwidget.get("1.0", "end - 1 char") == content.replace("\r\n", "\n")
+    assert tab.settings.get("line_ending", settings.LineEnding) == settings.LineEnding.CRLF
+    assert tab.textwidget.index("insert") == "1.0"
+    assert not tab.is_modified()
+    assert not tab.other_program_changed_file()
+    assert "loading" not in tab.title_choices[0]
+
+
+def test_big_file_tab(tabmanager, tmp_path, monkeypatch):
+    monkeypatch.setattr(tabs, "_BIG_FILE_THRESHOLD", 1000)
+    monkeypatch.setattr(_mmapfile, "INDEX_BLOCK_SIZE", 100)
+    (tmp_path / "big.log").write_text("".join(f"line {n}\n" for n in range(1, 1001)))
+
+    tab = tabs.open_path(tabmanager, tmp_path / "big.log")
+    assert isinstance(tab, tabs.BigFileTab)
+    tabmanager.add_tab(tab)
+    while tab._lines.line_count is None:
+        tab.update()
+    assert tab._lines.line_count == 1001  # empty line at end
+
+    assert tab.goto_line(500)
+    assert tab.textwidget.get("1.0", "1.0 lineend") == "line 500"
+    assert not tab.goto_line(1002)
+
+    tab.scroll_lines(-2)
+    assert tab.textwidget.get("1.0", "1.0 lineend") == "line 498"
+    tab.scroll_to_offset(0)
+    assert tab.find("line 7")
+    assert tab.textwidget.get("1.0", "1.0 lineend") == "line 7"
+    assert tab.textwidget.get("sel.first", "sel.last") == "line 7"
+    assert tab.find("line 7")
+    assert tab.textwidget.get("1.0", "1.0 lineend") == "line 70"
+    assert not tab.find("lol")
+
+    state = tab.get_state()
+    tabmanager.close_tab(tab)
+    tab2 = tabs.BigFileTab.from_state(tabmanager, state)
+    tabmanager.add_tab(tab2)
+    assert tab2.textwidget.get("1.0", "1.0 lineend") == "line 70"
+
+
+def test_reload_only_changes_changed_lines(filetab, tmp_path):
+    (tmp_path / "foo.txt").write_text("a\nb\nc\nd\ne\n")
+    filetab.path = tmp_path / "foo.txt"
+    filetab.reload()
+    filetab.textwidget.mark_set("my_mark", "3.1")
+    filetab.textwidget.tag_add("my_tag", "3.0", "4.0")
+
+    (tmp_path / "foo.txt").write_text("a\nB\nc\nd\nE\nf\n")
+    filetab.reload()
+    assert filetab.textwidget.get("1.0", "end - 1 char") == "a\nB\nc\nd\nE\nf\n"
+    assert filetab.textwidget.index("my_mark") == "3.1"
+    assert [str(index) for index in filetab.textwidget.tag_ranges("my_tag")] == ["3.0", "4.0"]
+    assert not filetab.is_modified()
+
+
+def test_run_when_selected(tabmanager):
+    tab1 = tabmanager.add_tab(tabs.FileTab(tabmanager))
+    tab2 = tabmanager.add_tab(tabs.FileTab(tabmanager), select=False)
+
+    calls = []
+
+    def callback():
+        calls.append("ran")
+
+    tab1.run_when_selected(callback)
+    assert calls == ["ran"]
+
+    tab2.run_when_selected(callback)
+    tab2.run_when_selected(callback)
+    assert calls == ["ran"]
+    tabmanager.select(tab2)
+    tabmanager.update()
+    assert calls == ["ran", "ran"]  # only once, although requested twice
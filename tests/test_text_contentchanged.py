@@ -1,9 +1,21 @@
+import dataclasses
+import time
 import tkinter
 
 import pytest
 
-from porcupine import get_main_window, utils
-from porcupine.textwidget import Change, Changes, change_batch, create_peer_widget, track_changes
+from porcupine import _linetree, get_main_window, utils
+from porcupine.textwidget import (
+    Change,
+    Changes,
+    TextMirror,
+    change_batch,
+    create_peer_widget,
+    get_cursor_event_stats,
+    get_mirror,
+    set_cursor_event_interval,
+    track_changes,
+)
 
 
 @pytest.fixture(scope="function")
@@ -199,6 +211,17 @@ def test_peer_cursor_moved(text_and_events):
     peer_move_events.clear()
 
 
+def test_cursor_moved_to_column_10(text_and_events):
+    text, events = text_and_events
+    text.insert("1.0", "hello world")
+    text.mark_set("insert", "1.1")
+
+    positions = []
+    text.bind("<<CursorMoved>>", (lambda event: positions.append(text.index("insert"))), add=True)
+    text.mark_set("insert", "1.10")
+    assert positions == ["1.10"]
+
+
 def test_embedded_window(text_and_events):
     text, events = text_and_events
     text.insert("1.0", "abc")
@@ -213,3 +236,168 @@ def test_embedded_window(text_and_events):
     assert events.pop().data_class(Changes).change_list == [
         Change(start=[1, 3], end=[1, 3], old_text_len=0, new_text="xyz")
     ]
+
+
+def test_mirror(text_and_events):
+    text, events = text_and_events
+    text.insert("end", "hello\nworld")
+    mirror = get_mirror(text)
+    assert get_mirror(text) is mirror
+    assert mirror.get_all() == "hello\nworld"
+
+    # Mirror must be up to date in <<ContentChanged>> callbacks bound before creating it
+    text.delete("1.0", "1.3")
+    assert mirror.get_all() == "lo\nworld"
+    with change_batch(text):
+        text.insert("end", "\nfoo")
+        text.replace("2.0", "2.5", "bar")
+        assert mirror.get_all() == text.get("1.0", "end - 1 char") == "lo\nbar\nfoo"
+    text.update()
+    events.clear()
+
+    assert mirror.get_line_count() == 3
+    assert mirror.get_char_count() == 10
+    assert mirror.get_line(2) == "bar"
+    assert list(mirror.iter_lines(2)) == [(2, "bar"), (3, "foo")]
+    assert list(mirror.iter_lines(2, backwards=True)) == [(2, "bar"), (1, "lo")]
+    assert mirror.get((1, 1), (3, 2)) == "o\nbar\nfo"
+    assert mirror.index_to_offset(2, 1) == 4
+    assert mirror.offset_to_index(4) == (2, 1)
+    assert mirror.offset_to_index(10) == (3, 3)
+    with pytest.raises(ValueError):
+        mirror.offset_to_index(11)
+    assert mirror.get_by_offsets(1, 9) == "o\nbar\nfo"
+    assert mirror.get_by_offsets(10, 10) == ""
+    with pytest.raises(ValueError):
+        mirror.get_by_offsets(9, 11)
+
+
+def test_mirror_of_disabled_text_widget(text_and_events):
+    text, events = text_and_events
+    text.insert("end", "hello")
+    events.clear()
+
+    # Tk ignores changes when the text widget is disabled
+    text.config(state="disabled")
+    text.insert("end", " world")
+    text.delete("1.0", "1.2")
+    text.replace("1.0", "1.1", "x")
+    text.config(state="normal")
+    assert not events
+    assert get_mirror(text).get_all() == text.get("1.0", "end - 1 char") == "hello"
+
+
+def test_chunk_summaries_are_reused():
+    summarized = []
+
+    def summarize(chunk):
+        summarized.append(chunk)
+        return sum(chunk)
+
+    lines = _linetree.SummedLines([1] * (100 * _linetree.LINES_PER_CHUNK), summarize)
+    assert lines.get_summary() == 100 * _linetree.LINES_PER_CHUNK
+    summarized.clear()
+
+    # Deleting across a chunk boundary, and adding enough lines for a new chunk
+    boundary = 50 * _linetree.LINES_PER_CHUNK
+    lines.replace_lines(boundary - 1, boundary + 1, [2])
+    assert lines.get_summary() == 100 * _linetree.LINES_PER_CHUNK
+    assert len(summarized) <= 2
+    summarized.clear()
+
+    lines.replace_lines(10, 11, [3] * (2 * _linetree.LINES_PER_CHUNK))
+    assert lines.get_summary() == 106 * _linetree.LINES_PER_CHUNK - 1
+    assert len(summarized) <= 4
+    assert lines.sum_before(len(lines.chunks) - 1) == lines.get_summary() - sum(lines.chunks[-1])
+
+
+def test_mirror_get_by_offsets_across_chunks():
+    code = "".join(f"line {n}\n" for n in range(5 * _linetree.LINES_PER_CHUNK))
+    mirror = TextMirror(code)
+    for start, end in [(0, len(code)), (5000, 5000), (5000, 9000), (100, len(code) - 100)]:
+        assert mirror.get_by_offsets(start, end) == code[start:end]
+
+
+def test_mirror_without_tracking():
+    with pytest.raises(RuntimeError, match=r"^track_changes\(\) wasn't called"):
+        get_mirror(tkinter.Text(get_main_window()))
+
+
+def test_coalesced_event(text_and_events):
+    text, events = text_and_events
+    coalesced_events = []
+    utils.bind_with_data(text, "<<ContentChangedCoalesced>>", coalesced_events.append, add=True)
+
+    text.insert("end", "hello world")
+    text.update()
+    events.clear()
+    assert coalesced_events.pop().data_class(Changes).change_list == [
+        Change(start=[1, 0], end=[1, 0], old_text_len=0, new_text="hello world")
+    ]
+
+    text.insert("1.5", "X")
+    text.insert("1.6", "Y")
+    text.delete("1.6", "1.8")  # deletes "Y" and the space after it
+    text.delete("1.0", "1.2")  # doesn't touch previous changes
+    with change_batch(text):
+        text.insert("1.0", "\n")
+    text.update()
+    assert len(events) == 5
+    events.clear()
+
+    assert text.get("1.0", "end - 1 char") == "\nlloXworld"
+    assert coalesced_events.pop().data_class(Changes).change_list == [
+        Change(start=[1, 5], end=[1, 6], old_text_len=1, new_text="X"),
+        Change(start=[1, 0], end=[1, 2], old_text_len=2, new_text="\n"),
+    ]
+    assert not coalesced_events
+
+
+def test_cursor_moved_throttled(text_and_events):
+    text, events = text_and_events
+    set_cursor_event_interval(text, 50)
+    text.insert("end", "hello")
+    text.after(100)  # let the insert's throttling timer run out
+    text.update()
+    events.clear()
+
+    positions = []
+    text.bind(
+        "<<CursorMovedThrottled>>", (lambda event: positions.append(text.index("insert"))), add=True
+    )
+    old_stats = dataclasses.replace(get_cursor_event_stats(text))
+
+    for column in range(1, 5):
+        text.mark_set("insert", f"1.{column}")
+    text.mark_set("insert", "1.4")  # not a movement
+    assert positions == ["1.1"]
+
+    text.after(100)
+    text.update()
+    assert positions == ["1.1", "1.4"]
+    assert get_cursor_event_stats(text).generated == old_stats.generated + 2
+    assert get_cursor_event_stats(text).dropped == old_stats.dropped + 2
+
+
+def test_typing_benchmark():
+    text = tkinter.Text(get_main_window())
+    track_changes(text)
+    for i in range(5):
+        utils.bind_with_data(
+            text, "<<ContentChanged>>", (lambda event: event.data_class(Changes)), add=True
+        )
+
+    code = "def foo(x):\n    return x + 1\n\n" * 30
+    start = time.perf_counter()
+    for character in code:
+        text.insert("insert", character)
+        if character == "x":
+            # typo, erased with backspace and typed again
+            text.insert("insert", "y")
+            text.delete("insert - 1 char")
+    text.mark_set("insert", "1.0")
+    end = time.perf_counter()
+
+    assert text.get("1.0", "end - 1 char") == code
+    keystrokes = len(code) + 2 * code.count("x") + 1
+    print(f"{(end - start) / keystrokes * 1e6:.1f} microseconds per keystroke")
@@ -2,6 +2,7 @@ import dataclasses
 import shutil
 import subprocess
 import sys
+import time
 import typing
 from tkinter import ttk
 
@@ -47,6 +48,22 @@ def test_bind_with_data_class():
     assert foo.num == 123
 
 
+def test_event_data_ring():
+    ring = utils.EventDataRing(size=2)
+    events = []
+    utils.bind_with_data(get_main_window(), "<<RingAsd>>", events.append, add=True)
+
+    bars = [Bar(foos=[Foo(message="abc", num=n)]) for n in range(3)]
+    for bar in bars:
+        get_main_window().event_generate("<<RingAsd>>", data=ring.add(bar))
+
+    assert len(events) == 3
+    with pytest.raises(LookupError, match=r"^event data is no longer available: Bar#\d+:1$"):
+        events[0].data_class(Bar)
+    assert events[1].data_class(Bar) is bars[1]
+    assert events[2].data_class(Bar) is bars[2]
+
+
 def test_get_children_recursively():
     parent = ttk.Frame()
     try:
@@ -133,3 +150,79 @@ def test_format_command(monkeypatch):
         assert utils.format_command(path + " {file}", {"file": "tetris.py"}) == [path, "tetris.py"]
     else:
         assert utils.format_command(r"foo\ bar", {}) == ["foo bar"]
+
+
+def test_scheduling_helpers():
+    frame = ttk.Frame(get_main_window())
+    calls = []
+
+    def callback():
+        calls.append("run")
+
+    request_throttled = utils.throttle(frame, callback, 50)
+    for junk in range(5):
+        request_throttled()
+    assert calls == ["run"]  # ran right away, and once more when the time is up
+    get_main_window().after(100, frame.quit)
+    frame.mainloop()
+    assert calls == ["run", "run"]
+
+    calls.clear()
+    for junk in range(5):
+        utils.run_when_idle(frame, callback)
+    get_main_window().update()
+    assert calls == ["run"]
+
+    stats = utils.get_callback_stats()[f"{__name__}.test_scheduling_helpers.<locals>.callback"]
+    assert stats.run_count == 3
+    assert stats.skipped == 3 + 4
+
+    # Destroyed widget doesn't stay in the queues
+    calls.clear()
+    utils.run_when_idle(frame, callback)
+    frame.destroy()
+    get_main_window().update()
+    assert calls == []
+    assert frame not in utils._idle_queues
+
+
+def test_error_in_idle_callback(caplog):
+    frame = ttk.Frame(get_main_window())
+    calls = []
+
+    def bad_callback():
+        calls.append("bad")
+        raise ValueError("oh no")
+
+    utils.run_when_idle(frame, bad_callback)
+    utils.run_when_idle(frame, (lambda: calls.append("good")))
+    get_main_window().update()
+    assert calls == ["bad", "good"]
+    assert "bad_callback failed" in caplog.records[-1].message
+    frame.destroy()
+
+
+def test_jobs():
+    frame = ttk.Frame(get_main_window())
+    done = []
+
+    def job(name, step_count):
+        for step in range(step_count):
+            time.sleep(0.002)
+            yield
+        done.append(name)
+
+    utils.start_job(frame, "short", job("short", 1))
+    assert done == ["short"]  # ran right away
+
+    utils.start_job(frame, "background", job("background", 10), utils.JobPriority.BACKGROUND)
+    utils.start_job(frame, "input", job("input", 10), utils.JobPriority.INPUT)
+    utils.start_job(frame, "cancelled", job("cancelled", 10))
+    assert [job.key for job in utils.get_jobs()] == ["input", "cancelled", "background"]
+    assert utils.cancel_job("cancelled")
+    assert not utils.cancel_job("cancelled")
+
+    get_main_window().update()
+    assert done == ["short", "input", "background"]
+    assert utils.get_jobs() == []
+    frame.destroy()